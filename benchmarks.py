@@ -0,0 +1,1053 @@
+# benchmarks.py - Performance benchmarks for the database and import/export paths
+#
+# Usage: python benchmarks.py <benchmark> [--rows N]
+# Every benchmark works on a throwaway database in a temporary folder and
+# never touches the production database.
+
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+from itertools import islice
+
+BENCHMARKS = {}
+
+def benchmark(name):
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+def timed(fn, repeat=3):
+    # Median wall time in milliseconds, and the last result
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), result
+
+def fill_synthetic_entries(conn, rows, days=730):
+    # Roughly the shape of real floor data: a few thousand articles, cards
+    # reused across days, two years of dates (from 2023) and a Yes/No print flag.
+    conn.execute('''
+        WITH RECURSIVE seq(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM seq WHERE i < ?)
+        INSERT INTO entries (article, card, color, size, qty, component, print_opt, date)
+        SELECT 'ART' || (abs(random()) % 5000),
+               'C' || (i % 20000),
+               CASE i % 5 WHEN 0 THEN 'Black' WHEN 1 THEN 'White' WHEN 2 THEN 'Red'
+                          WHEN 3 THEN 'Blue' ELSE 'Green' END,
+               CASE i % 4 WHEN 0 THEN 'S' WHEN 1 THEN 'M' WHEN 2 THEN 'L' ELSE 'XL' END,
+               1 + abs(random()) % 50,
+               CASE i % 3 WHEN 0 THEN 'Front' WHEN 1 THEN 'Back' ELSE 'Sleeve' END,
+               CASE WHEN i % 3 = 0 THEN 'No' ELSE 'Yes' END,
+               date(?, '+' || (i % ?) || ' days')
+        FROM seq
+    ''', (rows, "2023-01-01" if days == 730 else f"{2025 - days // 365}-01-01", days))
+    conn.commit()
+
+def print_table(headers, rows):
+    widths = [max(len(str(v)) for v in column) for column in zip(headers, *rows)]
+    for line in [headers] + rows:
+        print("  ".join(str(v).ljust(w) for v, w in zip(line, widths)))
+
+# --- Benchmarks ---
+
+SEARCH_SHAPES = [
+    ("one week", {"start_date": "2024-03-01", "end_date": "2024-03-07"}),
+    ("one week, print=Yes", {"print_opt": "Yes", "start_date": "2024-03-01", "end_date": "2024-03-07"}),
+    ("one day, print=No", {"print_opt": "No", "start_date": "2024-06-15", "end_date": "2024-06-15"}),
+    ("one year", {"start_date": "2023-01-01", "end_date": "2023-12-31"}),
+    ("print=No", {"print_opt": "No"}),
+]
+
+@benchmark("search")
+def bench_search(rows):
+    import db
+
+    with tempfile.TemporaryDirectory() as folder:
+        conn = sqlite3.connect(os.path.join(folder, "bench.db"))
+        db._create_entries(conn)
+        conn.execute("PRAGMA user_version = 1")
+        fill_synthetic_entries(conn, rows)
+
+        def run_shapes():
+            results = []
+            for _, filters in SEARCH_SHAPES:
+                # What a dashboard search costs: COUNT(*) for the scrollbar plus the first window
+                elapsed, _ = timed(lambda: (db.count_entries(conn, filters),
+                                            db.fetch_entries_at(conn, filters, 0, 250)))
+                results.append(elapsed)
+            return results
+
+        before = run_shapes()
+        migrate_ms, _ = timed(lambda: db.migrate(conn), repeat=1)
+        db.refresh_statistics(conn)
+        after = run_shapes()
+        conn.close()
+
+    print(f"Search latency on {rows:,} entries (count + first page, median ms)")
+    print_table(["filter", "before", "after"],
+                [[name, f"{b:.1f}", f"{a:.1f}"] for (name, _), b, a in zip(SEARCH_SHAPES, before, after)])
+    print(f"Migration to schema v{len(db.MIGRATIONS)}: {migrate_ms:.0f} ms")
+
+SUBSTRING_SHAPES = [
+    ("article 'RT123'", {"article": "RT123"}),
+    ("card 'C1999'", {"card": "C1999"}),
+    ("article + card", {"article": "ART42", "card": "C42"}),
+    ("article, print=Yes", {"article": "T4999", "print_opt": "Yes"}),
+    ("article 'zzz' (no match)", {"article": "zzz"}),
+]
+
+@benchmark("substring")
+def bench_substring(rows):
+    import db
+
+    with tempfile.TemporaryDirectory() as folder:
+        conn = sqlite3.connect(os.path.join(folder, "bench.db"))
+        db.migrate(conn, target=db.MIGRATIONS.index(db._add_search_index))
+        fill_synthetic_entries(conn, rows)
+
+        def run_shapes():
+            return [timed(lambda: (db.count_entries(conn, filters),
+                                   db.fetch_entries_at(conn, filters, 0, 250)))[0]
+                    for _, filters in SUBSTRING_SHAPES]
+
+        db.refresh_statistics(conn)
+        before = run_shapes()
+        migrate_ms, _ = timed(lambda: db.migrate(conn), repeat=1)
+        db.refresh_statistics(conn)
+        indexed = db.has_search_index(conn)
+        after = run_shapes()
+        conn.close()
+
+    print(f"Substring search on {rows:,} entries (count + first page, median ms)")
+    print_table(["filter", "LIKE", "trigram" if indexed else "LIKE (no FTS5)"],
+                [[name, f"{b:.1f}", f"{a:.1f}"] for (name, _), b, a in zip(SUBSTRING_SHAPES, before, after)])
+    print(f"Building the search index: {migrate_ms:.0f} ms")
+
+def synthetic_entry_rows(rows):
+    colors = ["Black", "White", "Red", "Blue", "Green"]
+    for i in range(rows):
+        yield (f"ART{i % 5000}", f"C{i % 20000}", colors[i % 5], "M", str(1 + i % 50),
+               "Front", "Yes" if i % 3 else "No", f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}")
+
+@benchmark("bulk")
+def bench_bulk(rows):
+    import db
+
+    def fresh_database(folder, name, existing):
+        conn = sqlite3.connect(os.path.join(folder, name))
+        db.migrate(conn)
+        fill_synthetic_entries(conn, existing)
+        return conn
+
+    def row_by_row(conn):
+        # What perform_import used to do: one execute per row, commit at the end
+        c = conn.cursor()
+        for data in synthetic_entry_rows(rows):
+            c.execute(db.INSERT_ENTRY, data)
+        conn.commit()
+
+    existing = rows
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for name, load in [
+            ("execute per row", row_by_row),
+            ("bulk_insert", lambda conn: db.bulk_insert(conn, synthetic_entry_rows(rows), fast=False)),
+            ("bulk_insert + WAL/NORMAL", lambda conn: db.bulk_insert(conn, synthetic_entry_rows(rows))),
+            ("bulk_insert + deferred indexes", lambda conn: db.bulk_insert(conn, synthetic_entry_rows(rows), defer_indexes=True)),
+        ]:
+            conn = fresh_database(folder, f"{len(results)}.db", existing)
+            elapsed, _ = timed(lambda: load(conn), repeat=1)
+            conn.close()
+            results.append([name, f"{elapsed / 1000:.2f}", f"{rows / (elapsed / 1000):,.0f}"])
+
+    print(f"Loading {rows:,} rows into a table that already holds {existing:,}")
+    print_table(["method", "seconds", "rows/s"], results)
+
+@benchmark("dedup")
+def bench_dedup(rows):
+    # Re-importing 100k rows of which half were imported before: a plain
+    # load doubles them and finding them afterwards takes a self-join over
+    # the natural key; duplicates="skip" looks each one up by key hash
+    import shutil
+    import db
+
+    batch = min(100_000, rows)
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "bench.db")
+        conn = sqlite3.connect(path)
+        db.migrate(conn)
+        fill_synthetic_entries(conn, rows - batch // 2)
+        db.bulk_insert(conn, synthetic_entry_rows(batch // 2))
+        hash_ms, hashed = timed(lambda: db.refresh_key_hashes(conn), repeat=1)
+        conn.commit()
+        conn.close()
+        shutil.copy(path, path + ".copy")
+        overlap = list(synthetic_entry_rows(batch))
+
+        conn = sqlite3.connect(path)
+        plain_ms, _ = timed(lambda: db.bulk_insert(conn, overlap), repeat=1)
+        keys = ", ".join(db.KEY_FIELDS)
+        cleanup_ms, found = timed(lambda: conn.execute(
+            f"SELECT COUNT(*) FROM (SELECT 1 FROM entries GROUP BY {keys} HAVING COUNT(*) > 1)").fetchone()[0], repeat=1)
+        conn.close()
+
+        conn = sqlite3.connect(path + ".copy")
+        skip_ms, stats = timed(lambda: db.bulk_insert(conn, overlap, duplicates="skip"), repeat=1)
+        conn.close()
+
+    print(f"Re-importing {batch:,} rows ({batch // 2:,} already imported) into {rows:,} entries")
+    print_table(["step", "ms"], [
+        [f"hash {hashed:,} entries once (first checked import)", f"{hash_ms:.0f}"],
+        ["plain bulk_insert (duplicates stored)", f"{plain_ms:.0f}"],
+        [f"find duplicated keys afterwards ({found:,})", f"{cleanup_ms:.0f}"],
+        [f"bulk_insert duplicates='skip' ({stats.duplicates:,} skipped)", f"{skip_ms:.0f}"],
+    ])
+
+def legacy_normalize_date(date_raw, today, errors):
+    # The per-row chain perform_import used before dates.DateNormalizer
+    from datetime import date, datetime
+    entry_date = today
+    if isinstance(date_raw, datetime):
+        entry_date = date_raw.strftime('%Y-%m-%d')
+    elif isinstance(date_raw, date):
+        entry_date = date_raw.strftime('%Y-%m-%d')
+    elif isinstance(date_raw, (int, float)):
+        try:
+            from openpyxl.utils.datetime import from_excel
+            entry_date = from_excel(date_raw).strftime('%Y-%m-%d')
+        except ValueError:
+            errors.append("numeric")
+    elif isinstance(date_raw, str) and date_raw:
+        try:
+            if 'T' in date_raw and ('+' in date_raw or 'Z' in date_raw):
+                entry_date = datetime.fromisoformat(date_raw.replace("Z", "+00:00")).strftime('%Y-%m-%d')
+            else:
+                try:
+                    entry_date = datetime.strptime(date_raw, '%Y-%m-%d').strftime('%Y-%m-%d')
+                except ValueError:
+                    try:
+                        entry_date = datetime.strptime(date_raw, '%m/%d/%Y').strftime('%Y-%m-%d')
+                    except ValueError:
+                        try:
+                            entry_date = datetime.strptime(date_raw, '%d/%m/%Y').strftime('%Y-%m-%d')
+                        except ValueError:
+                            try:
+                                entry_date = datetime.strptime(date_raw, '%Y/%m/%d').strftime('%Y-%m-%d')
+                            except ValueError:
+                                errors.append("string")
+        except ValueError:
+            errors.append("string")
+    return entry_date
+
+@benchmark("dates")
+def bench_dates(rows):
+    from datetime import datetime
+    import dates
+
+    # A sheet covers a few days, so each column repeats a handful of values
+    columns = {
+        "datetime cells": [datetime(2024, 3, 1 + i % 5, 8 + i % 8) for i in range(rows)],
+        "'03/15/2024' strings": [f"03/{11 + i % 5}/2024" for i in range(rows)],
+        "'2024/03/15' strings": [f"2024/03/{11 + i % 5}" for i in range(rows)],
+        "Excel serials": [45360 + i % 5 for i in range(rows)],
+    }
+    today = "2024-01-01"
+    results = []
+    for name, values in columns.items():
+        def per_value():
+            normalizer = dates.DateNormalizer(today)
+            return [normalizer.convert(v, print) for v in values]
+
+        legacy_ms, legacy = timed(lambda: [legacy_normalize_date(v, today, []) for v in values], repeat=1)
+        normalizer_ms, converted = timed(per_value, repeat=1)
+        batch_ms, (batch, _) = timed(lambda: dates.normalize_dates(values, today), repeat=1)
+        assert legacy == converted == batch
+        results.append([name, f"{legacy_ms:.0f}", f"{normalizer_ms:.0f}", f"{batch_ms:.0f}",
+                        f"{legacy_ms / batch_ms:.1f}x"])
+
+    print(f"Normalizing {rows:,} dates per column (ms)")
+    print_table(["column", "legacy chain", "DateNormalizer", "normalize_dates", "speedup"], results)
+
+@benchmark("csv")
+def bench_csv(rows):
+    import dal
+    import db
+    import export
+    import importer
+    import service
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        source = sqlite3.connect(os.path.join(folder, "source.db"))
+        db.migrate(source)
+        fill_synthetic_entries(source, rows)
+
+        for name, filename in [("Excel", "entries.xlsx"), ("CSV", "entries.csv"), ("CSV + gzip", "entries.csv.gz")]:
+            filepath = os.path.join(folder, filename)
+            write = export.export_excel if filename.endswith(".xlsx") else export.export_csv
+            export_ms, _ = timed(lambda: write(filepath, db.iter_entries(source)), repeat=1)
+
+            target_path = os.path.join(folder, f"{filename}.db")
+            target = sqlite3.connect(target_path)
+            db.migrate(target)
+            if filename.endswith(".xlsx"):
+                def load():
+                    # Exported workbooks have their header in row 1, not the
+                    # production sheets' row 2, so walk the sheet directly
+                    with importer.SheetReader(filepath) as reader:
+                        raw_rows = reader.sheet.iter_rows(values_only=True)
+                        header = next(raw_rows)
+                        mapping = {field: field for field in importer.IMPORT_FIELDS}
+                        converters = importer.compile_converters(mapping, header, "2024-01-01")
+                        return db.bulk_insert(target, (data for _, data in
+                                                       importer.convert_rows(raw_rows, 2, converters,
+                                                                             importer.CollectedErrors())))
+                import_ms, _ = timed(load, repeat=1)
+            else:
+                database = dal.Database(target_path)
+                import_ms, _ = timed(lambda: service.import_csv(database, filepath, resumable=False), repeat=1)
+                database.close()
+            target.close()
+            results.append([name, f"{export_ms / 1000:.2f}", f"{import_ms / 1000:.2f}",
+                            f"{os.path.getsize(filepath) / 1e6:.1f}"])
+        source.close()
+
+    print(f"Exporting and re-importing {rows:,} entries")
+    print_table(["format", "export s", "import s", "MB"], results)
+
+@benchmark("resume")
+def bench_resume(rows):
+    # A large CSV import interrupted at 90%: before checkpoints the whole
+    # transaction rolled back and the file had to be imported again from the
+    # start; now the committed chunks stay and the import carries on
+    import dal
+    import db
+    import export
+    import service
+
+    class Interrupted(Exception):
+        pass
+
+    stop_at = rows * 9 // 10
+    with tempfile.TemporaryDirectory() as folder:
+        source = sqlite3.connect(os.path.join(folder, "source.db"))
+        db.migrate(source)
+        fill_synthetic_entries(source, rows)
+        filepath = os.path.join(folder, "entries.csv")
+        export.export_csv(filepath, db.iter_entries(source))
+        source.close()
+
+        def fresh_database(name):
+            path = os.path.join(folder, name)
+            conn = sqlite3.connect(path)
+            db.migrate(conn)
+            conn.close()
+            return dal.Database(path)
+
+        def interrupted(database, resumable):
+            done = [0]
+            def report(inserted, total):
+                done[0] = inserted
+                if inserted >= stop_at:
+                    raise Interrupted()
+            try:
+                service.import_csv(database, filepath, progress=report, resumable=resumable)
+            except Interrupted:
+                pass
+            return done[0]
+
+        database = fresh_database("plain.db")
+        lost_ms, _ = timed(lambda: interrupted(database, False), repeat=1)
+        again_ms, _ = timed(lambda: service.import_csv(database, filepath, resumable=False), repeat=1)
+        database.close()
+
+        database = fresh_database("checkpointed.db")
+        kept_ms, _ = timed(lambda: interrupted(database, True), repeat=1)
+        with database.reading() as reader:
+            kept = reader.count_entries()
+        resume_ms, (stats, _) = timed(lambda: service.import_csv(database, filepath, resumable=True), repeat=1)
+        database.close()
+
+        # What checkpoints cost when nothing goes wrong
+        database = fresh_database("whole-plain.db")
+        plain_ms, _ = timed(lambda: service.import_csv(database, filepath, resumable=False), repeat=1)
+        database.close()
+        database = fresh_database("whole.db")
+        whole_ms, _ = timed(lambda: service.import_csv(database, filepath, resumable=True), repeat=1)
+        database.close()
+
+    print(f"Importing a {rows:,}-row CSV, interrupted after {stop_at:,} rows "
+          f"(checkpoints every {db.CHECKPOINT_ROWS:,} rows)")
+    print_table(["step", "one transaction ms", "checkpointed ms"], [
+        ["run until interrupted", f"{lost_ms:.0f}", f"{kept_ms:.0f}"],
+        ["entries kept", "0", f"{kept:,}"],
+        ["import the file again", f"{again_ms:.0f}",
+         f"{resume_ms:.0f} " + (f"(after row {stats.resumed_after:,})" if stats.resumed_after else "(no checkpoint)")],
+        ["uninterrupted import", f"{plain_ms:.0f}", f"{whole_ms:.0f} ({whole_ms / plain_ms - 1:+.0%})"],
+    ])
+
+@benchmark("images")
+def bench_images(rows):
+    # 40 phone-sized photos uploaded for 400 articles (the same shot reused
+    # across sizes and colors), then browsing them: rendering every preview
+    # from the original versus thumbnails cached on disk and in memory
+    from PIL import Image
+    import images
+
+    photos = 40
+    articles = min(400, rows)
+    with tempfile.TemporaryDirectory() as folder:
+        sources = []
+        for i in range(photos):
+            path = os.path.join(folder, f"photo{i}.jpg")
+            img = Image.radial_gradient("L").resize((4000, 3000)).convert("RGB")
+            img.paste((i * 6 % 256, 80, 160), (i * 50, i * 40, i * 50 + 800, i * 40 + 600))
+            img.save(path, quality=90)
+            sources.append(path)
+        source_bytes = sum(os.path.getsize(path) for path in sources)
+
+        def legacy_uploads():
+            # upload_image before the store: one read() and one file per article
+            os.makedirs(os.path.join(folder, "legacy"), exist_ok=True)
+            for i in range(articles):
+                with open(sources[i % photos], "rb") as src, open(os.path.join(folder, "legacy", f"ART{i}.jpg"), "wb") as dst:
+                    dst.write(src.read())
+
+        store = images.ImageStore(os.path.join(folder, "store"), os.path.join(folder, "none"))
+        legacy_ms, _ = timed(legacy_uploads, repeat=1)
+        store_ms, _ = timed(lambda: [store.add(f"ART{i}", sources[i % photos]) for i in range(articles)], repeat=1)
+        legacy_bytes = sum(entry.stat().st_size for entry in os.scandir(os.path.join(folder, "legacy")))
+        store_bytes = sum(entry.stat().st_size for entry in os.scandir(store.originals))
+
+        def render_from_original(article):
+            with Image.open(store.original_path(article)) as img:
+                img.thumbnail(images.THUMBNAIL_SIZE)
+                return img
+
+        def read_thumbnail(article):
+            with Image.open(store.thumbnail_path(article)) as img:
+                img.load()
+                return img
+
+        cache = images.ThumbnailCache()
+        def lru_thumbnail(article):
+            if article not in cache:
+                cache.put(article, read_thumbnail(article))
+            return cache.get(article)
+
+        browsed = [f"ART{i % 20}" for i in range(200)]  # scrolling back and forth over 20 articles
+        original_ms, _ = timed(lambda: [render_from_original(article) for article in browsed[:20]], repeat=1)
+        first_ms, _ = timed(lambda: [store.thumbnail_path(f"ART{i}") for i in range(photos)], repeat=1)
+        disk_ms, _ = timed(lambda: [read_thumbnail(article) for article in browsed], repeat=1)
+        lru_ms, _ = timed(lambda: [lru_thumbnail(article) for article in browsed], repeat=1)
+
+    print(f"{articles} articles sharing {photos} photos ({source_bytes / 1e6:.1f} MB of originals)")
+    print_table(["step", "ms", "MB stored"], [
+        ["legacy upload, one read() per article", f"{legacy_ms:.0f}", f"{legacy_bytes / 1e6:.1f}"],
+        ["ImageStore.add, chunked and deduplicated", f"{store_ms:.0f}", f"{store_bytes / 1e6:.1f}"],
+    ])
+    print()
+    print_table(["preview", "ms per image"], [
+        ["render from the original", f"{original_ms / 20:.1f}"],
+        ["render thumbnail once (first view)", f"{first_ms / photos:.1f}"],
+        ["cached thumbnail file", f"{disk_ms / len(browsed):.2f}"],
+        ["ThumbnailCache hit", f"{lru_ms / len(browsed):.3f}"],
+    ])
+
+@benchmark("partitions")
+def bench_partitions(rows):
+    # Six years of entries (2019-2024), as one table and with 2019-2023
+    # moved to yearly archives: day-to-day searches of the live year, and
+    # the searches that have to merge every partition
+    import shutil
+    from datetime import datetime
+    import db
+
+    searches = [
+        ("this month, count + first page", {"start_date": "2024-06-01", "end_date": "2024-06-30"}),
+        ("this month, one article", {"article": "ART12", "start_date": "2024-06-01", "end_date": "2024-06-30"}),
+        ("no dates, count + first page", {}),
+        ("no dates, one article", {"article": "ART12"}),
+        ("2020-2021, count + first page", {"start_date": "2020-01-01", "end_date": "2021-12-31"}),
+    ]
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "bench.db")
+        db.init_db(path)
+        conn = sqlite3.connect(path)
+        fill_synthetic_entries(conn, rows, days=6 * 365)
+        conn.execute("ANALYZE")
+        conn.close()
+        shutil.copy(path, os.path.join(folder, "whole.db"))
+        whole_size = os.path.getsize(path)
+
+        conn = sqlite3.connect(path)
+        archive_ms, moved = timed(lambda: db.archive_old_entries(conn, today=datetime(2025, 1, 1)), repeat=1)
+        conn.execute("VACUUM")
+        conn.close()
+        live_size = os.path.getsize(path)
+
+        results = []
+        whole = sqlite3.connect(os.path.join(folder, "whole.db"))
+        partitioned = sqlite3.connect(path)
+        for name, filters in searches:
+            def page(conn):
+                return db.count_entries(conn, filters), db.fetch_entries_after(conn, filters, 0, 225)
+            whole_ms, expected = timed(lambda: page(whole))
+            partitioned_ms, result = timed(lambda: page(partitioned))
+            assert result == expected
+            results.append([name, f"{whole_ms:.1f}", f"{partitioned_ms:.1f}"])
+        for name, filters in [("export a week", {"start_date": "2024-06-03", "end_date": "2024-06-09"}),
+                              ("totals by article, this year", {"start_date": "2024-01-01"})]:
+            run = ((lambda conn: list(db.iter_entries(conn, filters))) if name.startswith("export")
+                   else (lambda conn: db.fetch_totals(conn, "Article", filters)))
+            whole_ms, expected = timed(lambda: run(whole))
+            partitioned_ms, result = timed(lambda: run(partitioned))
+            assert result == expected
+            results.append([name, f"{whole_ms:.1f}", f"{partitioned_ms:.1f}"])
+        whole.close()
+        partitioned.close()
+
+    print(f"{rows:,} entries over 2019-2024; archiving {sum(moved.values()):,} of them took {archive_ms / 1000:.1f} s")
+    print(f"Main file: {whole_size / 1e6:.0f} MB as one table, {live_size / 1e6:.0f} MB with archives")
+    print_table(["search (median ms)", "one table", "partitioned"], results)
+
+@benchmark("errors")
+def bench_errors(rows):
+    # A CSV where every row has a bad Qty and every seventh lacks an article:
+    # the old list of "Row N: ..." strings joined for one messagebox versus
+    # ImportErrors' counts, bounded sample and report file
+    import csv
+    import tracemalloc
+    import importer
+
+    def legacy_errors(filepath):
+        # What import_csv did before: every message kept, then joined
+        errors = []
+        with importer.CsvReader(filepath) as reader:
+            converters = importer.compile_converters(reader.mapping(), reader.header, "2024-01-01")
+            warners = [lambda message: errors.append(f"Row ?: {message}")] * len(converters)
+            for row in reader.reader:
+                try:
+                    importer.convert_row(row, converters, warners)
+                except importer.RowSkipped as e:
+                    errors.append(f"Row ?: {e}")
+        return len("\n".join(errors))
+
+    def report_errors(filepath, report_path):
+        with importer.ImportErrors(report_path) as errors, importer.CsvReader(filepath) as reader:
+            for _ in reader.rows(errors, "2024-01-01"):
+                pass
+        return len("\n".join(errors.summary() + list(errors)))
+
+    with tempfile.TemporaryDirectory() as folder:
+        filepath = os.path.join(folder, "bad.csv")
+        with open(filepath, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(importer.IMPORT_FIELDS)
+            for i in range(rows):
+                writer.writerow(["" if i % 7 == 0 else f"ART{i}", "C1", "Red", "M", "n/a", "Front", "Yes", "2024-01-02"])
+
+        results = []
+        for name, run in [("list + join", lambda: legacy_errors(filepath)),
+                          ("ImportErrors", lambda: report_errors(filepath, os.path.join(folder, "report.csv")))]:
+            elapsed, shown = timed(run, repeat=1)
+            tracemalloc.start()
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results.append([name, f"{elapsed:.0f}", f"{peak / 1e6:.1f}", f"{shown / 1e3:,.0f}"])
+
+    print(f"Reporting the problems of {rows:,} bad rows")
+    print_table(["method", "ms", "peak MB", "text shown (KB)"], results)
+
+@benchmark("totals")
+def bench_totals(rows):
+    import db
+
+    with tempfile.TemporaryDirectory() as folder:
+        conn = sqlite3.connect(os.path.join(folder, "bench.db"))
+        db.migrate(conn)
+        fill_synthetic_entries(conn, rows)
+        db.refresh_statistics(conn)
+
+        results = []
+        for group_by, column in db.TOTALS_GROUPS.items():
+            for label, filters in [("all", {}), ("one month", {"start_date": "2024-03-01", "end_date": "2024-03-31"})]:
+                where, values = db.build_filter_clause(filters)
+                scan_ms, expected = timed(lambda: conn.execute(
+                    f"SELECT {column}, COUNT(*), SUM(qty) FROM entries WHERE {where} "
+                    f"GROUP BY {column} ORDER BY {column}", values).fetchall())
+                rollup_ms, totals = timed(lambda: db.fetch_totals(conn, group_by, filters))
+                assert totals == expected
+                results.append([f"{group_by}, {label}", f"{scan_ms:.1f}", f"{rollup_ms:.1f}"])
+        conn.close()
+
+    print(f"Totals over {rows:,} entries (median ms)")
+    print_table(["grouping", "GROUP BY entries", "entry_totals"], results)
+
+@benchmark("connections")
+def bench_connections(rows):
+    # Single-entry saves and a first-page search the way the UI issues them,
+    # opening a connection per call versus the long-lived dal.Database
+    import dal
+    import db
+
+    operations = 2000
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "bench.db")
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        db.migrate(conn)
+        fill_synthetic_entries(conn, rows)
+        conn.close()
+        entry = ("ART1", "C1", "Red", "M", 5, "Front", "Yes", "2024-03-01")
+        filters = {"start_date": "2024-03-01", "end_date": "2024-03-07"}
+
+        def connect_per_save():
+            for _ in range(operations):
+                conn = sqlite3.connect(path)
+                conn.execute(db.INSERT_ENTRY, entry)
+                conn.commit()
+                conn.close()
+
+        def connect_per_search():
+            for _ in range(operations):
+                conn = sqlite3.connect(path)
+                db.fetch_entries_at(conn, filters, 0, 50)
+                conn.close()
+
+        database = dal.Database(path)
+
+        def pooled_saves():
+            for _ in range(operations):
+                database.insert_entry(entry)
+
+        def pooled_searches():
+            for _ in range(operations):
+                with database.read() as conn:
+                    db.fetch_entries_at(conn, filters, 0, 50)
+
+        results = []
+        for name, per_call, pooled in [("save entry", connect_per_save, pooled_saves),
+                                       ("first page of a search", connect_per_search, pooled_searches)]:
+            per_call_ms, _ = timed(per_call, repeat=1)
+            pooled_ms, _ = timed(pooled, repeat=1)
+            results.append([name, f"{per_call_ms * 1000 / operations:.0f}", f"{pooled_ms * 1000 / operations:.0f}"])
+        database.close()
+
+    print(f"{operations:,} operations on {rows:,} entries (microseconds each)")
+    print_table(["operation", "connect per call", "dal.Database"], results)
+
+@benchmark("saves")
+def bench_saves(rows):
+    # What the operator waits for per Save: the old cycle (commit on a fresh
+    # connection, then reload the dashboard's first page) versus handing the
+    # entry to entry_queue.EntryQueue, plus how long until all are committed
+    import threading
+    import dal
+    import db
+    from entry_queue import EntryQueue
+
+    class TimerRoot:
+        # Just enough of Tk's root.after for EntryQueue outside a mainloop
+        def after(self, ms, fn):
+            timer = threading.Timer(ms / 1000, fn)
+            timer.daemon = True
+            timer.start()
+
+    saves = 1000
+    entry = ("ART1", "C1", "Red", "M", 5, "Front", "Yes", "2024-03-01")
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "bench.db")
+        db.init_db(path)
+        conn = sqlite3.connect(path)
+        fill_synthetic_entries(conn, rows)
+        conn.close()
+
+        def save_and_reload():
+            for _ in range(saves):
+                conn = sqlite3.connect(path)
+                conn.execute(db.INSERT_ENTRY, entry)
+                conn.commit()
+                db.count_entries(conn)
+                db.fetch_entries_at(conn, {}, 0, 225)
+                conn.close()
+
+        database = dal.Database(path)
+        committed = threading.Event()
+        saved = []
+
+        def on_saved(group):
+            saved.extend(group)
+            if len(saved) == saves:
+                committed.set()
+
+        entry_queue = EntryQueue(TimerRoot(), database, os.path.join(folder, "journal.jsonl"), on_saved=on_saved)
+
+        def submit():
+            for _ in range(saves):
+                entry_queue.submit(entry)
+
+        old_ms, _ = timed(save_and_reload, repeat=1)
+        started = time.perf_counter()
+        queued_ms, _ = timed(submit, repeat=1)
+        committed.wait()
+        all_committed_ms = (time.perf_counter() - started) * 1000
+        entry_queue.close()
+        database.close()
+
+    print(f"{saves:,} saves into {rows:,} entries")
+    print_table(["", "ms per save", "all committed after (ms)"],
+                [["commit + reload", f"{old_ms / saves:.2f}", f"{old_ms:.0f}"],
+                 ["EntryQueue", f"{queued_ms / saves:.3f}", f"{all_committed_ms:.0f}"]])
+
+@benchmark("refresh")
+def bench_refresh(rows):
+    # Database work behind the dashboard after editing one entry while
+    # scrolled halfway down: the old reload (COUNT(*) plus the window at that
+    # offset) versus reading the change log and the one edited row
+    import db
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "bench.db")
+        db.init_db(path)
+        conn = sqlite3.connect(path)
+        fill_synthetic_entries(conn, rows)
+        window = 25 + 2 * 100
+        offset = rows // 2
+        entry_id = db.fetch_entries_at(conn, {}, offset, 1)[0][0]
+        seq = db.latest_change(conn)
+        conn.execute("UPDATE entries SET qty = qty + 1 WHERE id = ?", (entry_id,))
+        conn.commit()
+
+        def reload():
+            db.count_entries(conn, {})
+            return db.fetch_entries_at(conn, {}, offset - 100, window)
+
+        def incremental():
+            changes = db.fetch_changes(conn, seq)
+            return db.fetch_entries_by_id(conn, [changed_id for _, changed_id, _ in changes])
+
+        reload_ms, _ = timed(reload)
+        incremental_ms, changed = timed(incremental)
+        assert [row[0] for row in changed] == [entry_id]
+        conn.close()
+
+    print(f"Refresh after one edit, {rows:,} entries, scrolled to the middle (median ms)")
+    print_table(["reload", "change log"], [[f"{reload_ms:.2f}", f"{incremental_ms:.3f}"]])
+
+@benchmark("typing")
+def bench_typing(rows):
+    # Search-as-you-type on the article field: time until the grid can show
+    # something for each keystroke, the old COUNT(*) plus first window versus
+    # the first window alone, and how soon a superseded count stops once its
+    # task is cancelled
+    import threading
+    import db
+    from tasks import Task
+
+    window = 25 + 2 * 100
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "bench.db")
+        db.init_db(path)
+        conn = sqlite3.connect(path, check_same_thread=False)
+        fill_synthetic_entries(conn, rows)
+
+        results = []
+        for term in ("A", "AR", "ART", "ART1", "ART12", "ART123"):
+            filters = {"article": term}
+
+            def count_first():
+                db.count_entries(conn, filters)
+                return db.fetch_entries_at(conn, filters, 0, window)
+
+            def first_page():
+                return db.fetch_entries_after(conn, filters, 0, window)
+
+            count_ms, _ = timed(count_first)
+            page_ms, _ = timed(first_page)
+            results.append([term, f"{count_ms:.2f}", f"{page_ms:.2f}"])
+
+        # A count over every entry, superseded 5 ms in
+        task = Task(None, "Searching")
+        task.watch(conn)
+        stopped = []
+
+        def count():
+            try:
+                db.count_entries(conn, {"article": "R"})
+            except sqlite3.OperationalError:
+                stopped.append(time.perf_counter())
+
+        thread = threading.Thread(target=count)
+        thread.start()
+        time.sleep(0.005)
+        cancelled = time.perf_counter()
+        task.cancel()
+        thread.join()
+        conn.close()
+
+    print(f"Time to first results per keystroke, {rows:,} entries (median ms)")
+    print_table(["article", "count + page", "first page"], results)
+    if stopped:
+        print(f"Superseded count stopped {(stopped[0] - cancelled) * 1000:.2f} ms after cancel")
+    else:
+        print("Superseded count finished before it was cancelled")
+
+@benchmark("cache")
+def bench_cache(rows):
+    # Operators flipping between a few searches, each followed by an export
+    # of the same result: every query run against SQLite versus the shared
+    # query_cache through dal.Database.reading()
+    import dal
+    import db
+
+    flips = 30
+    searches = [
+        ("today", {"start_date": "2024-03-01", "end_date": "2024-03-01"}),
+        ("one card", {"card": "C1234"}),
+        ("printed, one week", {"print_opt": "Yes", "start_date": "2024-03-01", "end_date": "2024-03-07"}),
+    ]
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "bench.db")
+        db.init_db(path)
+        conn = sqlite3.connect(path)
+        fill_synthetic_entries(conn, rows)
+        conn.close()
+        database = dal.Database(path)
+
+        def search_and_export(reader, filters):
+            reader.count_entries(filters)
+            reader.fetch_entries_at(filters, 0, 225)
+            return sum(1 for _ in reader.iter_entries(filters))
+
+        results = []
+        for name, filters in searches:
+            def uncached():
+                for _ in range(flips):
+                    with database.read() as conn:
+                        search_and_export(dal.Reader(conn), filters)
+
+            def cached():
+                for _ in range(flips):
+                    with database.reading() as reader:
+                        search_and_export(reader, filters)
+
+            uncached_ms, _ = timed(uncached, repeat=1)
+            cached_ms, _ = timed(cached, repeat=1)
+            with database.reading() as reader:
+                matches = reader.count_entries(filters)
+            results.append([name, f"{matches:,}", f"{uncached_ms / flips:.2f}", f"{cached_ms / flips:.2f}"])
+        database.close()
+
+    print(f"Search + export of the same result, {rows:,} entries (ms per flip)")
+    print_table(["search", "rows", "uncached", "query_cache"], results)
+
+# Libraries the login screen and an idle dashboard must not import
+STARTUP_DEFERRED_MODULES = ["PIL", "openpyxl", "reportlab"]
+# Budget for importing the login screen (welcome.py), in milliseconds
+STARTUP_IMPORT_BUDGET_MS = 150
+
+def import_times(statement):
+    # Cumulative import time per module (microseconds) from python -X importtime,
+    # run in a fresh interpreter so nothing is cached in sys.modules
+    import subprocess
+    import sys
+
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                            capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    times = {}
+    top_level = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+            # Nested imports are indented two more spaces per level
+            if not name.startswith("  "):
+                top_level[name.strip()] = int(cumulative)
+    return times, top_level
+
+@benchmark("startup")
+def bench_startup(rows):
+    # Import-time breakdown of the login screen and of the dashboard opened
+    # after it; fails when a deferred library is imported or the budget is blown
+    failures = []
+    for label, statement in [("login screen", "import welcome"), ("dashboard", "import welcome, main_ui")]:
+        times, top_level = import_times(statement)
+        print(f"{label}: {sum(top_level.values()) / 1000:.1f} ms of imports")
+        slowest = sorted(top_level.items(), key=lambda item: -item[1])[:8]
+        print_table(["module", "ms"], [[name, f"{micros / 1000:.1f}"] for name, micros in slowest])
+        print()
+        imported = sorted({name.split(".")[0] for name in times} & set(STARTUP_DEFERRED_MODULES))
+        if imported:
+            failures.append(f"{label} imports {', '.join(imported)}")
+        if label == "login screen" and times.get("welcome", 0) / 1000 > STARTUP_IMPORT_BUDGET_MS:
+            failures.append(f"importing welcome took {times['welcome'] / 1000:.0f} ms "
+                            f"(budget {STARTUP_IMPORT_BUDGET_MS} ms)")
+
+    # What the logo cost on every start before the resized copy was cached
+    times, _ = import_times("from PIL import Image; Image.open('logo.png').resize((220, 90))")
+    print(f"PIL import for an uncached logo resize: {times.get('PIL.Image', 0) / 1000:.1f} ms")
+
+    if failures:
+        raise SystemExit("Startup check failed: " + "; ".join(failures))
+    print("Startup check passed")
+
+# Stations saving at the same time, and the entries each of them saves
+SERVER_STATIONS = 12
+SERVER_SAVES_PER_STATION = 200
+
+@benchmark("server")
+def bench_server(rows):
+    # A dozen stations saving entries at once, each with its own connection to
+    # one database file versus all of them through server.py. The server runs
+    # in a process of its own on localhost, as it would on the shop floor.
+    import subprocess
+    import sys
+    import threading
+    import db
+    from remote import RemoteDatabase
+
+    entry = ("ART1", "C1", "Red", "M", 5, "Front", "Yes", "2024-03-01")
+
+    def run_stations(open_station):
+        latencies = []
+        errors = []
+
+        def station():
+            save, close = open_station()
+            try:
+                for _ in range(SERVER_SAVES_PER_STATION):
+                    started = time.perf_counter()
+                    save()
+                    latencies.append((time.perf_counter() - started) * 1000)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                close()
+
+        threads = [threading.Thread(target=station) for _ in range(SERVER_STATIONS)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - started
+        latencies.sort()
+        return [f"{len(latencies) / seconds:,.0f}", f"{statistics.median(latencies):.1f}",
+                f"{latencies[int(len(latencies) * 0.95)]:.1f}", str(len(errors))]
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "bench.db")
+        db.init_db(path)
+        conn = sqlite3.connect(path)
+        fill_synthetic_entries(conn, rows)
+        conn.close()
+
+        def direct_station():
+            conn = sqlite3.connect(path, timeout=30)
+
+            def save():
+                conn.execute(db.INSERT_ENTRY, entry)
+                conn.commit()
+            return save, conn.close
+
+        results = [["own connection per station"] + run_stations(direct_station)]
+
+        server = subprocess.Popen([sys.executable, "-m", "server", "--db", path, "--port", "0"],
+                                  stdout=subprocess.PIPE, text=True,
+                                  cwd=os.path.dirname(os.path.abspath(__file__)))
+        try:
+            url = server.stdout.readline().split()[-1]
+            database = RemoteDatabase(url)
+            results.append(["server.py"] + run_stations(lambda: (lambda: database.insert_entry(entry), lambda: None)))
+            saved = database.count_entries() - rows
+            database.close()
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"{SERVER_STATIONS} stations saving {SERVER_SAVES_PER_STATION} entries each into {rows:,} entries")
+    print_table(["backend", "saves/s", "median ms", "p95 ms", "errors"], results)
+    print(f"Entries saved by both runs: {saved:,} of {2 * SERVER_STATIONS * SERVER_SAVES_PER_STATION:,}")
+
+def legacy_export_pdf(filepath, db_rows):
+    # The drawing loop export_pdf used before export.PdfPageRenderer, fed the
+    # same fetchall() result; it measures every cell with drawString
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    pdf_canvas = canvas.Canvas(filepath, pagesize=A4)
+    width, height = A4
+    margin = 40
+    line_height = 16
+    y_pos = height - margin - 30
+    col_widths = [(width - 2 * margin) * share for share in [0.06, 0.18, 0.12, 0.10, 0.08, 0.07, 0.18, 0.09, 0.12]]
+    pdf_canvas.setFont("Helvetica", 8)
+    for row_data in db_rows:
+        if y_pos < margin + line_height:
+            pdf_canvas.showPage()
+            pdf_canvas.setFont("Helvetica", 8)
+            y_pos = height - margin - 30
+        x_pos = margin
+        for i_val, value in enumerate(row_data):
+            cell_text = str(value)
+            max_chars = int(col_widths[i_val] / (pdf_canvas._fontsize * 0.5))
+            if len(cell_text) > max_chars and max_chars > 3:
+                cell_text = cell_text[:max_chars - 3] + "..."
+            pdf_canvas.drawString(x_pos, y_pos, cell_text)
+            x_pos += col_widths[i_val]
+        y_pos -= line_height
+    pdf_canvas.save()
+
+PDF_SIZES = [10_000, 100_000, 1_000_000]
+# The legacy loop takes minutes beyond this
+PDF_LEGACY_MAX_ROWS = 100_000
+
+@benchmark("pdf")
+def bench_pdf(rows):
+    import db
+    import export
+
+    workers = os.cpu_count() or 1
+    sizes = [size for size in PDF_SIZES if size <= rows] or [rows]
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        conn = sqlite3.connect(os.path.join(folder, "bench.db"))
+        db.migrate(conn)
+        fill_synthetic_entries(conn, sizes[-1])
+        filepath = os.path.join(folder, "report.pdf")
+
+        for size in sizes:
+            select = lambda: islice(db.iter_entries(conn), size)
+            legacy = "-"
+            if size <= PDF_LEGACY_MAX_ROWS:
+                legacy_ms, _ = timed(lambda: legacy_export_pdf(filepath, list(select())), repeat=1)
+                legacy = f"{legacy_ms / 1000:.2f}"
+            streamed_ms, _ = timed(lambda: export.export_pdf(filepath, select()), repeat=1)
+            parallel_ms, _ = timed(lambda: export.export_pdf(filepath, select(), workers=workers), repeat=1)
+            results.append([f"{size:,}", legacy, f"{streamed_ms / 1000:.2f}", f"{parallel_ms / 1000:.2f}",
+                            f"{os.path.getsize(filepath) / 1e6:.1f}"])
+        conn.close()
+
+    print(f"PDF report generation (seconds, {workers} worker processes)")
+    print_table(["rows", "legacy", "export_pdf", "export_pdf parallel", "MB"], results)
+
+def main():
+    parser = argparse.ArgumentParser(description="Hype Production Management benchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--rows", type=int, default=3_000_000)
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args.rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+# cli.py - Command line for scripted imports, exports and reports
+#
+# Usage: python -m cli [--db PATH | --server URL] <command> [options]
+#   add          --article A [--card C] [--color C] [--size S] [--qty N] [--component C] [--print Yes|No] [--date D]
+#   search       [filters] [--limit N]        matching entries as CSV on stdout
+#   stats        [filters] [--by GROUP]       entry count, and totals per Article/Color/Size/Day
+#   import-xlsx  PATH... [--mapping FILE.json | --saved-mapping] [import options]   files or folders of shift sheets
+#   import-csv   PATH [import options]
+#   resume-imports                            finish large imports that were interrupted
+#   archive                                   move old years to their archive files
+#   export-xlsx / export-csv / export-pdf  FILE [filters]
+# Filters: --article, --card (substring), --print Yes|No, --from / --to YYYY-MM-DD.
+# Import options: --duplicates skip|upsert|sum, --dry-run (check and report only).
+#
+# No Tk, no login: meant for cron jobs and batch work on a server. The
+# database is db.DB_NAME unless --db or the HYPE_DB environment variable
+# points elsewhere, or the shared server (server.py) given by --server or
+# HYPE_SERVER.
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+from db import ARCHIVE_KEEP_YEARS, DB_NAME, DUPLICATE_POLICIES, ENTRY_COLUMNS, TOTALS_GROUPS, normalize_date
+import service
+
+def date_argument(value):
+    normalized = normalize_date(value)
+    if normalized is None:
+        raise argparse.ArgumentTypeError(f"invalid date '{value}', use YYYY-MM-DD")
+    return normalized
+
+def add_filter_arguments(parser):
+    parser.add_argument("--article", default="", help="article contains")
+    parser.add_argument("--card", default="", help="card contains")
+    parser.add_argument("--print", dest="print_opt", choices=service.PRINT_OPTIONS, default="")
+    parser.add_argument("--from", dest="start_date", type=date_argument, help="first date, YYYY-MM-DD")
+    parser.add_argument("--to", dest="end_date", type=date_argument, help="last date, YYYY-MM-DD")
+
+def add_import_arguments(parser):
+    parser.add_argument("--dry-run", action="store_true", help="check every row and report problems, import nothing")
+    parser.add_argument("--duplicates", choices=DUPLICATE_POLICIES,
+                        help="rows already imported: skip them, update (upsert) their qty and print, "
+                             "or sum their qty (default: import them again)")
+
+def filters_from(args):
+    return service.make_filters(args.article, args.card, args.print_opt, args.start_date, args.end_date)
+
+def progress_reporter(label):
+    # Progress on stderr for interactive runs; cron output stays clean
+    if not sys.stderr.isatty():
+        return None
+
+    def report(done, total):
+        suffix = f" / {total:,}" if total else ""
+        print(f"\r{label}: {done:,}{suffix}", end="", file=sys.stderr, flush=True)
+    return report
+
+# Example problems printed; the full list is in the import report file
+PRINTED_PROBLEMS = 20
+
+def print_import_result(stats, errors, dry_run=False):
+    if sys.stderr.isatty():
+        print(file=sys.stderr)
+    if errors:
+        for line in errors.summary():
+            print(line, file=sys.stderr)
+        for message in list(errors)[:PRINTED_PROBLEMS]:
+            print(f"  {message}", file=sys.stderr)
+        if errors.has_report:
+            print(f"All {len(errors):,} problems: {errors.report_path}", file=sys.stderr)
+    if stats.resumed_after:
+        print(f"Resumed an interrupted import after row {stats.resumed_after:,}")
+    print(f"Checked {stats.rows:,} importable rows, nothing imported (dry run)" if dry_run else f"Imported {stats}")
+
+# --- Commands ---
+
+def command_add(database, args):
+    entry_id = service.add_entry(database, args.article, args.card, args.color, args.size, args.qty,
+                                 args.component, args.print_opt or "Yes", args.date)
+    print(entry_id)
+
+def command_search(database, args):
+    writer = csv.writer(sys.stdout)
+    writer.writerow([column.strip() for column in ENTRY_COLUMNS.split(",")])
+    writer.writerows(service.search_entries(database, filters_from(args), args.limit))
+
+def command_stats(database, args):
+    total, totals = service.entry_stats(database, args.by, filters_from(args))
+    print(f"Entries: {total}")
+    if totals is not None:
+        writer = csv.writer(sys.stdout)
+        writer.writerow([args.by, "Entries", "Qty"])
+        writer.writerows(totals)
+
+def command_import_xlsx(database, args):
+    from importer import default_mapping, find_workbooks, read_headers
+
+    filepaths = []
+    for path in args.paths:
+        filepaths.extend(find_workbooks(path) if os.path.isdir(path) else [path])
+    if not filepaths:
+        raise ValueError("No Excel files (*.xlsx) found.")
+
+    if args.mapping:
+        with open(args.mapping, encoding="utf-8") as f:
+            mapping = json.load(f)
+    elif args.saved_mapping:
+        from utils import get_import_mapping
+        mapping = get_import_mapping()
+        if not mapping:
+            raise ValueError("No column mapping has been saved from the import window yet.")
+    else:
+        mapping = None
+
+    if len(filepaths) == 1:
+        stats, errors = service.import_xlsx(database, filepaths[0], mapping, progress_reporter("Rows"),
+                                            args.duplicates, args.dry_run)
+    else:
+        # All sheets share the first one's layout, as in the folder import
+        mapping = mapping or default_mapping(read_headers(filepaths[0]))
+        stats, errors = service.import_xlsx_files(database, filepaths, mapping, progress_reporter("Files"),
+                                                  args.duplicates, args.dry_run)
+    print_import_result(stats, errors, args.dry_run)
+
+def command_import_csv(database, args):
+    stats, errors = service.import_csv(database, args.path, progress_reporter("Rows"), args.duplicates, args.dry_run)
+    print_import_result(stats, errors, args.dry_run)
+
+def command_resume_imports(database, args):
+    # Large imports that were cut short keep their committed chunks; running
+    # the same import again resumes one, this resumes them all
+    jobs = database.unfinished_import_jobs()
+    if not jobs:
+        print("No interrupted imports.")
+    for job in jobs:
+        print(f"Resuming {job[2]} after row {job[5]:,}", file=sys.stderr)
+        stats, errors = service.resume_import_job(database, job, progress_reporter("Rows"))
+        print_import_result(stats, errors)
+
+def command_archive(database, args):
+    moved = database.archive_old_entries()
+    for year, entries in moved.items():
+        print(f"Archived {entries:,} entries from {year}")
+    if not moved:
+        print("Nothing to archive.")
+
+def command_export(export_format):
+    def run(database, args):
+        written = service.export_entries(database, args.path, export_format, filters_from(args),
+                                         progress_reporter("Rows"))
+        if sys.stderr.isatty():
+            print(file=sys.stderr)
+        print(f"Exported {written} entries to {args.path}")
+    return run
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m cli", description="Hype Production Management command line")
+    parser.add_argument("--db", default=DB_NAME, help=f"database file (default: {DB_NAME})")
+    parser.add_argument("--server", help="shared server URL, e.g. http://localhost:8750 (default: HYPE_SERVER)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="add one entry")
+    add.add_argument("--article", required=True)
+    for name in ("card", "color", "size", "component"):
+        add.add_argument(f"--{name}", default="")
+    add.add_argument("--qty")
+    add.add_argument("--print", dest="print_opt", choices=service.PRINT_OPTIONS, default="Yes")
+    add.add_argument("--date", type=date_argument, help="YYYY-MM-DD, default today")
+    add.set_defaults(run=command_add)
+
+    search = commands.add_parser("search", help="print matching entries as CSV")
+    add_filter_arguments(search)
+    search.add_argument("--limit", type=int)
+    search.set_defaults(run=command_search)
+
+    stats = commands.add_parser("stats", help="count entries and total them per group")
+    add_filter_arguments(stats)
+    stats.add_argument("--by", choices=list(TOTALS_GROUPS))
+    stats.set_defaults(run=command_stats)
+
+    import_xlsx = commands.add_parser("import-xlsx", help="import shift sheets (files or folders)")
+    import_xlsx.add_argument("paths", nargs="+")
+    mapping = import_xlsx.add_mutually_exclusive_group()
+    mapping.add_argument("--mapping", help="JSON file mapping Article, Card, ... to sheet headers")
+    mapping.add_argument("--saved-mapping", action="store_true", help="use the mapping saved by the import window")
+    add_import_arguments(import_xlsx)
+    import_xlsx.set_defaults(run=command_import_xlsx)
+
+    import_csv = commands.add_parser("import-csv", help="import a CSV (or .csv.gz) export")
+    import_csv.add_argument("path")
+    add_import_arguments(import_csv)
+    import_csv.set_defaults(run=command_import_csv)
+
+    resume = commands.add_parser("resume-imports", help="finish large imports that were interrupted")
+    resume.set_defaults(run=command_resume_imports)
+
+    archive = commands.add_parser("archive", help=f"move entries older than the last {ARCHIVE_KEEP_YEARS} years "
+                                                  "to yearly archive files")
+    archive.set_defaults(run=command_archive)
+
+    for export_format in service.EXPORT_FORMATS:
+        export = commands.add_parser(f"export-{export_format}", help=f"export matching entries to {export_format}")
+        export.add_argument("path")
+        add_filter_arguments(export)
+        export.set_defaults(run=command_export(export_format))
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    database = None
+    try:
+        database = service.open_database(args.server, args.db)
+        args.run(database, args)
+    except (ValueError, OSError, sqlite3.Error) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if database is not None:
+            database.close()
+    return 0
+
+if __name__ == "__main__":
+    # Parallel imports and PDF exports start worker processes (see main.py)
+    from multiprocessing import freeze_support
+    freeze_support()
+    sys.exit(main())
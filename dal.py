@@ -0,0 +1,218 @@
+# dal.py - Long-lived SQLite connections shared by the UI
+
+# Opening a connection per click throws away SQLite's page cache and the
+# sqlite3 module's prepared-statement cache, which both live on the
+# connection. Database keeps them warm: one writer connection, serialized by a
+# lock because SQLite allows a single writer anyway, and a small pool of reader
+# connections that WAL lets run alongside it. Connections are shared with the
+# TaskRunner threads, but only ever used by one thread at a time.
+#
+# Readers answer repeated searches from one query_cache.QueryCache.
+# remote.RemoteDatabase offers the same reading()/open_reader() queries and
+# entry writes against a shared server (server.py), so service.py and the UI
+# work with either one.
+
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from db import (DB_NAME, INSERT_ENTRY, UPDATE_ENTRY, DELETE_ENTRY, archive_old_entries, bulk_insert,
+                count_entries, delete_archived_entry, fetch_changes, fetch_entries_after, fetch_entries_at,
+                fetch_entries_before, fetch_entries_by_id, fetch_totals, fetch_unfinished_import_jobs,
+                finish_import_job, insert_entries, iter_entries, latest_change, start_import_job, update_archived_entry)
+from query_cache import QueryCache
+
+READER_POOL_SIZE = 4
+
+# Prepared statements kept per connection; the fixed entry statements and
+# the search/pagination queries fit many times over
+STATEMENT_CACHE_SIZE = 256
+
+# Seconds to wait for another process's write lock before "database is locked"
+BUSY_TIMEOUT = 30
+
+# Page cache per connection, in KiB. SQLite's default 2 MB is smaller than
+# what the trigram search index touches per insert, so every saved entry
+# read the same index pages from disk again (about 2 ms each on 200k entries).
+CACHE_SIZE_KIB = 16384
+
+class Reader:
+    # The entry queries on one reader connection
+    def __init__(self, conn):
+        self.conn = conn
+
+    def count_entries(self, filters=None):
+        return count_entries(self.conn, filters)
+
+    def fetch_entries_after(self, filters, after_id, limit):
+        return fetch_entries_after(self.conn, filters, after_id, limit)
+
+    def fetch_entries_before(self, filters, before_id, limit):
+        return fetch_entries_before(self.conn, filters, before_id, limit)
+
+    def fetch_entries_at(self, filters, offset, limit):
+        return fetch_entries_at(self.conn, filters, offset, limit)
+
+    def fetch_entries_by_id(self, ids):
+        return fetch_entries_by_id(self.conn, ids)
+
+    def fetch_totals(self, group_by, filters=None):
+        return fetch_totals(self.conn, group_by, filters)
+
+    def latest_change(self):
+        return latest_change(self.conn)
+
+    def fetch_changes(self, after_seq):
+        return fetch_changes(self.conn, after_seq)
+
+    def iter_entries(self, filters=None):
+        return iter_entries(self.conn, filters)
+
+class Database:
+    def __init__(self, path=DB_NAME, readers=READER_POOL_SIZE):
+        self.path = path
+        self._writer = None
+        self._write_lock = threading.Lock()
+        self._readers = queue.LifoQueue()
+        self._reader_slots = threading.Semaphore(readers)
+        self._pool_lock = threading.Lock()
+        self._dedicated = []
+        self.cache = QueryCache()
+        self.closed = False
+
+    def _connect(self, query_only=False):
+        if self.closed:
+            raise sqlite3.ProgrammingError("Database is closed.")
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+        if query_only:
+            conn.execute("PRAGMA query_only=1")
+        return conn
+
+    @contextmanager
+    def write(self):
+        # The writer connection, committed when the block succeeds and rolled
+        # back when it raises. Blocks while another thread is writing.
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect()
+            conn = self._writer
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                conn.set_progress_handler(None, 0)
+
+    @contextmanager
+    def read(self):
+        # A reader connection from the pool; blocks while all of them are busy
+        self._reader_slots.acquire()
+        try:
+            try:
+                conn = self._readers.get_nowait()
+            except queue.Empty:
+                conn = self._connect(query_only=True)
+            try:
+                yield conn
+            finally:
+                conn.set_progress_handler(None, 0)
+                with self._pool_lock:
+                    if self.closed:
+                        conn.close()
+                    else:
+                        self._readers.put(conn)
+        finally:
+            self._reader_slots.release()
+
+    @contextmanager
+    def reading(self, watch=None):
+        # A Reader on a pooled connection; watch(conn) is called first, e.g.
+        # to install a TaskRunner cancellation handler
+        with self.read() as conn:
+            if watch:
+                watch(conn)
+            yield self.cache.reader(Reader(conn))
+
+    def open_reader(self):
+        # A dedicated Reader outside the pool, for callers on the Tk thread
+        # that must never wait behind background tasks; it pages through
+        # keyset queries and only uses whole results other readers cached.
+        # Closed by close().
+        conn = self._connect(query_only=True)
+        with self._pool_lock:
+            self._dedicated.append(conn)
+        return self.cache.reader(Reader(conn), fill_rows=False)
+
+    # --- Fixed entry statements ---
+    # Always the same SQL text, so each runs from the writer's statement cache
+
+    def insert_entry(self, data):
+        with self.write() as conn:
+            return conn.execute(INSERT_ENTRY, data).lastrowid
+
+    def insert_entries(self, rows, batch=None):
+        # Several entries in one transaction; returns their ids in order.
+        # batch makes a retry safe, see db.insert_entries.
+        with self.write() as conn:
+            return insert_entries(conn, rows, batch)
+
+    def update_entry(self, entry_id, data):
+        with self.write() as conn:
+            if not conn.execute(UPDATE_ENTRY, tuple(data) + (entry_id,)).rowcount:
+                # Not in the main file: nothing changed yet, and attaching its
+                # archive needs the transaction closed
+                conn.rollback()
+                update_archived_entry(conn, entry_id, data)
+
+    def delete_entry(self, entry_id):
+        with self.write() as conn:
+            if not conn.execute(DELETE_ENTRY, (entry_id,)).rowcount:
+                conn.rollback()
+                delete_archived_entry(conn, entry_id)
+
+    def bulk_insert(self, rows, defer_indexes=False, progress=None, duplicates=None, checkpoint=None):
+        # db.bulk_insert on the writer: one transaction for the whole load
+        with self.write() as conn:
+            return bulk_insert(conn, rows, defer_indexes=defer_indexes, progress=progress, duplicates=duplicates,
+                               checkpoint=checkpoint)
+
+    def archive_old_entries(self, progress=None):
+        # db.archive_old_entries with the writer held, so no entry changes
+        # between copying a year to its archive and deleting it here
+        with self.write() as conn:
+            return archive_old_entries(conn, progress=progress)
+
+    # --- Checkpointed import jobs (see db.start_import_job) ---
+
+    def start_import_job(self, file_hash, source, kind, options):
+        with self.write() as conn:
+            return start_import_job(conn, file_hash, source, kind, options)
+
+    def finish_import_job(self, job_id, status="done"):
+        with self.write() as conn:
+            finish_import_job(conn, job_id, status)
+
+    def unfinished_import_jobs(self):
+        with self.read() as conn:
+            return fetch_unfinished_import_jobs(conn)
+
+    def close(self):
+        # Idle connections close now; readers still in use by a task close
+        # when they are handed back, the writer once the current write ends
+        with self._pool_lock:
+            self.closed = True
+            idle = self._dedicated
+            self._dedicated = []
+            while not self._readers.empty():
+                idle.append(self._readers.get_nowait())
+        for conn in idle:
+            conn.close()
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
@@ -0,0 +1,102 @@
+# dates.py - Date normalization for imports
+
+# Production sheets repeat the same handful of dates thousands of times and
+# write every date in a column the same way. DateNormalizer exploits both:
+# the first string that parses fixes the column's format, which is tried first
+# from then on, and every distinct raw value is converted only once.
+
+from datetime import date, datetime
+
+# Order matters for ambiguous values like 03/04/2024 until a column has
+# shown which format it uses
+DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y', '%d/%m/%Y', '%Y/%m/%d')
+
+# Distinct raw values remembered per column before the memo is reset
+MEMO_SIZE = 10000
+
+_from_excel = None
+
+def excel_serial_to_date(value):
+    global _from_excel
+    if _from_excel is None:
+        from openpyxl.utils.datetime import from_excel
+        _from_excel = from_excel
+    return _from_excel(value)
+
+class DateNormalizer:
+    def __init__(self, today=None):
+        self.today = today or str(date.today())
+        self.format = None
+        self.memo = {}
+
+    def convert(self, value, warn):
+        # Converter for importer tables: returns YYYY-MM-DD, or today's date
+        # with a warn(message) when the value cannot be read as a date.
+        if value is None:
+            return self.today
+        try:
+            result, message = self.memo[value]
+        except KeyError:
+            result, message = self._parse(value)
+            if len(self.memo) >= MEMO_SIZE:
+                self.memo.clear()
+            self.memo[value] = (result, message)
+        except TypeError:
+            # Unhashable cell value
+            result, message = self._parse(value)
+        if message:
+            warn(message)
+        return result
+
+    def _parse(self, value):
+        if isinstance(value, datetime):
+            return value.date().isoformat(), None
+        if isinstance(value, date):
+            return value.isoformat(), None
+        if isinstance(value, (int, float)):
+            try:
+                return excel_serial_to_date(value).strftime('%Y-%m-%d'), None
+            except (ValueError, OverflowError, TypeError):
+                return self.today, f"Cannot convert numeric date '{value}'. Using today's date."
+        if isinstance(value, str):
+            if not value:
+                return self.today, None
+            parsed = self._parse_string(value)
+            if parsed:
+                return parsed, None
+            return self.today, f"Unrecognized date string format '{value}'. Using today's date."
+        return self.today, f"Unrecognized date data type '{type(value).__name__}'. Using today's date."
+
+    def _parse_string(self, value):
+        if 'T' in value and ('+' in value or 'Z' in value):
+            try:
+                return datetime.fromisoformat(value.replace("Z", "+00:00")).strftime('%Y-%m-%d')
+            except ValueError:
+                return None
+        formats = DATE_FORMATS if self.format is None else (self.format,) + DATE_FORMATS
+        for date_format in formats:
+            try:
+                parsed = datetime.strptime(value, date_format)
+            except ValueError:
+                continue
+            if date_format != self.format:
+                # Values memoized under another format may read differently now
+                self.memo.clear()
+                self.format = date_format
+            return parsed.strftime('%Y-%m-%d')
+        return None
+
+def normalize_dates(values, today=None):
+    # Batch API: normalize a whole column in one call. Returns the normalized
+    # dates and a list of (position, message) for values that fell back to today.
+    convert = DateNormalizer(today).convert
+    problems = []
+    position = 0
+
+    def warn(message):
+        problems.append((position, message))
+
+    results = []
+    for position, value in enumerate(values):
+        results.append(convert(value, warn))
+    return results, problems
@@ -1,21 +1,1112 @@
-# db.py - SQLite Database initialization
+# db.py - SQLite Database initialization and entry queries
 
+import hashlib
+import json
+import re
 import sqlite3
 import os
+import time
+from itertools import islice
+from datetime import datetime
 
-# Create safe writable path
-APP_FOLDER = os.path.join(os.getenv('APPDATA'), 'HypeProduction')
-os.makedirs(APP_FOLDER, exist_ok=True)
+# Create safe writable path. APPDATA only exists on Windows; scripts on a
+# server fall back to the home folder, and HYPE_DB overrides the file itself.
+APP_FOLDER = os.path.join(os.getenv('APPDATA') or os.path.expanduser('~'), 'HypeProduction')
 
-DB_NAME = os.path.join(APP_FOLDER, 'database.db')
+DB_NAME = os.getenv('HYPE_DB') or os.path.join(APP_FOLDER, 'database.db')
+os.makedirs(os.path.dirname(os.path.abspath(DB_NAME)), exist_ok=True)
 
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS entries (
+ENTRY_COLUMNS = "id, article, card, color, size, qty, component, print_opt, date"
+
+# The fields of an entry tuple, in INSERT_ENTRY / UPDATE_ENTRY order
+ENTRY_FIELDS = ("article", "card", "color", "size", "qty", "component", "print_opt", "date")
+
+INSERT_ENTRY = "INSERT INTO entries (article, card, color, size, qty, component, print_opt, date) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+
+UPDATE_ENTRY = """UPDATE entries SET article=?, card=?, color=?, size=?, qty=?, component=?, print_opt=?, date=?
+                  WHERE id=?"""
+
+DELETE_ENTRY = "DELETE FROM entries WHERE id=?"
+
+# An entry's natural key: a row imported twice repeats all of these. Qty and
+# the print option are what an import may legitimately change.
+KEY_FIELDS = ("article", "card", "color", "size", "component", "date")
+
+# INSERT_ENTRY with the key hash (see entry_key_hash) appended to the tuple
+INSERT_HASHED_ENTRY = ("INSERT INTO entries (article, card, color, size, qty, component, print_opt, date, key_hash) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+def init_db(path=DB_NAME):
+    conn = sqlite3.connect(path)
+    # WAL lets background exports read while new entries are being saved
+    conn.execute("PRAGMA journal_mode=WAL")
+    migrate(conn)
+    refresh_statistics(conn)
+    conn.close()
+
+def refresh_statistics(conn):
+    # Stale statistics make the planner misjudge how selective a date range
+    # is. They are refreshed whenever the table size moved by more than a quarter.
+    estimated = conn.execute("SELECT COALESCE(MAX(id) - MIN(id) + 1, 0) FROM entries").fetchone()[0]
+    try:
+        row = conn.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = 'entries' AND idx IS NOT NULL").fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    analyzed = int(row[0].split()[0]) if row else 0
+    if row is None or abs(estimated - analyzed) > analyzed / 4:
+        conn.execute("ANALYZE")
+        conn.commit()
+
+# --- Schema migrations ---
+# Each function upgrades the schema by one version. PRAGMA user_version records
+# how far a database file has been migrated, so new steps are only ever appended
+# to MIGRATIONS, never edited once released.
+
+def _create_entries(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS entries (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         article TEXT, card TEXT, color TEXT, size TEXT,
         qty INTEGER, component TEXT, print_opt TEXT, date TEXT
     )''')
+
+def _normalize_dates_and_index(conn):
+    # strptime accepts "2024-1-5", so older edits could store dates that do not
+    # sort as text. Rewrite them as zero-padded ISO dates before indexing.
+    rows = conn.execute("SELECT id, date FROM entries WHERE date IS NOT NULL AND "
+                        "date NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'").fetchall()
+    for entry_id, value in rows:
+        normalized = normalize_date(value)
+        if normalized:
+            conn.execute("UPDATE entries SET date = ? WHERE id = ?", (normalized, entry_id))
+
+    # One index per filter shape the search panel and exports build:
+    # a date range on its own, and print option equality plus a date range.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_date ON entries(date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_print_opt_date ON entries(print_opt, date)")
+
+def _lead_indexes_with_date(conn):
+    # print_opt only holds "Yes" or "No", so an index that starts with it sends
+    # the planner on random row lookups across half the table whenever print is
+    # combined with an article or card filter. Leading with the date keeps the
+    # "print + date range" shape covered and leaves print-only filters to a scan.
+    conn.execute("DROP INDEX IF EXISTS idx_entries_print_opt_date")
+    conn.execute("DROP INDEX IF EXISTS idx_entries_date")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_date_print_opt ON entries(date, print_opt)")
+
+def _add_search_index(conn):
+    # Trigram full-text index over article and card so "%x%" substring filters
+    # do not scan the whole table. It mirrors entries through triggers. SQLite
+    # builds without FTS5 or the trigram tokenizer (older than 3.34) skip it and
+    # keep using plain LIKE, see has_search_index().
+    try:
+        conn.execute("""CREATE VIRTUAL TABLE entries_search USING fts5(
+            article, card, content='entries', content_rowid='id', tokenize='trigram'
+        )""")
+    except sqlite3.OperationalError:
+        return
+    conn.execute("""CREATE TRIGGER entries_search_insert AFTER INSERT ON entries BEGIN
+        INSERT INTO entries_search(rowid, article, card) VALUES (new.id, new.article, new.card);
+    END""")
+    conn.execute("""CREATE TRIGGER entries_search_delete AFTER DELETE ON entries BEGIN
+        INSERT INTO entries_search(entries_search, rowid, article, card) VALUES ('delete', old.id, old.article, old.card);
+    END""")
+    conn.execute("""CREATE TRIGGER entries_search_update AFTER UPDATE OF article, card ON entries BEGIN
+        INSERT INTO entries_search(entries_search, rowid, article, card) VALUES ('delete', old.id, old.article, old.card);
+        INSERT INTO entries_search(rowid, article, card) VALUES (new.id, new.article, new.card);
+    END""")
+    conn.execute("INSERT INTO entries_search(entries_search) VALUES ('rebuild')")
+
+# Columns entry_totals keeps daily totals for: the summary panel's groupings
+TOTALS_GROUPS = {"Article": "article", "Color": "color", "Size": "size", "Day": "date"}
+
+def _total_qty(prefix=""):
+    # An entry's qty as the totals count it: qty text _add_rollups could not
+    # read as a whole number is kept as typed and counts as 0
+    return f"(CASE WHEN typeof({prefix}qty) = 'integer' THEN {prefix}qty ELSE 0 END)"
+
+def _totals_upserts(prefix, sign):
+    # Trigger body adding (sign "") or removing (sign "-") the "new." or
+    # "old." row from every grouping's daily totals
+    statements = []
+    for column in TOTALS_GROUPS.values():
+        statements.append(f"""INSERT INTO entry_totals (grouping, date, value, entries, qty)
+            VALUES ('{column}', COALESCE({prefix}date, ''), COALESCE({prefix}{column}, ''), {sign}1, {sign}{_total_qty(prefix)})
+            ON CONFLICT (grouping, date, value)
+            DO UPDATE SET entries = entries + excluded.entries, qty = qty + excluded.qty;""")
+    return "\n".join(statements)
+
+def _add_rollups(conn):
+    # qty used to be stored as whatever was typed. Totals need real integers,
+    # so whole-number text ("12", "12.0", "1,200") and blanks become integers
+    # and NULL. Anything else ("lots", "1.5", "1,5") is left as typed and
+    # counted as 0 (_total_qty). qty_originals keeps the text of every
+    # non-blank qty this touched, with converted NULL for those left as typed
+    # to fix by hand.
+    conn.execute("""CREATE TABLE qty_originals (
+        entry_id INTEGER PRIMARY KEY, original TEXT NOT NULL, converted INTEGER
+    )""")
+    rows = conn.execute("SELECT id, qty FROM entries WHERE typeof(qty) NOT IN ('integer', 'null')").fetchall()
+    conn.executemany("UPDATE entries SET qty = NULL WHERE id = ?",
+                     [(entry_id,) for entry_id, value in rows if not str(value).strip()])
+    converted = [(entry_id, str(value), normalize_qty(value)) for entry_id, value in rows if str(value).strip()]
+    conn.executemany("INSERT INTO qty_originals (entry_id, original, converted) VALUES (?, ?, ?)", converted)
+    conn.executemany("UPDATE entries SET qty = ? WHERE id = ?",
+                     [(qty, entry_id) for entry_id, _, qty in converted if qty is not None])
+
+    # Entry count and quantity per day for every article, color and size (and
+    # the day itself), kept up to date by triggers. A summary reads one row per
+    # group and day instead of every entry.
+    conn.execute("""CREATE TABLE entry_totals (
+        grouping TEXT NOT NULL, date TEXT NOT NULL, value TEXT NOT NULL,
+        entries INTEGER NOT NULL, qty INTEGER NOT NULL,
+        PRIMARY KEY (grouping, date, value)
+    ) WITHOUT ROWID""")
+    groupings = ", ".join(f"'{column}'" for column in TOTALS_GROUPS.values())
+    remove_empty = (f"DELETE FROM entry_totals WHERE grouping IN ({groupings}) "
+                    f"AND date = COALESCE(old.date, '') AND entries = 0;")
+    conn.execute(f"CREATE TRIGGER entry_totals_insert AFTER INSERT ON entries BEGIN {_totals_upserts('new.', '')} END")
+    conn.execute(f"""CREATE TRIGGER entry_totals_delete AFTER DELETE ON entries
+        BEGIN {_totals_upserts('old.', '-')} {remove_empty} END""")
+    conn.execute(f"""CREATE TRIGGER entry_totals_update AFTER UPDATE OF {', '.join(TOTALS_GROUPS.values())}, qty ON entries
+        BEGIN {_totals_upserts('old.', '-')} {remove_empty} {_totals_upserts('new.', '')} END""")
+    for statement in DEFERRED_INSERT_TRIGGERS["entry_totals_insert"]:
+        conn.execute(statement, (0,))
+
+# Change log entries kept for windows and stations catching up; one that has
+# fallen further behind reloads instead
+CHANGE_LOG_KEEP = 10000
+
+def _add_change_log(conn):
+    # Every insert, update and delete of an entry appends (entry_id, op) here,
+    # so an open dashboard can apply just those changes instead of reloading.
+    # A bulk load logs a single 'bulk' row holding the highest id before it,
+    # archiving a year (archive_year) one 'archive' row.
+    conn.execute("""CREATE TABLE entry_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT, entry_id INTEGER, op TEXT NOT NULL
+    )""")
+    for op, row in (("insert", "new"), ("update", "new"), ("delete", "old")):
+        conn.execute(f"""CREATE TRIGGER entry_changes_{op} AFTER {op.upper()} ON entries BEGIN
+            INSERT INTO entry_changes (entry_id, op) VALUES ({row}.id, '{op}');
+        END""")
+    # Trims the log every thousand changes instead of on every one
+    conn.execute(f"""CREATE TRIGGER entry_changes_trim AFTER INSERT ON entry_changes
+        WHEN new.seq % 1000 = 0 BEGIN
+            DELETE FROM entry_changes WHERE seq <= new.seq - {CHANGE_LOG_KEEP};
+        END""")
+
+def _add_key_hashes(conn):
+    # A 64-bit hash of each entry's natural key (KEY_FIELDS), indexed so an
+    # import finds the entries it would duplicate without comparing text
+    # columns across the table. Hashes are computed in Python: rows written
+    # without one, or whose key was edited, have NULL and are hashed by
+    # refresh_key_hashes() before the next import that checks for duplicates.
+    conn.execute("ALTER TABLE entries ADD COLUMN key_hash INTEGER")
+    conn.execute("CREATE INDEX idx_entries_key_hash ON entries(key_hash)")
+    changed = " OR ".join(f"old.{field} IS NOT new.{field}" for field in KEY_FIELDS)
+    conn.execute(f"""CREATE TRIGGER entries_key_hash_update AFTER UPDATE OF {', '.join(KEY_FIELDS)} ON entries
+        WHEN new.key_hash IS NOT NULL AND ({changed}) BEGIN
+            UPDATE entries SET key_hash = NULL WHERE id = new.id;
+        END""")
+    # Filling in hashes is not a change anyone following the log cares about
+    conn.execute("DROP TRIGGER entry_changes_update")
+    conn.execute(f"""CREATE TRIGGER entry_changes_update AFTER UPDATE OF {', '.join(ENTRY_FIELDS)} ON entries BEGIN
+        INSERT INTO entry_changes (entry_id, op) VALUES (new.id, 'update');
+    END""")
+
+def _add_import_jobs(conn):
+    # One row per large import committed in checkpoints (see bulk_insert's
+    # checkpoint): the file's content hash, the last source row committed so
+    # far and what is needed to carry on (kind, options as JSON) after the app
+    # was closed or crashed midway.
+    conn.execute("""CREATE TABLE import_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_hash TEXT NOT NULL, source TEXT NOT NULL, kind TEXT NOT NULL, options TEXT NOT NULL,
+        last_row INTEGER NOT NULL DEFAULT 0, entries INTEGER NOT NULL DEFAULT 0,
+        status TEXT NOT NULL DEFAULT 'running', started TEXT NOT NULL, updated TEXT NOT NULL
+    )""")
+    conn.execute("CREATE INDEX idx_import_jobs_file_hash ON import_jobs(file_hash, status)")
+
+def _add_archive_partitions(conn):
+    # One row per year whose entries were moved to an archive file (see
+    # archive_year): the file, relative to this one, and its id range
+    conn.execute("""CREATE TABLE archive_partitions (
+        year INTEGER PRIMARY KEY, path TEXT NOT NULL,
+        entries INTEGER NOT NULL, first_id INTEGER, last_id INTEGER, archived TEXT NOT NULL
+    )""")
+
+# Batches remembered for insert_entries; a retry comes within minutes
+WRITE_BATCHES_KEEP = 10000
+
+def _add_write_batches(conn):
+    # The client batch key and new ids of recent insert_entries calls, so a
+    # batch sent again after a lost answer or a crash is not saved twice
+    conn.execute("""CREATE TABLE write_batches (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT, batch TEXT NOT NULL UNIQUE, ids TEXT NOT NULL
+    )""")
+    conn.execute(f"""CREATE TRIGGER write_batches_trim AFTER INSERT ON write_batches
+        WHEN new.seq % 1000 = 0 BEGIN
+            DELETE FROM write_batches WHERE seq <= new.seq - {WRITE_BATCHES_KEEP};
+        END""")
+
+MIGRATIONS = [
+    _create_entries,
+    _normalize_dates_and_index,
+    _lead_indexes_with_date,
+    _add_search_index,
+    _add_rollups,
+    _add_change_log,
+    _add_key_hashes,
+    _add_import_jobs,
+    _add_archive_partitions,
+    _add_write_batches,
+]
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn, target=None):
+    version = schema_version(conn)
+    for number, migration in enumerate(MIGRATIONS[version:target], version + 1):
+        conn.execute("BEGIN")
+        try:
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+def is_valid_date(value):
+    return normalize_date(value) is not None
+
+def normalize_date(value):
+    # Dates are stored as zero-padded YYYY-MM-DD so text order is date order
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+
+# Thousands separated by commas, "1,200"; "1,5" is not one
+QTY_THOUSANDS = re.compile(r"[+-]?\d{1,3}(,\d{3})+(\.0*)?")
+
+def normalize_qty(value):
+    # Quantities are stored as integers: 12, "12", " 12 ", "12.0" and "1,200"
+    # are all accepted. Returns None for blanks and anything that is not a
+    # whole number; "1.5" is not rounded and "1,5" not read as 15.
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    text = str(value).strip()
+    if QTY_THOUSANDS.fullmatch(text):
+        text = text.replace(",", "")
+    try:
+        number = float(text)
+    except ValueError:
+        return None
+    return int(number) if number.is_integer() else None
+
+def has_search_index(conn, schema="main"):
+    return conn.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE name = 'entries_search'").fetchone() is not None
+
+def has_archives(conn):
+    # False on a file not yet migrated to archive partitions
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'archive_partitions'").fetchone() is not None
+
+def in_schema(schema, table):
+    # table in an attached archive partition, or unqualified for the main file
+    return table if schema == "main" else f"{schema}.{table}"
+
+# The trigram index can only answer patterns with at least three characters
+SEARCH_INDEX_MIN_LENGTH = 3
+
+def build_filter_clause(filters, use_search_index=False, schema="main"):
+    # Same filter semantics as the search panel: substring match on article and
+    # card, exact print option and an inclusive date range. Invalid dates are
+    # ignored, exactly like get_current_filters_for_export did.
+    search, where, values = split_filter_clause(filters, use_search_index)
+    if search is None:
+        return where, values
+    # LIKE on an FTS5 trigram table is answered from the index
+    search_where, search_values = search
+    return (f"id IN (SELECT rowid FROM {in_schema(schema, 'entries_search')} WHERE {search_where}) AND {where}",
+            search_values + values)
+
+def split_filter_clause(filters, use_search_index=False):
+    # build_filter_clause in two parts: (where, values) for the trigram index,
+    # or None when it is not used, and the where clause and values on entries
+    clauses = ["1=1"]
+    values = []
+    search = None
+    if filters:
+        indexed_clauses = []
+        indexed_values = []
+        for column in ("article", "card"):
+            term = filters.get(column)
+            if not term:
+                continue
+            if use_search_index and len(term) >= SEARCH_INDEX_MIN_LENGTH:
+                indexed_clauses.append(f"{column} LIKE ?")
+                indexed_values.append(f"%{term}%")
+            else:
+                clauses.append(f"{column} LIKE ?")
+                values.append(f"%{term}%")
+        if indexed_clauses:
+            # Both columns go into one query so FTS5 intersects them itself
+            search = (" AND ".join(indexed_clauses), indexed_values)
+        if filters.get("print_opt"):
+            clauses.append("print_opt = ?")
+            values.append(filters["print_opt"])
+        start_date = normalize_date(filters.get("start_date"))
+        end_date = normalize_date(filters.get("end_date"))
+        if start_date:
+            clauses.append("date >= ?")
+            values.append(start_date)
+        if end_date:
+            clauses.append("date <= ?")
+            values.append(end_date)
+    return search, " AND ".join(clauses), values
+
+def entry_matches(filters, row):
+    # build_filter_clause's filters checked against one (id, article, ...)
+    # row already in hand, e.g. one just saved. LIKE ignores ASCII case.
+    if not filters:
+        return True
+    _, article, card, _, _, _, _, print_opt, entry_date = row
+    for term, value in ((filters.get("article"), article), (filters.get("card"), card)):
+        if term and term.lower() not in (value or "").lower():
+            return False
+    if filters.get("print_opt") and print_opt != filters["print_opt"]:
+        return False
+    start_date = normalize_date(filters.get("start_date"))
+    end_date = normalize_date(filters.get("end_date"))
+    if (start_date or end_date) and entry_date is None:
+        return False
+    return not (start_date and entry_date < start_date) and not (end_date and entry_date > end_date)
+
+def filter_clause_for(conn, filters, schema="main"):
+    return build_filter_clause(filters, use_search_index=bool(filters) and has_search_index(conn, schema),
+                               schema=schema)
+
+def match_source_for(conn, filters, schema="main"):
+    # (FROM clause, id column, where, values) for walking the matches in id
+    # order. With the trigram index the matches are read from entries_search
+    # in rowid order, so a LIMIT stops after one page; an id IN (...) subquery
+    # collects every match first, over a second for a common term.
+    entries = in_schema(schema, "entries")
+    search, where, values = split_filter_clause(filters, use_search_index=bool(filters) and has_search_index(conn, schema))
+    if search is None:
+        return entries, "id", where, values
+    search_where, search_values = search
+    source = (f"(SELECT rowid AS match_id FROM {in_schema(schema, 'entries_search')} WHERE {search_where}) "
+              f"CROSS JOIN {entries} ON {entries}.id = match_id")
+    return source, "match_id", where, search_values + values
+
+def count_entries(conn, filters=None):
+    total = 0
+    for schemas in partition_batches(conn, filters):
+        for schema in attach_batch(conn, schemas):
+            where, values = filter_clause_for(conn, partition_filters(conn, filters, schema), schema)
+            total += conn.execute(f"SELECT COUNT(*) FROM {in_schema(schema, 'entries')} WHERE {where}",
+                                  values).fetchone()[0]
+    return total
+
+# --- Totals ---
+# Summaries read the entry_totals rollup: one row per group and day, so they
+# cost the number of groups in the date range, not a scan of every entry.
+
+def fetch_totals(conn, group_by, filters=None):
+    # [(group, entries, qty)] for one of TOTALS_GROUPS. The rollup can only
+    # answer the date range, plus the article filter when grouping by article;
+    # other filters are ignored. Archive partitions keep their own rollups.
+    column = TOTALS_GROUPS[group_by]
+    clauses = ["grouping = ?"]
+    values = [column]
+    if filters:
+        if column == "article" and filters.get("article"):
+            clauses.append("value LIKE ?")
+            values.append(f"%{filters['article']}%")
+        start_date = normalize_date(filters.get("start_date"))
+        end_date = normalize_date(filters.get("end_date"))
+        if start_date:
+            clauses.append("date >= ?")
+            values.append(start_date)
+        if end_date:
+            clauses.append("date <= ?")
+            values.append(end_date)
+    batches = []
+    for schemas in partition_batches(conn, filters):
+        attach_batch(conn, schemas)
+        totals = " UNION ALL ".join(f"SELECT value, entries, qty FROM {in_schema(schema, 'entry_totals')} "
+                                    f"WHERE {' AND '.join(clauses)}" for schema in schemas)
+        query = f"SELECT value, SUM(entries), SUM(qty) FROM ({totals}) GROUP BY value ORDER BY value"
+        batches.append(conn.execute(query, values * len(schemas)).fetchall())
+    if len(batches) == 1:
+        return batches[0]
+    merged = {}
+    for value, entries, qty in (row for rows in batches for row in rows):
+        previous = merged.get(value, (0, None))
+        merged[value] = (previous[0] + entries, qty if previous[1] is None else previous[1] + (qty or 0))
+    return [(value,) + merged[value] for value in sorted(merged, key=sqlite_order)]
+
+def sqlite_order(value):
+    # Sort key putting values in SQLite's ORDER BY order: NULL, numbers, text, blobs
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    return (2, value) if isinstance(value, str) else (3, value)
+
+# --- Keyset pagination on id ---
+# The dashboard never loads the whole table. It asks for the rows just after or
+# just before an id it already shows, which is an index seek on the primary key
+# no matter how deep into the table the user has scrolled.
+
+def fetch_entries_after(conn, filters, after_id, limit):
+    return select_entries(conn, filters, "> ?", [after_id], limit=limit)
+
+def fetch_entries_before(conn, filters, before_id, limit):
+    rows = select_entries(conn, filters, "< ?", [before_id], descending=True, limit=limit)
+    rows.reverse()
+    return rows
+
+def fetch_entries_at(conn, filters, offset, limit):
+    # Only used when the scrollbar is dragged to an arbitrary position; every
+    # other scroll continues from a known id through the two functions above.
+    return select_entries(conn, filters, limit=limit, offset=offset)
+
+def select_entries(conn, filters, key_bound="", bound_values=(), descending=False, limit=None, offset=0):
+    # The query behind the functions above: the matches in id order,
+    # optionally only ids key_bound ("> ?"). With archive partitions in the
+    # date range every partition returns its own first limit + offset matches
+    # and SQLite merges them, so paging still stops after one page. Archives
+    # beyond what one connection can attach are queried batch by batch and
+    # the pages merged here.
+    batches = partition_batches(conn, filters)
+    if len(batches) == 1:
+        query, values = partition_query(conn, filters, attach_batch(conn, batches[0]), key_bound, bound_values,
+                                        descending, limit + offset)
+        return conn.execute(query + " LIMIT ? OFFSET ?", values + [limit, offset]).fetchall()
+    rows = []
+    for schemas in batches:
+        query, values = partition_query(conn, filters, attach_batch(conn, schemas), key_bound, bound_values,
+                                        descending, limit + offset)
+        rows.extend(conn.execute(query + " LIMIT ?", values + [limit + offset]).fetchall())
+    rows.sort(key=lambda row: row[0], reverse=descending)
+    return rows[offset:offset + limit]
+
+def partition_query(conn, filters, schemas, key_bound="", bound_values=(), descending=False, arm_limit=-1):
+    # (query, values) selecting the matches in the attached schemas in id
+    # order, one arm per partition returning at most arm_limit rows (-1, no
+    # limit); callers append their own LIMIT
+    direction = " DESC" if descending else ""
+    selects = []
+    for schema in schemas:
+        source, key, where, values = match_source_for(conn, partition_filters(conn, filters, schema), schema)
+        if key_bound:
+            where += f" AND {key} {key_bound}"
+            values = values + list(bound_values)
+        selects.append((f"SELECT {ENTRY_COLUMNS} FROM {source} WHERE {where} ORDER BY {key}{direction}", values))
+    if len(selects) == 1:
+        return selects[0]
+    query = " UNION ALL ".join(f"SELECT * FROM ({select} LIMIT ?)" for select, _ in selects)
+    return (query + f" ORDER BY id{direction}",
+            [value for _, arm_values in selects for value in arm_values + [arm_limit]])
+
+# Largest number of ids looked up by one query, under SQLite's variable limit
+IDS_PER_QUERY = 500
+
+def fetch_entries_by_id(conn, ids, schema="main"):
+    # The entries that still exist among ids, in id order. Ids not in the main
+    # file are looked for in the archive partitions whose id range has them.
+    ids = sorted(ids)
+    rows = []
+    for start in range(0, len(ids), IDS_PER_QUERY):
+        chunk = ids[start:start + IDS_PER_QUERY]
+        query = (f"SELECT {ENTRY_COLUMNS} FROM {in_schema(schema, 'entries')} "
+                 f"WHERE id IN ({', '.join('?' * len(chunk))}) ORDER BY id")
+        rows.extend(conn.execute(query, chunk).fetchall())
+    if schema != "main" or len(rows) == len(ids) or not has_archives(conn):
+        return rows
+
+    found = {row[0] for row in rows}
+    missing = [entry_id for entry_id in ids if entry_id not in found]
+    for year, first_id, last_id in conn.execute("SELECT year, first_id, last_id FROM archive_partitions").fetchall():
+        in_range = [entry_id for entry_id in missing if first_id <= entry_id <= last_id]
+        if in_range:
+            rows.extend(fetch_entries_by_id(conn, in_range, attach_partitions(conn, [year])[0]))
+    return sorted(rows)
+
+# --- Entry batches ---
+
+def insert_entries(conn, rows, batch=None):
+    # Inserts the entry tuples and returns their new ids. batch is a key the
+    # client picked for these rows (entry_queue.EntryQueue); a batch already
+    # committed is not inserted again and the ids it got are returned.
+    if batch is not None:
+        row = conn.execute("SELECT ids FROM write_batches WHERE batch = ?", (batch,)).fetchone()
+        if row:
+            return json.loads(row[0])
+    ids = [conn.execute(INSERT_ENTRY, data).lastrowid for data in rows]
+    if batch is not None:
+        conn.execute("INSERT INTO write_batches (batch, ids) VALUES (?, ?)", (batch, json.dumps(ids)))
+    return ids
+
+# --- Change log ---
+
+CHANGES_PER_FETCH = 1000
+
+def latest_change(conn):
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM entry_changes").fetchone()[0]
+
+def fetch_changes(conn, after_seq, limit=CHANGES_PER_FETCH):
+    # (seq, entry_id, op) logged after after_seq, oldest first. The log has no
+    # gaps, so a first seq other than after_seq + 1 means it was trimmed past
+    # after_seq and the caller has to reload.
+    return conn.execute("SELECT seq, entry_id, op FROM entry_changes WHERE seq > ? ORDER BY seq LIMIT ?",
+                        (after_seq, limit)).fetchall()
+
+# Rows fetched per round trip when streaming a whole filtered result
+EXPORT_CHUNK_SIZE = 5000
+
+def iter_entries(conn, filters=None, chunk_size=EXPORT_CHUNK_SIZE):
+    # Stream every entry matching the filters in id order without fetchall().
+    # Archives that cannot all be attached at once are paged through by id.
+    batches = partition_batches(conn, filters)
+    if len(batches) > 1:
+        after_id = 0
+        while True:
+            rows = fetch_entries_after(conn, filters, after_id, chunk_size)
+            yield from rows
+            if len(rows) < chunk_size:
+                return
+            after_id = rows[-1][0]
+    query, values = partition_query(conn, filters, attach_batch(conn, batches[0]))
+    cursor = conn.execute(query, values)
+    try:
+        while True:
+            chunk = cursor.fetchmany(chunk_size)
+            if not chunk:
+                break
+            yield from chunk
+    finally:
+        cursor.close()
+
+# --- Duplicate detection ---
+
+# Positions of KEY_FIELDS in an entry tuple
+KEY_POSITIONS = tuple(ENTRY_FIELDS.index(field) for field in KEY_FIELDS)
+
+# What an import does with a row whose natural key is already stored:
+# leave the stored entry alone, overwrite its qty and print option, or add
+# the row's qty to it
+DUPLICATE_POLICIES = ("skip", "upsert", "sum")
+
+def entry_key(data):
+    # The natural key of an entry tuple; a missing value is the same as empty
+    return tuple("" if data[position] is None else str(data[position]) for position in KEY_POSITIONS)
+
+def entry_key_hash(data):
+    # entry_key as a signed 64-bit integer, what SQLite stores in key_hash
+    digest = hashlib.blake2b("\x1f".join(entry_key(data)).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+# --- Bulk loading ---
+
+BULK_BATCH_SIZE = 5000
+
+# Insert triggers that bulk_insert drops for the duration of a load, with the
+# statements that bring their targets up to date afterwards in set-based
+# passes over the new rows. The parameter is the highest id before the load.
+DEFERRED_INSERT_TRIGGERS = {
+    "entries_search_insert": (
+        "INSERT INTO entries_search(rowid, article, card) SELECT id, article, card FROM entries WHERE id > ?",
+    ),
+    "entry_totals_insert": tuple(
+        f"""INSERT INTO entry_totals (grouping, date, value, entries, qty)
+        SELECT '{column}', COALESCE(date, ''), COALESCE({column}, ''), COUNT(*), SUM({_total_qty()})
+        FROM entries WHERE id > ? GROUP BY 2, 3
+        ON CONFLICT (grouping, date, value)
+        DO UPDATE SET entries = entries + excluded.entries, qty = qty + excluded.qty"""
+        for column in TOTALS_GROUPS.values()),
+    "entry_changes_insert": (
+        "INSERT INTO entry_changes (entry_id, op) VALUES (?, 'bulk')",
+    ),
+}
+
+class BulkLoadStats:
+    # rows were inserted; duplicates is how many rows matched an entry already
+    # stored (or earlier in the same load), updated how many of those changed
+    # it. not_summed counts the rows the "sum" policy left alone because the
+    # stored Qty is not a whole number (kept as typed by the rollup
+    # migration). resumed_after is the source row a resumed import carried on
+    # after.
+    def __init__(self, rows, seconds, duplicates=0, updated=0, not_summed=0):
+        self.rows = rows
+        self.seconds = seconds
+        self.duplicates = duplicates
+        self.updated = updated
+        self.not_summed = not_summed
+        self.resumed_after = None
+
+    def add(self, other):
+        # Counts of another load that is part of the same import
+        self.rows += other.rows
+        self.duplicates += other.duplicates
+        self.updated += other.updated
+        self.not_summed += other.not_summed
+
+    @property
+    def rows_per_second(self):
+        return (self.rows + self.duplicates) / self.seconds if self.seconds > 0 else float(self.rows + self.duplicates)
+
+    def __str__(self):
+        text = f"{self.rows:,} rows in {self.seconds:.1f} s ({self.rows_per_second:,.0f} rows/s)"
+        if self.duplicates:
+            text += f", {self.duplicates:,} duplicates ({self.updated:,} entries updated)"
+        if self.not_summed:
+            text += f", {self.not_summed:,} not added to a Qty that is not a whole number"
+        return text
+
+# Connection settings for the length of a bulk load
+BULK_LOAD_PRAGMAS = {"synchronous": "NORMAL", "temp_store": "MEMORY", "cache_size": "-65536"}
+
+def tune_for_bulk_load(conn):
+    # WAL plus synchronous=NORMAL only syncs at checkpoints instead of on every
+    # commit; a power cut can lose the last commits but never corrupts the file.
+    # Returns the settings replaced, for restore_pragmas once the load is done:
+    # the connection may be the one every later save goes through. WAL stays,
+    # it is what init_db sets up anyway.
+    conn.execute("PRAGMA journal_mode=WAL")
+    previous = {name: conn.execute(f"PRAGMA {name}").fetchone()[0] for name in BULK_LOAD_PRAGMAS}
+    for name, value in BULK_LOAD_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name}={value}")
+    return previous
+
+def restore_pragmas(conn, settings):
+    for name, value in settings.items():
+        conn.execute(f"PRAGMA {name}={value}")
+
+def bulk_insert(conn, rows, batch_size=BULK_BATCH_SIZE, fast=True, defer_indexes=False, progress=None,
+                duplicates=None, checkpoint=None):
+    # Insert an iterable of entry tuples (see INSERT_ENTRY) in executemany
+    # batches inside a single transaction. progress(rows_so_far) is called after
+    # every batch and may raise to abort; the whole load is then rolled back.
+    #
+    # The deferrable insert triggers are always replaced by one catch-up
+    # statement. defer_indexes also drops the secondary indexes and rebuilds
+    # them at the end; that costs a pass over the whole table, so it only
+    # pays off when the load is large compared to what is already stored.
+    #
+    # duplicates, one of DUPLICATE_POLICIES, checks every row's natural key
+    # against the key_hash index first (see merge_duplicates); None inserts
+    # every row as it is.
+    #
+    # checkpoint, (import job id, last source row of these rows), records the
+    # job's progress in the same transaction (see record_import_checkpoint).
+    if duplicates is not None and duplicates not in DUPLICATE_POLICIES:
+        raise ValueError(f"Unknown duplicate policy '{duplicates}', use one of {', '.join(DUPLICATE_POLICIES)}.")
+    started = time.perf_counter()
+    previous = tune_for_bulk_load(conn) if fast else {}
+    try:
+        stats = _bulk_insert(conn, rows, batch_size, defer_indexes, progress, duplicates, checkpoint)
+    finally:
+        restore_pragmas(conn, previous)
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+def _bulk_insert(conn, rows, batch_size, defer_indexes, progress, duplicates, checkpoint):
+    conn.execute("BEGIN")
+    try:
+        if duplicates:
+            refresh_key_hashes(conn)
+        deferred = _drop_for_bulk_load(conn, defer_indexes, keep_key_hash_index=bool(duplicates))
+        first_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM entries").fetchone()[0]
+
+        stats = BulkLoadStats(0, 0)
+        read = 0
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            read += len(batch)
+            if duplicates:
+                conn.executemany(INSERT_HASHED_ENTRY, merge_duplicates(conn, batch, duplicates, stats))
+            else:
+                conn.executemany(INSERT_ENTRY, batch)
+                stats.rows += len(batch)
+            if progress:
+                progress(read)
+
+        _restore_after_bulk_load(conn, deferred, first_id)
+        if checkpoint:
+            record_import_checkpoint(conn, *checkpoint, stats.rows)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return stats
+
+def merge_duplicates(conn, batch, policy, stats):
+    # Applies policy to the rows of batch whose natural key is already stored
+    # or repeats an earlier row of the batch, and returns the rest as
+    # INSERT_HASHED_ENTRY tuples. Stored entries are found through the
+    # key_hash index; the keys are compared too, so a hash collision is never
+    # taken for a duplicate. With several stored entries for one key (loaded
+    # before duplicates were checked) the oldest one is used.
+    hashes = [entry_key_hash(data) for data in batch]
+    stored = {}
+    unique_hashes = list(set(hashes))
+    for start in range(0, len(unique_hashes), IDS_PER_QUERY):
+        chunk = unique_hashes[start:start + IDS_PER_QUERY]
+        for row in conn.execute(f"SELECT {ENTRY_COLUMNS} FROM entries WHERE key_hash IN "
+                                f"({', '.join('?' * len(chunk))}) ORDER BY id DESC", chunk):
+            stored[entry_key(row[1:])] = row
+
+    pending = {}
+    for data, key_hash in zip(batch, hashes):
+        key = entry_key(data)
+        existing = stored.get(key)
+        if existing is not None:
+            stats.duplicates += 1
+            entry_id, qty, print_opt = existing[0], existing[5], existing[7]
+            if policy == "upsert":
+                changed = conn.execute("UPDATE entries SET qty = ?, print_opt = ? WHERE id = ? "
+                                       "AND (qty IS NOT ? OR print_opt IS NOT ?)",
+                                       (data[4], data[6], entry_id, data[4], data[6])).rowcount
+                qty, print_opt = data[4], data[6]
+            elif policy == "sum" and data[4]:
+                # A stored Qty like "1,200" is fixed on the way; one that is
+                # not a whole number ("lots") is left for the user to correct
+                stored_qty = normalize_qty(qty)
+                if stored_qty is None and qty is not None and str(qty).strip():
+                    stats.not_summed += 1
+                    changed = 0
+                else:
+                    qty = (stored_qty or 0) + data[4]
+                    changed = conn.execute("UPDATE entries SET qty = ? WHERE id = ?", (qty, entry_id)).rowcount
+            else:
+                changed = 0
+            stats.updated += changed
+            stored[key] = existing[:5] + (qty,) + existing[6:7] + (print_opt,) + existing[8:]
+        elif key in pending:
+            stats.duplicates += 1
+            previous = pending[key]
+            if policy == "upsert":
+                pending[key] = tuple(data) + (key_hash,)
+            elif policy == "sum" and data[4]:
+                pending[key] = previous[:4] + ((previous[4] or 0) + data[4],) + previous[5:]
+        else:
+            pending[key] = tuple(data) + (key_hash,)
+    stats.rows += len(pending)
+    return list(pending.values())
+
+def refresh_key_hashes(conn, batch_size=BULK_BATCH_SIZE):
+    # Hashes the entries written without a key hash, or whose key was edited,
+    # since the last import that checked for duplicates. Returns how many.
+    hashed = 0
+    while True:
+        rows = conn.execute(f"SELECT {ENTRY_COLUMNS} FROM entries WHERE key_hash IS NULL LIMIT ?",
+                            (batch_size,)).fetchall()
+        if not rows:
+            return hashed
+        conn.executemany("UPDATE entries SET key_hash = ? WHERE id = ?",
+                         [(entry_key_hash(row[1:]), row[0]) for row in rows])
+        hashed += len(rows)
+
+def _drop_for_bulk_load(conn, defer_indexes, keep_key_hash_index=False):
+    # A load that checks for duplicates looks every row up in idx_entries_key_hash
+    objects = conn.execute("SELECT type, name, sql FROM sqlite_master "
+                           "WHERE tbl_name = 'entries' AND sql IS NOT NULL AND "
+                           "((type = 'index' AND ? AND NOT (? AND name = 'idx_entries_key_hash')) "
+                           "OR (type = 'trigger' AND name IN (%s)))"
+                           % ", ".join("?" * len(DEFERRED_INSERT_TRIGGERS)),
+                           [defer_indexes, keep_key_hash_index] + list(DEFERRED_INSERT_TRIGGERS)).fetchall()
+    for object_type, name, _ in objects:
+        conn.execute(f'DROP {object_type.upper()} "{name}"')
+    return objects
+
+def _restore_after_bulk_load(conn, deferred, first_id):
+    for object_type, name, sql in deferred:
+        conn.execute(sql)
+        if object_type == "trigger":
+            for statement in DEFERRED_INSERT_TRIGGERS[name]:
+                conn.execute(statement, (first_id,))
+
+# --- Checkpointed imports ---
+# A large import is committed every CHECKPOINT_ROWS source rows, each chunk
+# together with its import_jobs row, so a crash or a closed app loses at most
+# one chunk and importing the same file again carries on after the last
+# committed row instead of starting over.
+
+CHECKPOINT_ROWS = 50000
+
+def start_import_job(conn, file_hash, source, kind, options):
+    # (job id, last committed row, entries so far) of the unfinished job for
+    # this file content, or of a new one. options is stored as JSON.
+    row = conn.execute("SELECT id, last_row, entries FROM import_jobs WHERE file_hash = ? AND status = 'running' "
+                       "ORDER BY id DESC LIMIT 1", (file_hash,)).fetchone()
+    if row:
+        conn.execute("UPDATE import_jobs SET source = ?, options = ?, updated = datetime('now') WHERE id = ?",
+                     (source, json.dumps(options), row[0]))
+        conn.commit()
+        return row
+    job_id = conn.execute("INSERT INTO import_jobs (file_hash, source, kind, options, started, updated) "
+                          "VALUES (?, ?, ?, ?, datetime('now'), datetime('now'))",
+                          (file_hash, source, kind, json.dumps(options))).lastrowid
     conn.commit()
-    conn.close()
+    return job_id, 0, 0
+
+def record_import_checkpoint(conn, job_id, last_row, entries):
+    # Part of the transaction that inserted the entries up to last_row
+    conn.execute("UPDATE import_jobs SET last_row = ?, entries = entries + ?, updated = datetime('now') "
+                 "WHERE id = ?", (last_row, entries, job_id))
+
+def finish_import_job(conn, job_id, status="done"):
+    # status "done", or "abandoned" for a job that will not be resumed
+    conn.execute("UPDATE import_jobs SET status = ?, updated = datetime('now') WHERE id = ?", (status, job_id))
+    conn.commit()
+
+def fetch_unfinished_import_jobs(conn):
+    # [(job id, file hash, source, kind, options, last row, entries, updated)],
+    # newest first
+    rows = conn.execute("SELECT id, file_hash, source, kind, options, last_row, entries, updated FROM import_jobs "
+                        "WHERE status = 'running' ORDER BY id DESC").fetchall()
+    return [row[:4] + (json.loads(row[4]),) + row[5:] for row in rows]
+
+# --- Archive partitions ---
+# Entries from before the last ARCHIVE_KEEP_YEARS years move out of the main
+# file into one database file per year next to it (database.2023.db), with
+# the same schema: its own indexes, search index and rollups. Queries attach
+# the archives whose year overlaps the date filters and leave the rest alone,
+# so a search of this week reads the main file only, while one without dates
+# merges every partition by id. Closed years seldom change, so backups can
+# mostly skip them.
+#
+# Archived entries keep their ids; edits and deletes that miss the main file
+# go to the archive holding the entry. Duplicate checks on import cover the
+# main file only. A connection can attach at most SQLITE_LIMIT_ATTACHED
+# (normally 10) archives at once, so a query spanning more years reads them
+# in batches (partition_batches).
+
+ARCHIVE_KEEP_YEARS = 2
+
+def archive_path(db_path, year):
+    root, extension = os.path.splitext(db_path)
+    return f"{root}.{year}{extension or '.db'}"
+
+def main_path(conn):
+    return next(path for _, name, path in conn.execute("PRAGMA database_list") if name == "main")
+
+def date_span(conn, schema):
+    # (earliest, latest) date in a partition, None for both when it is empty
+    entries = in_schema(schema, "entries")
+    return conn.execute(f"SELECT (SELECT MIN(date) FROM {entries}), (SELECT MAX(date) FROM {entries})").fetchone()
+
+def partition_batches(conn, filters=None):
+    # The partitions that can hold entries in the filters' date range, "main"
+    # and archive_YEAR schema names, in batches one connection can attach
+    # together; attach_batch attaches one before it is queried. The main file
+    # is left out of a range that lies wholly in archived years, where walking
+    # its ids for a match would read all of them.
+    if not has_archives(conn):
+        return [["main"]]
+    start_date = normalize_date(filters.get("start_date")) if filters else None
+    end_date = normalize_date(filters.get("end_date")) if filters else None
+    years = [year for (year,) in conn.execute(
+        "SELECT year FROM archive_partitions WHERE year >= ? AND year <= ? ORDER BY year",
+        (int(start_date[:4]) if start_date else 0, int(end_date[:4]) if end_date else 9999))]
+    if not years:
+        return [["main"]]
+    first, last = date_span(conn, "main") if start_date or end_date else ("", "")
+    with_main = not (first is None or (end_date and first > end_date) or (start_date and last < start_date))
+    size = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    archives = [f"archive_{year}" for year in years]
+    batches = [archives[start:start + size] for start in range(0, len(archives), size)]
+    if with_main:
+        batches[0] = ["main"] + batches[0]
+    return batches
+
+def attach_batch(conn, schemas):
+    attach_partitions(conn, [int(schema[len("archive_"):]) for schema in schemas if schema != "main"])
+    return schemas
+
+def partition_filters(conn, filters, schema):
+    # filters without the date bounds that every entry of an archive is
+    # within. SQLite would otherwise walk a year-wide range of the date index
+    # and sort it by id for every page, where the id order alone stops after one.
+    if not schema.startswith("archive_") or not filters:
+        return filters
+    start_date = normalize_date(filters.get("start_date"))
+    end_date = normalize_date(filters.get("end_date"))
+    if not start_date and not end_date:
+        return filters
+    first, last = date_span(conn, schema)
+    filters = dict(filters)
+    if start_date and first is not None and start_date <= first:
+        filters["start_date"] = None
+    if end_date and last is not None and end_date >= last:
+        filters["end_date"] = None
+    return filters
+
+def attach_partitions(conn, years):
+    # Schema names of the years' archives, attaching those that are not yet;
+    # archives not needed now are detached when the connection is at its limit
+    attached = {name for _, name, _ in conn.execute("PRAGMA database_list")}
+    wanted = [f"archive_{year}" for year in years]
+    missing = [(year, schema) for year, schema in zip(years, wanted) if schema not in attached]
+    if not missing:
+        return wanted
+    limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    attached_archives = [name for name in attached if name.startswith("archive_")]
+    spare = [name for name in attached_archives if name not in wanted]
+    for name in spare[:max(0, len(attached_archives) + len(missing) - limit)]:
+        conn.execute(f"DETACH DATABASE {name}")
+    folder = os.path.dirname(main_path(conn))
+    paths = dict(conn.execute("SELECT year, path FROM archive_partitions"))
+    for year, schema in missing:
+        conn.execute(f"ATTACH DATABASE ? AS {schema}", (os.path.join(folder, paths[year]),))
+    return wanted
+
+def archive_year(conn, year):
+    # Moves the year's entries from conn's file into the year's archive and
+    # returns how many. The archive is committed first and the entries only
+    # then deleted here: SQLite in WAL mode commits attached files one by
+    # one, and a crash in between must leave copies, not lose entries. Left
+    # over copies are replaced by the next run. The caller keeps other
+    # writers out (dal.Database.write).
+    path = archive_path(main_path(conn), year)
+    date_range = (f"{year:04d}-01-01", f"{year + 1:04d}-01-01")
+    last_id = conn.execute("SELECT MAX(id) FROM entries WHERE date >= ? AND date < ?", date_range).fetchone()[0]
+    if last_id is None:
+        return 0
+    columns = ", ".join(("id",) + ENTRY_FIELDS + ("key_hash",))
+
+    # A plain rollback journal: an archive is one self-contained file
+    archive = sqlite3.connect(path, timeout=60)
+    try:
+        migrate(archive)
+        archive.execute("ATTACH DATABASE ? AS live", (main_path(conn),))
+        archive.execute("BEGIN")
+        moved = "SELECT id FROM live.entries WHERE date >= ? AND date < ? AND id <= ?"
+        archive.execute(f"DELETE FROM entries WHERE id IN ({moved})", date_range + (last_id,))
+        # Entries whose date was edited into the year after it was archived
+        # sort before the archive's newest id and go in through the triggers
+        archived_max = archive.execute("SELECT COALESCE(MAX(id), 0) FROM entries").fetchone()[0]
+        archive.execute(f"INSERT INTO entries ({columns}) SELECT {columns} FROM live.entries "
+                        f"WHERE date >= ? AND date < ? AND id <= ? ORDER BY id", date_range + (archived_max,))
+        deferred = _drop_for_bulk_load(archive, defer_indexes=False)
+        archive.execute(f"INSERT INTO entries ({columns}) SELECT {columns} FROM live.entries "
+                        f"WHERE date >= ? AND date < ? AND id > ? AND id <= ? ORDER BY id",
+                        date_range + (archived_max, last_id))
+        _restore_after_bulk_load(archive, deferred, archived_max)
+        entries, first_id, archived_last = archive.execute("SELECT COUNT(*), MIN(id), MAX(id) FROM entries").fetchone()
+        archive.commit()
+        archive.execute("DETACH DATABASE live")
+        refresh_statistics(archive)
+    except BaseException:
+        archive.rollback()
+        raise
+    finally:
+        archive.close()
+
+    conn.execute("BEGIN")
+    try:
+        # One 'archive' change instead of a delete per entry: the entries are
+        # still there for anyone reading, only in another file. The year's
+        # rollups go whole rather than entry by entry, five times faster.
+        triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' "
+                                "AND name IN ('entry_changes_delete', 'entry_totals_delete')").fetchall()
+        for name, _ in triggers:
+            conn.execute(f"DROP TRIGGER {name}")
+        deleted = conn.execute("DELETE FROM entries WHERE date >= ? AND date < ? AND id <= ?",
+                               date_range + (last_id,)).rowcount
+        conn.execute("DELETE FROM entry_totals WHERE date >= ? AND date < ?", date_range)
+        for _, sql in triggers:
+            conn.execute(sql)
+        conn.execute("INSERT INTO entry_changes (entry_id, op) VALUES (NULL, 'archive')")
+        conn.execute("INSERT INTO archive_partitions (year, path, entries, first_id, last_id, archived) "
+                     "VALUES (?, ?, ?, ?, ?, datetime('now')) ON CONFLICT (year) DO UPDATE SET "
+                     "path = excluded.path, entries = excluded.entries, first_id = excluded.first_id, "
+                     "last_id = excluded.last_id, archived = excluded.archived",
+                     (year, os.path.basename(path), entries, first_id, archived_last))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return deleted
+
+def archive_old_entries(conn, keep_years=ARCHIVE_KEEP_YEARS, today=None, progress=None):
+    # Archives every year before the last keep_years (counting this one) and
+    # returns {year: entries moved}; nothing to do costs one index lookup.
+    # progress(year) is called before each year and may raise to stop.
+    cutoff = f"{(today or datetime.now()).year - keep_years + 1:04d}-01-01"
+    moved = {}
+    # Each pass looks past the year before it, so dates that only start like
+    # one ("2019-", "2019-00-05") and sort before its range are passed over
+    # rather than picked again forever
+    start = "0000-01-01"
+    while True:
+        oldest = conn.execute("SELECT date FROM entries WHERE date >= ? AND date < ? "
+                              "AND date GLOB '[0-9][0-9][0-9][0-9]-*' ORDER BY date LIMIT 1",
+                              (start, cutoff)).fetchone()
+        if oldest is None:
+            break
+        year = int(oldest[0][:4])
+        start = f"{year + 1:04d}-01-01"
+        if not conn.execute("SELECT 1 FROM entries WHERE date >= ? AND date < ? LIMIT 1",
+                            (f"{year:04d}-01-01", start)).fetchone():
+            continue
+        if progress:
+            progress(year)
+        moved[year] = archive_year(conn, year)
+    if moved and has_search_index(conn):
+        # The search index keeps a delete marker per archived entry until
+        # merged; merging frees most of the space the archived entries took
+        conn.execute("INSERT INTO entries_search(entries_search) VALUES ('optimize')")
+        conn.commit()
+    return moved
+
+def archive_holding(conn, entry_id):
+    # The schema of the attached archive holding entry_id, or None. Attaching
+    # needs conn outside a transaction.
+    for (year,) in conn.execute("SELECT year FROM archive_partitions WHERE ? BETWEEN first_id AND last_id "
+                                "ORDER BY year", (entry_id,)).fetchall():
+        schema = attach_partitions(conn, [year])[0]
+        if conn.execute(f"SELECT 1 FROM {schema}.entries WHERE id = ?", (entry_id,)).fetchone():
+            return schema
+    return None
+
+def update_archived_entry(conn, entry_id, data):
+    # UPDATE_ENTRY for an entry that is not in the main file: changed in its
+    # archive, or moved back to the main file when its new date leaves the
+    # archive's year. Returns the rows changed. Like archive_year, a crash
+    # between the two files' commits can leave a copy in the archive.
+    schema = archive_holding(conn, entry_id)
+    if schema is None:
+        return 0
+    year = int(schema[len("archive_"):])
+    new_date = data[ENTRY_FIELDS.index("date")]
+    if new_date and f"{year:04d}-01-01" <= new_date < f"{year + 1:04d}-01-01":
+        conn.execute(f"UPDATE {schema}.entries SET article=?, card=?, color=?, size=?, qty=?, component=?, "
+                     f"print_opt=?, date=? WHERE id=?", tuple(data) + (entry_id,))
+        # The main file's log is the one every reader and cache follows
+        conn.execute("INSERT INTO main.entry_changes (entry_id, op) VALUES (?, 'update')", (entry_id,))
+    else:
+        conn.execute(f"INSERT INTO main.entries (id, {', '.join(ENTRY_FIELDS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     (entry_id,) + tuple(data))
+        conn.execute(f"DELETE FROM {schema}.entries WHERE id = ?", (entry_id,))
+        conn.execute("UPDATE archive_partitions SET entries = entries - 1 WHERE year = ?", (year,))
+    return 1
+
+def delete_archived_entry(conn, entry_id):
+    # DELETE_ENTRY for an entry that is not in the main file; returns the rows deleted
+    schema = archive_holding(conn, entry_id)
+    if schema is None:
+        return 0
+    conn.execute(f"DELETE FROM {schema}.entries WHERE id = ?", (entry_id,))
+    conn.execute("INSERT INTO main.entry_changes (entry_id, op) VALUES (?, 'delete')", (entry_id,))
+    conn.execute("UPDATE archive_partitions SET entries = entries - 1 WHERE year = ?",
+                 (int(schema[len("archive_"):]),))
+    return 1
@@ -0,0 +1,163 @@
+# entry_queue.py - Write-behind saving for the entry form
+
+# Operators scan cards back to back, so Save must not wait for the database.
+# EntryQueue takes validated entry tuples, appends each one to a small journal
+# file and returns at once. A background thread commits whatever has queued up
+# as one transaction, once GROUP_COMMIT_ROWS entries are waiting or
+# GROUP_COMMIT_INTERVAL seconds after the first one, and then drops them from
+# the journal. Entries still in the journal when the app dies (crash, closed
+# while the server was unreachable) are saved on the next start.
+#
+# The journal is flushed to the OS on every entry, which survives the app
+# crashing but not a power cut in the same instant. Each group gets a batch
+# key, written to the journal before it is sent, and the database keeps the
+# keys it committed (db.insert_entries). A group sent again, after a timeout
+# that hid a commit or a crash before the journal rewrite, is not saved twice.
+#
+# Like TaskRunner, results come back to the Tk thread through root.after:
+# on_saved(rows) gets the committed rows with their new ids in front,
+# on_error(exception) a failed commit, which is retried until it succeeds.
+
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from db import APP_FOLDER
+from tasks import POLL_INTERVAL_MS
+
+JOURNAL_PATH = os.path.join(APP_FOLDER, "pending_entries.jsonl")
+
+GROUP_COMMIT_ROWS = 50
+GROUP_COMMIT_INTERVAL = 0.5
+
+# Seconds between attempts while commits fail (database locked, server down)
+RETRY_INTERVAL = 5
+
+class EntryQueue:
+    def __init__(self, root, database, journal_path=JOURNAL_PATH, on_saved=None, on_error=None):
+        self.root = root
+        self.database = database
+        self.journal_path = journal_path
+        self.on_saved = on_saved
+        self.on_error = on_error
+        self._lock = threading.Condition()
+        self._pending, self._batch = read_journal(journal_path)
+        self._closing = False
+        self._journal = open(journal_path, "a", encoding="utf-8")
+        self._results = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="hype-entry-queue", daemon=True)
+        self._thread.start()
+        root.after(POLL_INTERVAL_MS, self._poll)
+
+    @property
+    def waiting(self):
+        # Entries submitted but not committed yet
+        with self._lock:
+            return len(self._pending)
+
+    def submit(self, data):
+        line = json.dumps(list(data), separators=(",", ":"))
+        with self._lock:
+            if self._closing:
+                raise RuntimeError("The entry queue is closed.")
+            self._journal.write(line + "\n")
+            self._journal.flush()
+            self._pending.append(tuple(data))
+            self._lock.notify()
+
+    def close(self):
+        # Commits what is still waiting; if that fails the journal keeps it
+        with self._lock:
+            self._closing = True
+            self._lock.notify()
+        self._thread.join()
+        self._journal.close()
+
+    # --- Background thread ---
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._pending and not self._closing:
+                    self._lock.wait()
+                if not self._pending:
+                    return
+                if self._batch is None:
+                    deadline = time.monotonic() + GROUP_COMMIT_INTERVAL
+                    while len(self._pending) < GROUP_COMMIT_ROWS and not self._closing:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._lock.wait(remaining)
+                    # The group is fixed from here on: a retry sends the same
+                    # rows under the same key
+                    self._batch = (uuid.uuid4().hex, len(self._pending))
+                    self._journal.write(json.dumps({"batch": self._batch[0], "rows": self._batch[1]}) + "\n")
+                    self._journal.flush()
+                batch, size = self._batch
+                group = self._pending[:size]
+
+            try:
+                ids = self.database.insert_entries(group, batch)
+            except Exception as e:
+                self._results.put(("error", e))
+                with self._lock:
+                    if self._closing:
+                        return
+                    self._lock.wait(RETRY_INTERVAL)
+                continue
+
+            with self._lock:
+                del self._pending[:len(group)]
+                self._batch = None
+                self._rewrite_journal()
+            self._results.put(("saved", [(entry_id,) + data for entry_id, data in zip(ids, group)]))
+
+    def _rewrite_journal(self):
+        # Only the entries submitted during the commit are left to keep
+        if not self._pending:
+            self._journal.seek(0)
+            self._journal.truncate()
+            return
+        self._journal.close()
+        with open(self.journal_path + ".tmp", "w", encoding="utf-8") as f:
+            for data in self._pending:
+                f.write(json.dumps(list(data), separators=(",", ":")) + "\n")
+        os.replace(self.journal_path + ".tmp", self.journal_path)
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+
+    # --- Tk thread ---
+
+    def _poll(self):
+        try:
+            while True:
+                kind, payload = self._results.get_nowait()
+                callback = self.on_saved if kind == "saved" else self.on_error
+                if callback:
+                    callback(payload)
+        except queue.Empty:
+            pass
+        if not self._closing:
+            self.root.after(POLL_INTERVAL_MS, self._poll)
+
+def read_journal(path):
+    # (entries left over from a previous run, (batch key, rows) of the group
+    # that was being sent or None); a line cut short by a crash is dropped
+    pending = []
+    batch = None
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    value = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(value, dict):
+                    batch = (value["batch"], value["rows"])
+                else:
+                    pending.append(tuple(value))
+    except FileNotFoundError:
+        pass
+    return pending, batch
@@ -1,3 +1,274 @@
-# export.py - For report generation (To be extended)
+# export.py - Report generation (Excel, CSV, PDF)
 
-# You can use openpyxl for Excel and fpdf for PDF export
+# Exports are written from an iterable of rows, normally a cursor read in
+# chunks, straight to disk (Excel through a write-only workbook). Memory stays
+# at a few thousand rows however large the export is.
+
+import csv
+import io
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate, islice
+from openpyxl import Workbook
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.rl_accel import escapePDF, fp_str
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+from importer import open_text
+
+EXPORT_HEADERS = ["ID", "Article", "Card", "Color", "Size", "Qty", "Component", "Print", "Date"]
+
+# Excel's hard limit per sheet, header row included
+EXCEL_MAX_ROWS = 1048576
+
+# Rows between progress callbacks
+PROGRESS_EVERY = 5000
+
+def export_excel(filepath, rows, progress=None):
+    # rows are entry tuples in db.ENTRY_COLUMNS order. Once a sheet is full the
+    # export continues on "Entries 2", "Entries 3", ... progress(rows_written)
+    # may raise to abort, in which case nothing is written to filepath.
+    workbook = Workbook(write_only=True)
+    sheet = None
+    sheet_rows = 0
+    sheet_count = 0
+    written = 0
+
+    for row in rows:
+        if sheet is None or sheet_rows >= EXCEL_MAX_ROWS:
+            sheet_count += 1
+            sheet = workbook.create_sheet("Entries" if sheet_count == 1 else f"Entries {sheet_count}")
+            sheet.append(EXPORT_HEADERS)
+            sheet_rows = 1
+        sheet.append(row)
+        sheet_rows += 1
+        written += 1
+        if progress and written % PROGRESS_EVERY == 0:
+            progress(written)
+
+    if sheet is None:
+        workbook.create_sheet("Entries").append(EXPORT_HEADERS)
+    workbook.save(filepath)
+    return written
+
+def export_csv(filepath, rows, progress=None):
+    # Plain CSV through the csv module, gzip-compressed when filepath ends in
+    # ".gz". Far faster than Excel and what import_csv reads back. Unlike
+    # export_excel a cancelled export leaves a partial file, which is removed.
+    written = 0
+    try:
+        with open_text(filepath, "w") as f:
+            writer = csv.writer(f)
+            writer.writerow(EXPORT_HEADERS)
+            rows = iter(rows)
+            while True:
+                chunk = list(islice(rows, PROGRESS_EVERY))
+                if not chunk:
+                    break
+                writer.writerows(chunk)
+                written += len(chunk)
+                if progress:
+                    progress(written)
+    except BaseException:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        raise
+    return written
+
+# --- PDF report ---
+# Every page has the same layout, so it is worked out once: column positions,
+# the text-origin operator of every cell slot and the title/header block.
+# A page is then those strings joined with each cell's "(text) Tj" fragment,
+# and fragments are cached per distinct value since most columns repeat a
+# handful of values. Pages are independent, which lets page ranges be
+# rendered in worker processes and stitched into one document in order.
+
+PDF_TITLE = "Laser Entries"
+PDF_CONTINUED_TITLE = "LASER Entries (Continued)"
+
+# Share of the printable width for each EXPORT_HEADERS column
+PDF_COLUMN_SHARES = [0.07, 0.18, 0.12, 0.10, 0.08, 0.06, 0.18, 0.09, 0.12]
+
+# Registered in this order on every canvas so the internal font names
+# (/F1, /F2, ...) in pages rendered by workers match the document's.
+# Symbol and ZapfDingbats are reportlab's fallbacks for unencodable characters.
+PDF_FONTS = ["Helvetica", "Helvetica-Bold", "Symbol", "ZapfDingbats"]
+PDF_BODY_FONT = ("Helvetica", 8)
+
+# Distinct cell values remembered before the text cache is reset
+PDF_TEXT_CACHE_SIZE = 50000
+
+# Pages handed to a worker process at a time
+PDF_PAGES_PER_TASK = 25
+
+class PdfPageRenderer:
+    def __init__(self, pdf_canvas, pagesize=A4, margin=40, line_height=16, header_line_height=20):
+        self.canvas = pdf_canvas
+        for font in PDF_FONTS:
+            pdf_canvas.setFont(font, PDF_BODY_FONT[1])
+        pdf_canvas.setFont(*PDF_BODY_FONT)
+
+        width, height = pagesize
+        available_width = width - 2 * margin
+        self.widths = [available_width * share for share in PDF_COLUMN_SHARES]
+        columns_x = [margin + offset for offset in accumulate([0] + self.widths[:-1])]
+
+        title_y = height - margin
+        header_y = title_y - header_line_height * 1.5
+        rule_y = header_y - line_height * 0.5
+        first_row_y = rule_y - line_height * 0.8
+        rows_y = []
+        y = first_row_y
+        while y >= margin + line_height:
+            rows_y.append(y)
+            y -= line_height
+        self.rows_per_page = len(rows_y)
+        self.cell_origins = [[f"1 0 0 1 {fp_str(x, y)} Tm" for x in columns_x] for y in rows_y]
+
+        # The page's text object is left open after the header block and
+        # closed after the last row, followed by the rule under the headers
+        self.page_headers = {first: self._header_block(title, margin, title_y, header_y, columns_x)
+                             for first, title in [(True, PDF_TITLE), (False, PDF_CONTINUED_TITLE)]}
+        self.page_footer = f"ET n {fp_str(margin, rule_y)} m {fp_str(width - margin, rule_y)} l S"
+
+        self._empty_text = self._text_code(pdf_canvas.beginText())
+        self.text_cache = {}
+
+    def _text_code(self, text_object):
+        # Operators of an open text object, without the closing "ET"
+        return text_object.getCode()[:-len(" ET")]
+
+    def _header_block(self, title, margin, title_y, header_y, columns_x):
+        text = self.canvas.beginText()
+        text.setFont("Helvetica-Bold", 14)
+        text.setTextOrigin(margin, title_y)
+        text.textOut(title)
+        text.setFont("Helvetica-Bold", 9)
+        for x, header in zip(columns_x, EXPORT_HEADERS):
+            text.setTextOrigin(x, header_y)
+            text.textOut(header)
+        text.setFont(*PDF_BODY_FONT)
+        return self._text_code(text)
+
+    def fit(self, column, text):
+        # Cut text to the column width with a trailing "...", measured with
+        # the font's real metrics
+        width = self.widths[column]
+        if stringWidth(text, *PDF_BODY_FONT) <= width:
+            return text
+        # Longest prefix that still fits with the ellipsis, by bisection
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if stringWidth(text[:middle] + "...", *PDF_BODY_FONT) <= width:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:low] + "..."
+
+    def cell(self, column, value):
+        key = (column, value)
+        try:
+            return self.text_cache[key]
+        except KeyError:
+            pass
+        fitted = self.fit(column, "" if value is None else str(value))
+        if fitted.isascii():
+            fragment = f"({escapePDF(fitted)}) Tj"
+        else:
+            # Let reportlab encode it, switching to a fallback font if needed
+            text = self.canvas.beginText()
+            text.setFont(*PDF_BODY_FONT)
+            text.textOut(fitted)
+            fragment = self._text_code(text)[len(self._empty_text):]
+        if len(self.text_cache) >= PDF_TEXT_CACHE_SIZE:
+            self.text_cache.clear()
+        self.text_cache[key] = fragment
+        return fragment
+
+    def page(self, rows, first=False):
+        # Content stream of one page holding up to rows_per_page rows
+        parts = [self.page_headers[first]]
+        cell = self.cell
+        for origins, row in zip(self.cell_origins, rows):
+            for column, (origin, value) in enumerate(zip(origins, row)):
+                parts.append(origin)
+                parts.append(cell(column, value))
+        parts.append(self.page_footer)
+        return " ".join(parts)
+
+def iter_pages(rows, rows_per_page):
+    rows = iter(rows)
+    while True:
+        page = list(islice(rows, rows_per_page))
+        if not page:
+            return
+        yield page
+
+# Per-process renderer for parallel exports, built once by _init_worker
+_worker_renderer = None
+
+def _init_worker(pagesize):
+    global _worker_renderer
+    _worker_renderer = PdfPageRenderer(canvas.Canvas(io.BytesIO(), pagesize=pagesize), pagesize)
+
+def _render_pages(first_page_number, pages):
+    return [_worker_renderer.page(rows, first_page_number + offset == 0)
+            for offset, rows in enumerate(pages)]
+
+def render_pages_parallel(pages, pagesize=A4, workers=None):
+    # Yields (content stream, row count) for each page, in order. Page ranges
+    # are rendered in a process pool with a bounded number in flight, so rows
+    # keep streaming from the cursor instead of being read up front.
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(pagesize,)) as pool:
+        in_flight = deque()
+        max_in_flight = 2 * workers
+        page_number = 0
+        pages = iter(pages)
+        try:
+            while True:
+                batch = list(islice(pages, PDF_PAGES_PER_TASK))
+                if batch:
+                    in_flight.append((pool.submit(_render_pages, page_number, batch), [len(p) for p in batch]))
+                    page_number += len(batch)
+                if not in_flight:
+                    return
+                if batch and len(in_flight) < max_in_flight:
+                    continue
+                future, counts = in_flight.popleft()
+                yield from zip(future.result(), counts)
+        finally:
+            for future, _ in in_flight:
+                future.cancel()
+
+def export_pdf(filepath, rows, progress=None, workers=1, pagesize=A4):
+    # rows are entry tuples in db.ENTRY_COLUMNS order. workers > 1 (or None
+    # for one per core) renders page ranges in worker processes. The canvas
+    # only writes filepath on save, so if progress(rows_written) raises to
+    # abort nothing is written.
+    pdf_canvas = canvas.Canvas(filepath, pagesize=pagesize)
+    renderer = PdfPageRenderer(pdf_canvas, pagesize)
+    pages = iter_pages(rows, renderer.rows_per_page)
+    if workers == 1:
+        rendered = ((renderer.page(page, page_number == 0), len(page))
+                    for page_number, page in enumerate(pages))
+    else:
+        rendered = render_pages_parallel(pages, pagesize, workers)
+
+    written = 0
+    next_progress = PROGRESS_EVERY
+    for content, row_count in rendered:
+        pdf_canvas.addLiteral(content)
+        pdf_canvas.showPage()
+        written += row_count
+        if progress and written >= next_progress:
+            progress(written)
+            next_progress = written + PROGRESS_EVERY
+
+    if not written:
+        pdf_canvas.addLiteral(renderer.page([], first=True))
+        pdf_canvas.showPage()
+    pdf_canvas.save()
+    return written
@@ -0,0 +1,142 @@
+# images.py - Article photos, stored once per content, with cached thumbnails
+
+# Uploaded photos are copied in COPY_CHUNK_BYTES blocks while being hashed and
+# stored as originals/<hash>.<ext>, so the same photo uploaded for a dozen
+# articles (or twice for one) takes the space of one. articles.json maps each
+# article to its photo; a new upload for an article replaces the link, never
+# another article's file. Thumbnails are rendered once per photo and size
+# with Pillow into thumbnails/ as PNG, which Tk reads without Pillow.
+#
+# Photos uploaded before the store existed sit in the working folder's
+# images/<article>.<ext>; they are taken into the store the first time they
+# are looked up.
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from db import APP_FOLDER
+
+IMAGES_FOLDER = os.path.join(APP_FOLDER, "images")
+LEGACY_IMAGES_FOLDER = "images"
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+COPY_CHUNK_BYTES = 1024 * 1024
+
+THUMBNAIL_SIZE = (160, 160)
+
+# Thumbnails kept decoded for the preview pane, least recently shown first out
+THUMBNAIL_CACHE_SIZE = 256
+
+def safe_name(article):
+    # The legacy file name of an article's photo, and its key in the index
+    return "".join(c if c.isalnum() else "_" for c in article)
+
+class ImageStore:
+    def __init__(self, folder=IMAGES_FOLDER, legacy_folder=LEGACY_IMAGES_FOLDER):
+        self.folder = folder
+        self.legacy_folder = legacy_folder
+        self.originals = os.path.join(folder, "originals")
+        self.thumbnails = os.path.join(folder, "thumbnails")
+        self.index_path = os.path.join(folder, "articles.json")
+        os.makedirs(self.originals, exist_ok=True)
+        os.makedirs(self.thumbnails, exist_ok=True)
+        self._lock = threading.Lock()
+        self._index = self._read_index()
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write_index(self):
+        with open(self.index_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self._index, f, indent=0, sort_keys=True)
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+    def add(self, article, filepath):
+        # Stores the photo at filepath for article and returns (stored path,
+        # True if its content was new to the store)
+        extension = os.path.splitext(filepath)[1].lower()
+        if extension not in IMAGE_EXTENSIONS:
+            raise ValueError(f"Unsupported image type '{extension}', use {', '.join(IMAGE_EXTENSIONS)}.")
+        digest = hashlib.blake2b(digest_size=16)
+        temp_path = os.path.join(self.originals, f".upload-{threading.get_ident()}{extension}")
+        try:
+            with open(filepath, "rb") as src, open(temp_path, "wb") as dst:
+                for block in iter(lambda: src.read(COPY_CHUNK_BYTES), b""):
+                    digest.update(block)
+                    dst.write(block)
+            name = digest.hexdigest() + extension
+            stored = os.path.join(self.originals, name)
+            is_new = not os.path.exists(stored)
+            if is_new:
+                os.replace(temp_path, stored)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        with self._lock:
+            self._index[safe_name(article)] = name
+            self._write_index()
+        return stored, is_new
+
+    def original_path(self, article):
+        # The article's photo, or None
+        with self._lock:
+            name = self._index.get(safe_name(article))
+        if name is not None:
+            path = os.path.join(self.originals, name)
+            if os.path.exists(path):
+                return path
+        for extension in IMAGE_EXTENSIONS:
+            legacy_path = os.path.join(self.legacy_folder, safe_name(article) + extension)
+            if os.path.exists(legacy_path):
+                return self.add(article, legacy_path)[0]
+        return None
+
+    def thumbnail_path(self, article, size=THUMBNAIL_SIZE):
+        # A PNG of the article's photo fitted into size, rendered on first use;
+        # None without a photo. Decoding a phone photo takes a while, so call
+        # this off the Tk thread.
+        original = self.original_path(article)
+        if original is None:
+            return None
+        content_hash = os.path.splitext(os.path.basename(original))[0]
+        path = os.path.join(self.thumbnails, f"{content_hash}_{size[0]}x{size[1]}.png")
+        if not os.path.exists(path):
+            from PIL import Image
+            with Image.open(original) as img:
+                img.draft("RGB", size)  # JPEG: decode at a fraction of full size
+                img.thumbnail(size)
+                img.save(path + f".{threading.get_ident()}.tmp", format="PNG")
+            os.replace(path + f".{threading.get_ident()}.tmp", path)
+        return path
+
+class ThumbnailCache:
+    # Decoded thumbnails (Tk PhotoImages, or None for articles without a
+    # photo) by article, for the Tk thread only
+    def __init__(self, capacity=THUMBNAIL_CACHE_SIZE):
+        self.capacity = capacity
+        self._images = OrderedDict()
+
+    def __contains__(self, article):
+        return article in self._images
+
+    def get(self, article):
+        image = self._images.get(article)
+        if article in self._images:
+            self._images.move_to_end(article)
+        return image
+
+    def put(self, article, image):
+        self._images[article] = image
+        self._images.move_to_end(article)
+        while len(self._images) > self.capacity:
+            self._images.popitem(last=False)
+
+    def forget(self, article):
+        self._images.pop(article, None)
@@ -0,0 +1,342 @@
+# importer.py - Streaming Excel and CSV import
+
+# Sheets are opened read-only and walked once with iter_rows(values_only=True),
+# so memory stays flat no matter how many rows the file has. Each mapped
+# column gets its converter looked up once per import instead of re-running
+# the whole conditional chain for every cell.
+
+import csv
+import gzip
+import hashlib
+import os
+from collections import Counter
+from datetime import date
+from functools import partial
+from itertools import islice
+from db import normalize_qty
+from dates import DateNormalizer
+
+# Headers are in row 2 of the production sheets, data starts in row 3
+HEADER_ROW = 2
+DATA_START_ROW = HEADER_ROW + 1
+
+SKIP = "-- Skip --"
+
+# Mapping window field name -> position in the entries INSERT tuple
+IMPORT_FIELDS = ["Article", "Card", "Color", "Size", "Qty", "Component", "Print", "Date"]
+
+class RowSkipped(Exception):
+    pass
+
+# --- Row problems ---
+# An import reports what it fixed up or skipped through an error sink:
+# errors.add(field, outcome, message) for the row in errors.row, where
+# outcome is "fixed" (a value was replaced, the row is imported) or
+# "skipped". Sheets with tens of thousands of bad rows must not turn into
+# tens of thousands of strings held in memory and shown in one messagebox.
+
+# Example messages kept for the summary; the rest only go to the report file
+ERROR_SAMPLE_LIMIT = 200
+
+OUTCOMES = {"fixed": "values replaced", "skipped": "rows skipped"}
+
+class ImportErrors:
+    # Counts problems per field and outcome, keeps the first sample_limit as
+    # examples and streams every one to a CSV at report_path, which is only
+    # created once there is something to write
+    def __init__(self, report_path=None, sample_limit=ERROR_SAMPLE_LIMIT):
+        self.report_path = report_path
+        self.sample_limit = sample_limit
+        self.counts = Counter()
+        self.samples = []
+        self.total = 0
+        self.source = ""
+        self.row = None
+        self._file = None
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.total
+
+    def __iter__(self):
+        # The example messages, "file: Row N: message"
+        return iter(self.samples)
+
+    def add(self, field, outcome, message):
+        self.record(self.source, self.row, field, outcome, message)
+
+    def extend(self, source, problems):
+        # (row, field, outcome, message) tuples collected elsewhere, e.g. by a
+        # CollectedErrors in a worker process
+        for row, field, outcome, message in problems:
+            self.record(source, row, field, outcome, message)
+
+    def record(self, source, row, field, outcome, message):
+        self.total += 1
+        self.counts[(field or "Row", outcome)] += 1
+        if len(self.samples) < self.sample_limit:
+            location = f"Row {row}: " if row is not None else ""
+            self.samples.append(f"{source}: {location}{message}" if source else f"{location}{message}")
+        if self.report_path:
+            if self._writer is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.report_path)), exist_ok=True)
+                self._file = open(self.report_path, "w", encoding="utf-8", newline="")
+                self._writer = csv.writer(self._file)
+                self._writer.writerow(["File", "Row", "Field", "Outcome", "Message"])
+            self._writer.writerow([source, row, field or "", outcome, message])
+
+    @property
+    def has_report(self):
+        return self._writer is not None
+
+    def summary(self):
+        # One line per field and outcome, most frequent first
+        return [f"{field}: {count:,} {'files skipped' if field == 'File' else OUTCOMES[outcome]}"
+                for (field, outcome), count in self.counts.most_common()]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+class CollectedErrors(list):
+    # The same sink as a plain list of (row, field, outcome, message), for
+    # worker processes and callers without a report
+    row = None
+
+    def add(self, field, outcome, message):
+        self.append((self.row, field, outcome, message))
+
+# --- Converters ---
+# Every converter takes the raw cell value and a warn(message) callback and
+# returns the value to store.
+
+def convert_text(value, warn):
+    return "" if value is None else str(value).strip()
+
+def convert_print(value, warn):
+    if value is None:
+        return "No"
+    print_opt = str(value).strip().capitalize()
+    if print_opt not in ("Yes", "No"):
+        warn(f"Invalid 'Print' value '{value}'. Using 'No'.")
+        return "No"
+    return print_opt
+
+def convert_qty(value, warn):
+    if value is None or str(value).strip() == "":
+        return None
+    qty = normalize_qty(value)
+    if qty is None:
+        warn(f"Invalid 'Qty' value '{value}'. Leaving it empty.")
+    return qty
+
+def constant(default):
+    return lambda value, warn: default
+
+def default_mapping(headers):
+    # Every field mapped to the column whose header is the field's own name
+    header_names = {str(h) for h in headers or ()}
+    return {field: field if field in header_names else SKIP for field in IMPORT_FIELDS}
+
+def compile_converters(mapping, header_cells, today):
+    # Resolve each mapped header to its real column position in the sheet
+    # (blank header cells still take up a column) and pick its converter.
+    positions = {}
+    for index, cell in enumerate(header_cells):
+        if cell is not None:
+            positions.setdefault(str(cell), index)
+
+    converters = []
+    for field in IMPORT_FIELDS:
+        column = positions.get(str(mapping.get(field, SKIP))) if mapping.get(field, SKIP) != SKIP else None
+        if field == "Print":
+            convert = convert_print
+            default = "No"
+        elif field == "Qty":
+            convert = convert_qty
+            default = None
+        elif field == "Date":
+            # Sniffs the column's date format once and memoizes repeated dates
+            convert = DateNormalizer(today).convert
+            default = today
+        else:
+            convert = convert_text
+            default = ""
+        converters.append((column, convert if column is not None else constant(default), field))
+    return converters
+
+def convert_row(row, converters, warners):
+    # warners holds each converter's warn(message), see convert_rows
+    width = len(row)
+    data = tuple(convert(row[column] if column is not None and column < width else None, warn)
+                 for (column, convert, _), warn in zip(converters, warners))
+    if not data[0]:
+        raise RowSkipped("Missing required Article data. Skipping row.")
+    return data
+
+# --- Sheet reader ---
+
+class SheetReader:
+    def __init__(self, filepath):
+        # openpyxl takes longer to import than the login window takes to
+        # appear, so it is only loaded once a workbook is actually opened
+        from openpyxl import load_workbook
+        self.workbook = load_workbook(filepath, read_only=True)
+        self.sheet = self.workbook.active
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.workbook.close()
+
+    @property
+    def total_rows(self):
+        # From the sheet's dimension tag; only used for progress
+        return max(0, (self.sheet.max_row or 0) - DATA_START_ROW + 1)
+
+    def header_cells(self):
+        for row in self.sheet.iter_rows(min_row=HEADER_ROW, max_row=HEADER_ROW, values_only=True):
+            return row
+        return None
+
+    def headers(self):
+        cells = self.header_cells()
+        if cells is None:
+            return None
+        return [h for h in cells if h is not None]
+
+    def rows(self, mapping, errors, today=None, start_row=None):
+        # Yields (row_index, entry tuple) for every importable row and reports
+        # everything that was fixed up or skipped to the errors sink.
+        # start_row skips the rows before it, e.g. to resume an import.
+        converters = compile_converters(mapping, self.header_cells() or (), today or str(date.today()))
+        first_row = max(DATA_START_ROW, start_row or 0)
+        raw_rows = self.sheet.iter_rows(min_row=first_row, values_only=True)
+        return convert_rows(raw_rows, first_row, converters, errors)
+
+def convert_rows(raw_rows, first_row_index, converters, errors):
+    # One warn per field for the whole import; the row comes from errors.row
+    warners = [partial(errors.add, field, "fixed") for _, _, field in converters]
+    for row_index, row in enumerate(raw_rows, first_row_index):
+        errors.row = row_index
+        try:
+            yield row_index, convert_row(row, converters, warners)
+        except RowSkipped as e:
+            errors.add("Article", "skipped", str(e))
+        except Exception as e:
+            errors.add(None, "skipped", f"Error processing row - {e}. Skipping row.")
+
+def read_headers(filepath):
+    with SheetReader(filepath) as reader:
+        return reader.headers()
+
+# --- CSV import ---
+# CSV files written by export.export_csv (optionally gzip-compressed) have a
+# single header row using the mapping window's field names, so they import
+# without a mapping dialog. Values still go through the same converters.
+
+class CsvReader:
+    def __init__(self, filepath):
+        self.file = open_text(filepath, "r")
+        self.reader = csv.reader(self.file)
+        self.header = next(self.reader, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def headers(self):
+        return [h for h in self.header if h] if self.header is not None else None
+
+    def mapping(self):
+        return default_mapping(self.headers())
+
+    def rows(self, errors, today=None, start_row=None):
+        if "Article" not in (self.headers() or ()):
+            raise ValueError("CSV file has no 'Article' column in its header row.")
+        converters = compile_converters(self.mapping(), self.header or (), today or str(date.today()))
+        # Data starts on line 2 of the file; empty lines are skipped silently
+        # and not counted. start_row skips the rows before it.
+        first_row = max(2, start_row or 0)
+        raw_rows = islice((row for row in self.reader if row), first_row - 2, None)
+        return convert_rows(raw_rows, first_row, converters, errors)
+
+def file_hash(filepath):
+    # Content hash identifying a file across renames, for resuming its import
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def open_text(filepath, mode):
+    # "utf-8-sig" on read also accepts files saved by Excel with a BOM
+    encoding = "utf-8-sig" if mode == "r" else "utf-8"
+    if filepath.lower().endswith(".gz"):
+        return gzip.open(filepath, mode + "t", encoding=encoding, newline="", compresslevel=1)
+    return open(filepath, mode, encoding=encoding, newline="")
+
+# --- Folder / batch import ---
+
+def find_workbooks(folder):
+    # Excel keeps "~$name.xlsx" lock files next to open workbooks; skip them
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                  if name.lower().endswith(".xlsx") and not name.startswith("~$"))
+
+def parse_workbook(filepath, mapping, today):
+    # Runs in a worker process: returns (filepath, entry tuples, problems as
+    # CollectedErrors tuples)
+    errors = CollectedErrors()
+    try:
+        with SheetReader(filepath) as reader:
+            rows = [data for _, data in reader.rows(mapping, errors, today)]
+    except Exception as e:
+        return filepath, [], [(None, "File", "skipped", f"Could not read file - {e}. Skipping file.")]
+    return filepath, rows, list(errors)
+
+def iter_parsed_workbooks(filepaths, mapping, workers=None, today=None):
+    # Yields parse_workbook results in the order of filepaths, parsing several
+    # workbooks at once in a process pool (one process per core by default).
+    # The order fixes entry ids and which copy of a repeated row is the one
+    # kept, so a folder import gives the same result every time.
+    today = today or str(date.today())
+    if len(filepaths) <= 1 or workers == 1:
+        for filepath in filepaths:
+            yield parse_workbook(filepath, mapping, today)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(parse_workbook, filepath, mapping, today) for filepath in filepaths]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+def iter_workbook_rows(filepaths, mapping, errors, workers=None, progress=None):
+    # The entry tuples of many workbooks parsed in parallel, with each file's
+    # problems added to errors (an ImportErrors). progress(files_done,
+    # files_total) may raise to cancel.
+    for files_done, (filepath, rows, file_errors) in enumerate(
+            iter_parsed_workbooks(filepaths, mapping, workers), 1):
+        errors.extend(os.path.basename(filepath), file_errors)
+        yield from rows
+        if progress:
+            progress(files_done, len(filepaths))
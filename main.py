@@ -1,7 +1,10 @@
 # main.py - Main Application UI
 
 from tkinter import *
+from multiprocessing import freeze_support
 from welcome import show_welcome
 
 if __name__ == '__main__':
+    # Folder imports parse workbooks in worker processes; needed for frozen builds
+    freeze_support()
     show_welcome()
@@ -1,29 +1,39 @@
 from tkinter import *
 from tkinter import filedialog, messagebox
-from tkinter.ttk import Treeview, OptionMenu
-import sqlite3
+from tkinter.ttk import Treeview, OptionMenu, Progressbar
 import os
-from datetime import date, datetime
-from openpyxl import Workbook, load_workbook
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-
-# Create safe writable path
-APP_FOLDER = os.path.join(os.getenv('APPDATA'), 'HypeProduction')
-os.makedirs(APP_FOLDER, exist_ok=True)
-
-DB_NAME = os.path.join(APP_FOLDER, 'database.db')
-
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS entries (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        article TEXT, card TEXT, color TEXT, size TEXT,
-        qty INTEGER, component TEXT, print_opt TEXT, date TEXT
-    )''')
-    conn.commit()
-    conn.close()
+from datetime import datetime
+from db import TOTALS_GROUPS, entry_matches, is_valid_date, normalize_date, normalize_qty
+from paged_grid import PagedGrid
+from query_cache import filter_key
+from tasks import TaskRunner
+from entry_queue import EntryQueue
+from images import ImageStore, ThumbnailCache
+from importer import read_headers, find_workbooks, HEADER_ROW
+from utils import get_import_duplicates, get_import_mapping, set_import_duplicates, set_import_mapping
+import service
+
+# How often the dashboard picks up entries changed elsewhere
+CHANGE_POLL_MS = 1000
+
+# Pause in typing after which the search fields are searched for
+SEARCH_DEBOUNCE_MS = 250
+
+# The import window's choices for rows already imported (db.DUPLICATE_POLICIES)
+DUPLICATE_CHOICES = {"Skip them": "skip", "Update Qty and Print": "upsert", "Add to Qty": "sum", "Import again": None}
+
+def duplicates_note(stats):
+    if not stats.duplicates:
+        return ""
+    note = f"\n{stats.duplicates} rows were already imported ({stats.updated} entries updated)."
+    if stats.not_summed:
+        note += f"\n{stats.not_summed} were not added because the stored Qty is not a whole number."
+    return note
+
+def resumed_note(stats):
+    if not stats.resumed_after:
+        return ""
+    return f"\nCarried on after row {stats.resumed_after:,}, where an earlier import of this file stopped."
 
 def show_main_ui():
     root = Tk()
@@ -33,68 +43,85 @@ def show_main_ui():
 
     # --- Define functions that will be used by widgets ---
 
-    def update_dashboard(filtered_data=None):
-        # Clear existing treeview items
-        for row_in_tree in tree.get_children():
-            tree.delete(row_in_tree)
+    def update_dashboard(filtered_data=None, keep_position=False):
+        current_filters.clear()
+        if filtered_data:
+            if filtered_data.get("start_date") and not is_valid_date(filtered_data["start_date"]):
+                messagebox.showwarning("Filter Error", f"Invalid start date format: {filtered_data['start_date']}. Use<ctrl97>MM-DD.")
+            if filtered_data.get("end_date") and not is_valid_date(filtered_data["end_date"]):
+                messagebox.showwarning("Filter Error", f"Invalid end date format: {filtered_data['end_date']}. Use<ctrl97>MM-DD.")
+            current_filters.update(filtered_data)
+
+        # A newer search supersedes the one still running
+        for task in dashboard_tasks:
+            task.cancel()
+        dashboard_tasks.clear()
+
+        filters = dict(current_filters)
+        top = grid.top if keep_position else 0
+        visible = grid.visible
+        window = grid.visible + 2 * grid.prefetch
+        first_page_shown = []
+
+        def load(task):
+            # Cancelling the task (a newer search) aborts the running statement
+            # through task.watch's progress handler
+            with database.reading(task.watch) as reader:
+                # Changes logged from here on are applied by follow_changes
+                seq = reader.latest_change()
+                if not top:
+                    # A new search: the first page is a keyset query that stops
+                    # after one window of matches, so it is shown before the
+                    # COUNT(*) has gone through the whole result
+                    rows = reader.fetch_entries_after(filters, 0, window)
+                    if len(rows) < window:
+                        return seq, len(rows), rows, 0
+                    task.partial((seq, rows))
+                    return seq, reader.count_entries(filters), rows, 0
+                total = reader.count_entries(filters)
+                buffer_start = max(0, min(top, total - visible) - grid.prefetch)
+                rows = reader.fetch_entries_at(filters, buffer_start, window)
+            return seq, total, rows, buffer_start
+
+        def show(seq, total, rows, buffer_start):
+            change_seq[0] = seq
+            # Only the visible window is fetched; the scrollbar is sized from COUNT(*)
+            grid.set_source(
+                lambda: grid_reader.count_entries(filters),
+                lambda after_id, limit: grid_reader.fetch_entries_after(filters, after_id, limit),
+                lambda before_id, limit: grid_reader.fetch_entries_before(filters, before_id, limit),
+                lambda offset, limit: grid_reader.fetch_entries_at(filters, offset, limit),
+            )
+            grid.load(total, rows, buffer_start, top)
 
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
+        def first_page(result):
+            # Scrolls within the first page until the count arrives
+            seq, rows = result
+            first_page_shown.append(True)
+            show(seq, len(rows), rows, 0)
 
-        query = "SELECT * FROM entries WHERE 1=1"
-        values = []
+        def loaded(result):
+            if first_page_shown:
+                grid.set_total(result[1])
+            else:
+                show(*result)
 
-        if filtered_data:
-            if filtered_data.get("article"):
-                query += " AND article LIKE ?"
-                values.append(f"%{filtered_data['article']}%")
-            if filtered_data.get("card"):
-                query += " AND card LIKE ?"
-                values.append(f"%{filtered_data['card']}%")
-            if filtered_data.get("print_opt"):
-                query += " AND print_opt = ?"
-                values.append(filtered_data["print_opt"])
-
-            start_date_val = filtered_data.get("start_date")
-            end_date_val = filtered_data.get("end_date")
-
-            if start_date_val:
-                try:
-                    datetime.strptime(start_date_val, '%Y-%m-%d')
-                    query += " AND date >= ?"
-                    values.append(start_date_val)
-                except ValueError:
-                    messagebox.showwarning("Filter Error", f"Invalid start date format: {start_date_val}. Use<ctrl97>MM-DD.")
-            if end_date_val:
-                try:
-                    datetime.strptime(end_date_val, '%Y-%m-%d')
-                    query += " AND date <= ?"
-                    values.append(end_date_val)
-                except ValueError:
-                    messagebox.showwarning("Filter Error", f"Invalid end date format: {end_date_val}. Use<ctrl97>MM-DD.")
-
-        c.execute(query, values)
-        rows = c.fetchall()
-        for r_data in rows:
-            tree.insert('', END, values=r_data)
-        conn.close()
+        dashboard_tasks.append(runner.submit("Searching", load, on_done=loaded, on_partial=first_page,
+                                             on_error=lambda e: messagebox.showerror("Search Error", f"Failed to load entries: {e}")))
 
     def save_entry():
-        data = (
-            article_entry.get(), card_entry.get(), color_entry.get(),
-            size_entry.get(), qty_entry.get(), component_entry.get(),
-            print_var.get(), str(date.today())
-        )
-        if not article_entry.get():
-            messagebox.showerror("Error", "Article fields cannot be empty.")
+        try:
+            data = service.validate_entry(
+                article_entry.get(), card_entry.get(), color_entry.get(),
+                size_entry.get(), qty_entry.get(), component_entry.get(),
+                print_var.get()
+            )
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
             return
 
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute("INSERT INTO entries (article, card, color, size, qty, component, print_opt, date) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", data)
-        conn.commit()
-        conn.close()
-        messagebox.showinfo("Saved", "Entry saved successfully.")
+        # Acknowledged at once: the entry queue commits it in the background
+        entry_queue.submit(data)
         article_entry.delete(0, END)
         card_entry.delete(0, END)
         color_entry.delete(0, END)
@@ -102,7 +129,73 @@ def show_main_ui():
         qty_entry.delete(0, END)
         component_entry.delete(0, END)
         print_var.set("Yes")
-        update_dashboard()
+        article_entry.focus_set()
+        show_save_status()
+
+    def follow_changes(follow=False):
+        # Applies the entries changed since the grid was loaded (here, by the
+        # entry queue or by other windows and stations) to the buffered rows
+        # only, keeping the scroll position and selection. follow scrolls to
+        # rows added at the end.
+        if grid.count_rows is None or any(not task.done for task in dashboard_tasks):
+            return
+        try:
+            changes = grid_reader.fetch_changes(change_seq[0])
+        except Exception:
+            return
+        if not changes:
+            return
+        if changes[0][0] != change_seq[0] + 1:
+            # Fell behind the trimmed change log
+            update_dashboard(dict(current_filters), keep_position=True)
+            return
+        change_seq[0] = changes[-1][0]
+
+        ops = {}
+        recount = False
+        for _, entry_id, op in changes:
+            if op in ("bulk", "archive"):
+                recount = True
+            else:
+                ops[entry_id] = op
+        found = {row[0]: row for row in grid_reader.fetch_entries_by_id(
+            [entry_id for entry_id, op in ops.items() if op != "delete"])}
+        matching = {entry_id: row for entry_id, row in found.items() if entry_matches(current_filters, row)}
+
+        # Ids outside the buffer only matter for the row count, unless they are
+        # inserts that never matched the search anyway
+        missing_ids = grid.remove_rows([entry_id for entry_id in ops if entry_id not in matching])
+        recount = recount or any(ops[entry_id] != "insert" for entry_id in missing_ids)
+        missing_rows = grid.replace_rows([matching[entry_id] for entry_id in sorted(matching)])
+        # Rows that only now match (an edit, an entry moved back from its
+        # archive) and sort inside the buffer take their place there
+        missing_rows = grid.insert_rows(missing_rows)
+        new_rows = [row for row in missing_rows if ops[row[0]] == "insert"]
+        # Inserts before the buffer end are entries moved back with their old
+        # id, ahead of the buffer: only a recount keeps its offsets right
+        early = grid.buffer and any(row[0] < grid.buffer[-1][0] for row in new_rows)
+        if recount or early or len(new_rows) != len(missing_rows):
+            grid.recount()
+        elif new_rows:
+            grid.append(new_rows, follow=follow)
+
+    def poll_changes():
+        follow_changes()
+        root.after(CHANGE_POLL_MS, poll_changes)
+
+    def entries_saved(rows):
+        follow_changes(follow=True)
+        show_save_status(f"Saved {rows[-1][1]}")
+
+    def entries_failed(e):
+        show_save_status(f"Saving failed, retrying: {e}", error=True)
+
+    def show_save_status(message="", error=False):
+        waiting = entry_queue.waiting
+        if waiting:
+            message = f"{message}  ({waiting} waiting to save)" if message else f"{waiting} waiting to save"
+        save_status_var.set(message)
+        save_status_label.config(fg="#d32f2f" if error else "black")
 
     def upload_image():
         filepath = filedialog.askopenfilename(filetypes=[("Image files", "*.jpg *.png *.jpeg")])
@@ -112,17 +205,60 @@ def show_main_ui():
             messagebox.showerror("Error", "Enter article number first to name the image.")
             return
 
-        safe_article_name = "".join(c if c.isalnum() else "_" for c in article)
-        os.makedirs("images", exist_ok=True)
-        original_extension = filepath.split('.')[-1]
-        filename = f"images/{safe_article_name}.{original_extension}"
+        def uploaded(result):
+            stored, is_new = result
+            thumbnails.forget(article)
+            if preview_article[0] == article:
+                preview_article[0] = None
+                show_preview()
+            note = "" if is_new else "\nThe same photo was already stored, so no extra space is used."
+            messagebox.showinfo("Uploaded", f"Image uploaded for article {article}.{note}")
+
+        runner.submit("Uploading image", lambda task: image_store.add(article, filepath), on_done=uploaded,
+                      on_error=lambda e: messagebox.showerror("Upload Error", f"Failed to upload image: {e}"))
+
+    def show_preview(event=None):
+        # The photo of the focused row's article; thumbnails are rendered and
+        # read on the image worker and kept in an LRU cache
+        focused = tree.focus()
+        row = grid.row(focused) if focused and tree.exists(focused) else None
+        article = row[1] if row else None
+        if article == preview_article[0]:
+            return
+        preview_article[0] = article
+        if preview_task[0] is not None:
+            preview_task[0].cancel()
+            preview_task[0] = None
+        if article is None:
+            preview_label.config(image="", text="No entry selected")
+            return
+        if article in thumbnails:
+            show_thumbnail(article, thumbnails.get(article))
+            return
+        preview_label.config(image="", text="Loading...")
 
-        try:
-            with open(filepath, "rb") as src, open(filename, "wb") as dst:
-                dst.write(src.read())
-            messagebox.showinfo("Uploaded", f"Image uploaded as {filename}")
-        except Exception as e:
-            messagebox.showerror("Upload Error", f"Failed to upload image: {e}")
+        def load_thumbnail(task):
+            # Skipped when the selection moved on while it was queued
+            task.check()
+            return image_store.thumbnail_path(article)
+
+        def thumbnail_loaded(path):
+            thumbnails.put(article, PhotoImage(file=path) if path else None)
+            if preview_article[0] == article:
+                show_thumbnail(article, thumbnails.get(article))
+
+        def thumbnail_failed(e):
+            if preview_article[0] == article:
+                preview_label.config(image="", text=f"Could not read the image of\n{article}")
+
+        preview_task[0] = image_runner.submit("Loading image", load_thumbnail, on_done=thumbnail_loaded,
+                                              on_error=thumbnail_failed)
+
+    def show_thumbnail(article, image):
+        if image is None:
+            preview_label.config(image="", text=f"No image for\n{article}")
+        else:
+            preview_label.config(image=image, text="")
 
     def search_entries():
         start_date_val = search_start_date_entry.get()
@@ -150,14 +286,33 @@ def show_main_ui():
         }
         update_dashboard(filters)
 
+    def schedule_live_search(*args):
+        # Searches once typing pauses for SEARCH_DEBOUNCE_MS; every keystroke
+        # before that pushes the search back
+        if live_search_job[0]:
+            root.after_cancel(live_search_job[0])
+        live_search_job[0] = root.after(SEARCH_DEBOUNCE_MS, live_search)
+
+    def live_search():
+        live_search_job[0] = None
+        # A date still being typed is not searched for yet; the Search button
+        # reports it instead
+        for date_entry in (search_start_date_entry, search_end_date_entry):
+            if date_entry.get() and not is_valid_date(date_entry.get()):
+                return
+        filters = get_current_filters_for_export()
+        if filter_key(filters) != filter_key(current_filters):
+            update_dashboard(filters)
+
     def edit_entry():
         selected_items = tree.selection()
         if not selected_items:
             messagebox.showerror("Error", "Select an entry to edit.")
             return
 
-        selected_item_id_tree = selected_items[0]
-        item_values = tree.item(selected_item_id_tree)["values"]
+        item_values = grid.row(selected_items[0])
+        if item_values is None:
+            return
 
         edit_window = Toplevel(root)
         edit_window.title("Edit Entry")
@@ -173,22 +328,25 @@ def show_main_ui():
             except ValueError:
                 messagebox.showerror("Date Error", "Invalid date format for entry. Please use<ctrl97>MM-DD.", parent=edit_window)
                 return
+            new_qty = normalize_qty(edit_qty_var.get())
+            if new_qty is None and edit_qty_var.get().strip():
+                messagebox.showerror("Error", "Qty must be a whole number.", parent=edit_window)
+                return
 
             updated_data = (
                 edit_article_var.get(), edit_card_var.get(), edit_color_var.get(),
-                edit_size_var.get(), edit_qty_var.get(), edit_component_var.get(),
-                edit_print_opt_var.get(), new_date_val,
-                item_values[0]
+                edit_size_var.get(), new_qty, edit_component_var.get(),
+                edit_print_opt_var.get(), normalize_date(new_date_val) or new_date_val
             )
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("""UPDATE entries SET article=?, card=?, color=?, size=?, qty=?, component=?, print_opt=?, date=?
-                         WHERE id=?""", updated_data)
-            conn.commit()
-            conn.close()
-            messagebox.showinfo("Updated", "Entry updated successfully.", parent=edit_window)
-            edit_window.destroy()
-            update_dashboard()
+
+            def updated(_):
+                messagebox.showinfo("Updated", "Entry updated successfully.", parent=edit_window)
+                edit_window.destroy()
+                follow_changes()
+
+            runner.submit("Updating entry", lambda task: database.update_entry(item_values[0], updated_data),
+                          on_done=updated,
+                          on_error=lambda e: messagebox.showerror("Error", f"Failed to update entry: {e}", parent=edit_window))
 
         labels_text = ["Article:", "Card:", "Color:", "Size:", "Qty:", "Component:", "Print:", "Date (YYYY-MM-DD):"]
 
@@ -227,42 +385,82 @@ def show_main_ui():
             messagebox.showerror("Error", "Select an entry to delete.")
             return
 
-        selected_item_id_tree = selected_items[0]
-        item_id_db = tree.item(selected_item_id_tree)["values"][0]
+        item_id_db = int(selected_items[0])
 
         if messagebox.askyesno("Confirm Delete", "Are you sure you want to delete this entry?"):
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("DELETE FROM entries WHERE id=?", (item_id_db,))
-            conn.commit()
-            conn.close()
-            messagebox.showinfo("Deleted", "Entry deleted successfully.")
-            update_dashboard()
+            def deleted(_):
+                messagebox.showinfo("Deleted", "Entry deleted successfully.")
+                follow_changes()
 
-    def get_current_filters_for_export():
-        start_val = search_start_date_entry.get()
-        end_val = search_end_date_entry.get()
-        valid_start_date = None
-        valid_end_date = None
+            runner.submit("Deleting entry", lambda task: database.delete_entry(item_id_db), on_done=deleted,
+                          on_error=lambda e: messagebox.showerror("Error", f"Failed to delete entry: {e}"))
 
-        if start_val:
-            try:
-                datetime.strptime(start_val, '%Y-%m-%d')
-                valid_start_date = start_val
-            except ValueError: pass
-        if end_val:
-            try:
-                datetime.strptime(end_val, '%Y-%m-%d')
-                valid_end_date = end_val
-            except ValueError: pass
+    def get_current_filters_for_export():
+        return service.make_filters(
+            search_article_entry.get(), search_card_entry.get(), search_print_var.get(),
+            search_start_date_entry.get(), search_end_date_entry.get()
+        )
 
-        return {
-            "article": search_article_entry.get(),
-            "card": search_card_entry.get(),
-            "print_opt": search_print_var.get() if search_print_var.get() != "All" else "",
-            "start_date": valid_start_date,
-            "end_date": valid_end_date
-        }
+    def show_summary():
+        summary_window = Toplevel(root)
+        summary_window.title("Production Summary")
+        summary_window.geometry("420x480")
+        summary_window.configure(bg="#e0f7fa")
+
+        summary_filters = get_current_filters_for_export()
+        controls_frame = Frame(summary_window, bg="#e0f7fa")
+        controls_frame.pack(pady=10, padx=10, fill="x")
+        Label(controls_frame, text="Totals by:", bg="#e0f7fa").pack(side=LEFT, padx=5)
+        group_var = StringVar(value="Article")
+        OptionMenu(controls_frame, group_var, "Article", *TOTALS_GROUPS,
+                   command=lambda _: load_totals()).pack(side=LEFT, padx=5)
+
+        # Totals come from the rollup, which only knows the date range (and
+        # the article when grouping by article)
+        period = " to ".join(d for d in (summary_filters["start_date"], summary_filters["end_date"]) if d)
+        scope_label = Label(summary_window, text="", bg="#e0f7fa")
+        scope_label.pack(padx=10, anchor="w")
+
+        totals_frame = Frame(summary_window, bg="#e0f7fa")
+        totals_frame.pack(pady=5, padx=10, fill="both", expand=True)
+        totals_scrollbar = Scrollbar(totals_frame)
+        totals_scrollbar.pack(side=RIGHT, fill=Y)
+        totals_tree = Treeview(totals_frame, columns=("Group", "Entries", "Qty"), show="headings",
+                               yscrollcommand=totals_scrollbar.set)
+        totals_tree.pack(fill="both", expand=True)
+        totals_scrollbar.config(command=totals_tree.yview)
+        for col, width in [("Group", 180), ("Entries", 90), ("Qty", 90)]:
+            totals_tree.heading(col, text=col)
+            totals_tree.column(col, anchor=CENTER, width=width)
+
+        grand_total_label = Label(summary_window, text="", font=("Arial", 10, "bold"), bg="#e0f7fa")
+        grand_total_label.pack(pady=10)
+
+        def load_totals():
+            group_by = group_var.get()
+
+            def load(task):
+                with database.reading(task.watch) as reader:
+                    return reader.fetch_totals(group_by, summary_filters)
+
+            def loaded(rows):
+                if not summary_window.winfo_exists():
+                    return
+                scope = [f"Dates: {period or 'all'}"]
+                if group_by == "Article" and summary_filters["article"]:
+                    scope.append(f"Article contains '{summary_filters['article']}'")
+                scope_label.config(text="  |  ".join(scope))
+                totals_tree.heading("Group", text=group_by)
+                totals_tree.delete(*totals_tree.get_children())
+                for group, entries, qty in rows:
+                    totals_tree.insert("", END, values=(group, entries, qty))
+                grand_total_label.config(text=f"Total: {sum(r[1] for r in rows)} entries, "
+                                              f"{sum(r[2] for r in rows)} pieces in {len(rows)} groups")
+
+            runner.submit("Loading totals", load, on_done=loaded,
+                          on_error=lambda e: messagebox.showerror("Summary Error", f"Failed to load totals: {e}", parent=summary_window))
+
+        load_totals()
 
     def export_excel():
         filepath = filedialog.asksaveasfilename(
@@ -271,44 +469,39 @@ def show_main_ui():
         )
         if not filepath: return
 
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
+        current_filters = get_current_filters_for_export()
+
+        def write_excel(task):
+            def report(written, total):
+                # Leaving through TaskCancelled aborts before the file is saved
+                task.check()
+                task.progress(written, total, "Exporting to Excel")
+
+            service.export_entries(database, filepath, "xlsx", current_filters, progress=report, watch=task.watch)
+
+        runner.submit("Exporting to Excel", write_excel,
+                      on_done=lambda _: messagebox.showinfo("Exported", "Data exported to Excel successfully."),
+                      on_error=lambda e: messagebox.showerror("Export Error", f"Failed to export to Excel: {e}"))
+
+    def export_csv():
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv"), ("Compressed CSV", "*.csv.gz"), ("All files", "*.*")]
+        )
+        if not filepath: return
 
-        query = "SELECT id, article, card, color, size, qty, component, print_opt, date FROM entries WHERE 1=1"
-        values = []
         current_filters = get_current_filters_for_export()
 
-        if current_filters.get("article"):
-            query += " AND article LIKE ?"
-            values.append(f"%{current_filters['article']}%")
-        if current_filters.get("card"):
-            query += " AND card LIKE ?"
-            values.append(f"%{current_filters['card']}%")
-        if current_filters.get("print_opt"):
-            query += " AND print_opt = ?"
-            values.append(current_filters["print_opt"])
-        if current_filters.get("start_date"):
-            query += " AND date >= ?"
-            values.append(current_filters["start_date"])
-        if current_filters.get("end_date"):
-            query += " AND date <= ?"
-            values.append(current_filters["end_date"])
-
-        c.execute(query, values)
-        rows = c.fetchall()
-        conn.close()
-
-        wb = Workbook()
-        ws = wb.active
-        ws.append(["Article", "Card", "Color", "Size", "Qty", "Component", "Print", "Date"])
-        for row in rows:
-            ws.append(row)
+        def write_csv(task):
+            def report(written, total):
+                task.check()
+                task.progress(written, total, "Exporting to CSV")
 
-        try:
-            wb.save(filepath)
-            messagebox.showinfo("Exported", "Data exported to Excel successfully.")
-        except Exception as e:
-            messagebox.showerror("Export Error", f"Failed to export to Excel: {e}")
+            return service.export_entries(database, filepath, "csv", current_filters, progress=report, watch=task.watch)
+
+        runner.submit("Exporting to CSV", write_csv,
+                      on_done=lambda written: messagebox.showinfo("Exported", f"{written} entries exported to CSV successfully."),
+                      on_error=lambda e: messagebox.showerror("Export Error", f"Failed to export to CSV: {e}"))
 
     def export_pdf():
         filepath = filedialog.asksaveasfilename(
@@ -317,94 +510,48 @@ def show_main_ui():
         )
         if not filepath: return
 
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        query = "SELECT ID, article, card, color, size, qty, component, print_opt, date FROM entries WHERE 1=1"
-        values = []
         current_filters = get_current_filters_for_export()
 
-        if current_filters.get("article"):
-            query += " AND article LIKE ?"
-            values.append(f"%{current_filters['article']}%")
-        if current_filters.get("card"):
-            query += " AND card LIKE ?"
-            values.append(f"%{current_filters['card']}%")
-        if current_filters.get("print_opt"):
-            query += " AND print_opt = ?"
-            values.append(current_filters["print_opt"])
-        if current_filters.get("start_date"):
-            query += " AND date >= ?"
-            values.append(current_filters["start_date"])
-        if current_filters.get("end_date"):
-            query += " AND date <= ?"
-            values.append(current_filters["end_date"])
-
-        c.execute(query, values)
-        db_rows = c.fetchall()
-        conn.close()
-
-        pdf_canvas = canvas.Canvas(filepath, pagesize=A4)
-        width, height = A4
-        margin = 40
-        x_start_pos = margin
-        y_pos = height - margin
-        line_height = 16
-        header_line_height = 20
-
-        pdf_canvas.setFont("Helvetica-Bold", 14)
-        pdf_canvas.drawString(x_start_pos, y_pos, "Laser Entries")
-        y_pos -= (header_line_height * 1.5)
-
-        headers = ["Article", "Card", "Color", "Size", "Qty", "Component", "Print", "Date"]
-
-        available_width = width - 2 * margin
-        col_widths_dict = { "ID": 0.06, "Article": 0.18, "Card": 0.12, "Color": 0.10,
-                            "Size": 0.08, "Qty": 0.07, "Component": 0.18, "Print": 0.09, "Date": 0.12 }
-        actual_col_widths = [available_width * col_widths_dict.get(h, 0.1) for h in headers]
-
-        def draw_headers_on_page(canvas_obj, current_y_pos):
-            canvas_obj.setFont("Helvetica-Bold", 9)
-            current_x_pos = x_start_pos
-            for i_h, header_text in enumerate(headers):
-                canvas_obj.drawString(current_x_pos, current_y_pos, header_text)
-                current_x_pos += actual_col_widths[i_h]
-            current_y_pos -= (line_height * 0.5)
-            canvas_obj.line(x_start_pos, current_y_pos, width - margin, current_y_pos)
-            current_y_pos -= (line_height * 0.8)
-            return current_y_pos
-
-        y_pos = draw_headers_on_page(pdf_canvas, y_pos)
-        pdf_canvas.setFont("Helvetica", 8)
-
-        for row_data in db_rows:
-            if y_pos < margin + line_height:
-                pdf_canvas.showPage()
-                pdf_canvas.setFont("Helvetica-Bold", 14)
-                pdf_canvas.drawString(x_start_pos, height - margin, "LASER Entries (Continued)")
-                y_pos = height - margin - (header_line_height * 1.5)
-                y_pos = draw_headers_on_page(pdf_canvas, y_pos)
-                pdf_canvas.setFont("Helvetica", 8)
-
-            current_x_pos = x_start_pos
-            for i_val, value in enumerate(row_data):
-                cell_text = str(value)
-                max_chars = int(actual_col_widths[i_val] / (pdf_canvas._fontsize * 0.5))
-                if len(cell_text) > max_chars and max_chars > 3:
-                     cell_text = cell_text[:max_chars-3] + "..."
-                pdf_canvas.drawString(current_x_pos, y_pos, cell_text)
-                current_x_pos += actual_col_widths[i_val]
-            y_pos -= line_height
-
-        try:
-            pdf_canvas.save()
-            messagebox.showinfo("Exported", "Data exported to PDF successfully.")
-        except Exception as e:
-            messagebox.showerror("Export Error", f"Failed to export to PDF: {e}")
-
-    def show_import_mapping_window(filepath, excel_headers):
+        def write_pdf(task):
+            def report(written, total):
+                task.check()
+                task.progress(written, total, "Exporting to PDF")
+
+            service.export_entries(database, filepath, "pdf", current_filters, progress=report, watch=task.watch)
+
+        runner.submit("Exporting to PDF", write_pdf,
+                      on_done=lambda _: messagebox.showinfo("Exported", "Data exported to PDF successfully."),
+                      on_error=lambda e: messagebox.showerror("Export Error", f"Failed to export to PDF: {e}"))
+
+    def ask_duplicates(title, message, on_chosen):
+        # What to do with rows already imported, for imports without the
+        # mapping window; on_chosen(policy) once Import is pressed
+        duplicates_window = Toplevel(root)
+        duplicates_window.title(title)
+        duplicates_window.configure(bg="#e0f7fa")
+        duplicates_window.grab_set()
+
+        Label(duplicates_window, text=message, bg="#e0f7fa").grid(row=0, column=0, columnspan=2, padx=10, pady=10)
+        Label(duplicates_window, text="Rows already imported:", bg="#e0f7fa").grid(row=1, column=0, sticky="w", padx=10, pady=3)
+        duplicate_labels = {policy: label for label, policy in DUPLICATE_CHOICES.items()}
+        duplicates_var = StringVar(value=duplicate_labels[get_import_duplicates()])
+        OptionMenu(duplicates_window, duplicates_var, duplicates_var.get(), *DUPLICATE_CHOICES).grid(row=1, column=1, sticky="ew", padx=10, pady=3)
+
+        def start():
+            duplicates_window.destroy()
+            policy = DUPLICATE_CHOICES[duplicates_var.get()]
+            set_import_duplicates(policy)
+            on_chosen(policy)
+
+        buttons_frame = Frame(duplicates_window, bg="#e0f7fa")
+        buttons_frame.grid(row=2, column=0, columnspan=2, pady=10)
+        Button(buttons_frame, text="Import", command=start, bg="#00796b", fg="white").pack(side=LEFT, padx=5)
+        Button(buttons_frame, text="Cancel", command=duplicates_window.destroy).pack(side=LEFT, padx=5)
+
+    def show_import_mapping_window(filepath, excel_headers, on_mapped=None):
         mapping_window = Toplevel(root)
         mapping_window.title("Map Excel Columns")
-        mapping_window.geometry("400x400")
+        mapping_window.geometry("400x440")
         mapping_window.configure(bg="#e0f7fa")
         mapping_window.grab_set()
 
@@ -423,6 +570,7 @@ def show_main_ui():
         }
 
         mapping_vars = {}
+        saved_mapping = get_import_mapping()
 
         Label(mapping_frame, text="Select Excel column for each field:", font=("Arial", 10, "bold"), bg="#e0f7fa").grid(row=0, column=0, columnspan=2, pady=10)
 
@@ -460,13 +608,22 @@ def show_main_ui():
                           mapping_vars[field_name].set(header)
                           break
 
+            # The mapping used last time wins when this sheet has the same header
+            if saved_mapping and saved_mapping.get(field_name) in excel_header_options:
+                 mapping_vars[field_name].set(saved_mapping[field_name])
+
 
             OptionMenu(mapping_frame, mapping_vars[field_name], *excel_header_options).grid(row=row_num, column=1, sticky="ew", padx=5, pady=3)
             row_num += 1
 
+        Label(mapping_frame, text="Rows already imported:", bg="#e0f7fa").grid(row=row_num, column=0, sticky="w", padx=5, pady=(10, 3))
+        duplicate_labels = {policy: label for label, policy in DUPLICATE_CHOICES.items()}
+        duplicates_var = StringVar(value=duplicate_labels[get_import_duplicates()])
+        OptionMenu(mapping_frame, duplicates_var, duplicates_var.get(), *DUPLICATE_CHOICES).grid(row=row_num, column=1, sticky="ew", padx=5, pady=(10, 3))
+
         mapping_frame.columnconfigure(1, weight=1)
 
-        def start_import():
+        def start_import(dry_run=False):
             selected_mapping = {field: var.get() for field, var in mapping_vars.items()}
 
             # Validate ONLY truly required fields are mapped
@@ -476,145 +633,145 @@ def show_main_ui():
                     return
 
             mapping_window.destroy()
-            perform_import(filepath, selected_mapping, excel_headers)
+            set_import_mapping(selected_mapping)
+            set_import_duplicates(DUPLICATE_CHOICES[duplicates_var.get()])
+            if on_mapped:
+                on_mapped(selected_mapping, dry_run)
+            else:
+                perform_import(filepath, selected_mapping, excel_headers, dry_run)
 
 
-        Button(mapping_window, text="Import Data", command=start_import, bg="#00796b", fg="white").pack(pady=10)
+        mapping_buttons_frame = Frame(mapping_window, bg="#e0f7fa")
+        mapping_buttons_frame.pack(pady=10)
+        Button(mapping_buttons_frame, text="Import Data", command=start_import, bg="#00796b", fg="white").pack(side=LEFT, padx=5)
+        Button(mapping_buttons_frame, text="Check Only", command=lambda: start_import(dry_run=True),
+               bg="#0288d1", fg="white").pack(side=LEFT, padx=5)
 
+    def show_import_result(headline, stats, errors, on_import=None):
+        # A clean import gets a messagebox; otherwise a scrollable summary of
+        # the problems per field with a sample of them, never the full list,
+        # which is in the report file. on_import, after a dry run, imports for real.
+        if not errors and not on_import:
+            messagebox.showinfo("Import Complete", headline)
+            return
 
-    def perform_import(filepath, mapping, excel_headers):
-        try:
-            workbook = load_workbook(filepath)
-            sheet = workbook.active
-
-            # Excel headers might be in row 2, data starts row 3.
-            # Need to find the actual start row for data if headers are not row 1.
-            # Assuming headers are in row 2 based on your image.
-            data_start_row = 3
-            # We already got headers from row 2 in import_excel()
-
-            header_to_index = {header: index for index, header in enumerate(excel_headers)}
-            column_indices = {}
-            for db_field, excel_header in mapping.items():
-                if excel_header != "-- Skip --" and excel_header in header_to_index:
-                    column_indices[db_field] = header_to_index[excel_header]
-                else:
-                    column_indices[db_field] = -1 # Indicates this field should be skipped or defaulted
-
-
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            imported_count = 0
-            errors = []
-
-            # Iterate through rows starting from the determined data_start_row
-            for row_index in range(data_start_row, sheet.max_row + 1):
-                row_values = [sheet.cell(row=row_index, column=col+1).value for col in range(sheet.max_column)]
-
-                try:
-                    # Get data using mapped column indices
-                    # Use .strip() and default to "" for text fields if column is skipped or empty
-                    article = str(row_values[column_indices["Article"]] if column_indices["Article"] != -1 and column_indices["Article"] < len(row_values) and row_values[column_indices["Article"]] is not None else "").strip()
-                    card = str(row_values[column_indices["Card"]] if column_indices["Card"] != -1 and column_indices["Card"] < len(row_values) and row_values[column_indices["Card"]] is not None else "").strip() # Card is now optional
-                    color = str(row_values[column_indices["Color"]] if column_indices["Color"] != -1 and column_indices["Color"] < len(row_values) and row_values[column_indices["Color"]] is not None else "").strip()
-                    size = str(row_values[column_indices["Size"]] if column_indices["Size"] != -1 and column_indices["Size"] < len(row_values) and row_values[column_indices["Size"]] is not None else "").strip()
-                    qty = str(row_values[column_indices["Qty"]] if column_indices["Qty"] != -1 and column_indices["Qty"] < len(row_values) and row_values[column_indices["Qty"]] is not None else "").strip()
-                    component = str(row_values[column_indices["Component"]] if column_indices["Component"] != -1 and column_indices["Component"] < len(row_values) and row_values[column_indices["Component"]] is not None else "").strip()
-
-
-                    # Handle Print field mapping and validation
-                    print_opt = "No" # Default if skipped or invalid
-                    if column_indices["Print"] != -1 and column_indices["Print"] < len(row_values):
-                         print_opt_raw = row_values[column_indices["Print"]]
-                         if print_opt_raw is not None:
-                             print_opt = str(print_opt_raw).strip().capitalize()
-                             if print_opt not in ["Yes", "No"]:
-                                  errors.append(f"Row {row_index}: Invalid 'Print' value '{print_opt_raw}'. Using 'No'.")
-                                  print_opt = "No" # Default if value is something else
-
-
-                    # Handle Date field mapping and validation
-                    entry_date = str(date.today()) # Default if skipped or parsing fails
-                    if column_indices["Date"] != -1 and column_indices["Date"] < len(row_values):
-                         date_raw = row_values[column_indices["Date"]]
-                         if date_raw is not None:
-                             if isinstance(date_raw, datetime):
-                                 entry_date = date_raw.strftime('%Y-%m-%d')
-                             elif isinstance(date_raw, date):
-                                  entry_date = date_raw.strftime('%Y-%m-%d')
-                             elif isinstance(date_raw, (int, float)): # Handle dates stored as numbers by Excel
-                                  try:
-                                       # Convert Excel serial date number to datetime
-                                       # Need to handle 1900 vs 1904 date system if necessary
-                                       from openpyxl.utils.datetime import from_excel
-                                       entry_date_obj = from_excel(date_raw)
-                                       entry_date = entry_date_obj.strftime('%Y-%m-%d')
-                                  except ValueError:
-                                       errors.append(f"Row {row_index}: Cannot convert numeric date '{date_raw}'. Using today's date.")
-                                       entry_date = str(date.today())
-
-                             elif isinstance(date_raw, str) and date_raw:
-                                 try:
-                                     # Attempt to parse various string formats
-                                     # Handles ISO format (e.g., "2023-10-27T10:00:00Z")
-                                     if 'T' in date_raw and ('+' in date_raw or 'Z' in date_raw):
-                                          entry_date = datetime.fromisoformat(date_raw.replace("Z", "+00:00")).strftime('%Y-%m-%d')
-                                     else:
-                                         # Attempt standard YYYY-MM-DD first, then common variations
-                                         try:
-                                              entry_date = datetime.strptime(date_raw, '%Y-%m-%d').strftime('%Y-%m-%d')
-                                         except ValueError:
-                                             try:
-                                                 entry_date = datetime.strptime(date_raw, '%m/%d/%Y').strftime('%Y-%m-%d')
-                                             except ValueError:
-                                                 try:
-                                                     entry_date = datetime.strptime(date_raw, '%d/%m/%Y').strftime('%Y-%m-%d')
-                                                 except ValueError:
-                                                     try:
-                                                         entry_date = datetime.strptime(date_raw, '%Y/%m/%d').strftime('%Y-%m-%d')
-                                                     except ValueError:
-                                                          errors.append(f"Row {row_index}: Unrecognized date string format '{date_raw}'. Using today's date.")
-                                                          entry_date = str(date.today())
-                                 except ValueError: # Catches errors from fromisoformat or initial strptime
-                                      errors.append(f"Row {row_index}: Unrecognized date string format '{date_raw}'. Using today's date.")
-                                      entry_date = str(date.today())
-
-                             else: # Handles other potential data types that aren't None
-                                  errors.append(f"Row {row_index}: Unrecognized date data type '{type(date_raw).__name__}'. Using today's date.")
-                                  entry_date = str(date.today())
-
-
-                    # Basic validation for Article (Card is no longer required by mapping)
-                    if not article:
-                         errors.append(f"Row {row_index}: Missing required Article data. Skipping row.")
-                         continue # Skip this row if Article is missing
-
-                    data = (article, card, color, size, qty, component, print_opt, entry_date)
-
-                    c.execute("INSERT INTO entries (article, card, color, size, qty, component, print_opt, date) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", data)
-                    imported_count += 1
-                except IndexError:
-                     errors.append(f"Row {row_index}: Data column index out of range based on mapping. Skipping row.")
-                except Exception as e:
-                     errors.append(f"Row {row_index}: Error processing row - {e}. Skipping row.")
-
-
-            conn.commit()
-            conn.close()
-
-            success_message = f"Successfully imported {imported_count} entries."
-            if errors:
-                 error_message = "\n".join(errors)
-                 messagebox.showwarning("Import with Errors", f"{success_message}\n\nErrors encountered:\n{error_message}")
-            else:
-                messagebox.showinfo("Import Complete", success_message)
+        report_window = Toplevel(root)
+        report_window.title("Import Check" if on_import else "Import with Errors")
+        report_window.geometry("600x450")
+        report_window.configure(bg="#e0f7fa")
+
+        text_frame = Frame(report_window, bg="#e0f7fa")
+        text_frame.pack(fill="both", expand=True, padx=10, pady=(10, 0))
+        text_scrollbar = Scrollbar(text_frame)
+        text_scrollbar.pack(side=RIGHT, fill=Y)
+        report_text = Text(text_frame, wrap="word", yscrollcommand=text_scrollbar.set)
+        report_text.pack(fill="both", expand=True)
+        text_scrollbar.config(command=report_text.yview)
+
+        lines = [headline, ""]
+        if errors:
+            lines += [f"{len(errors):,} problems:"] + [f"  {line}" for line in errors.summary()]
+            if errors.has_report:
+                lines += ["", f"Every problem row is listed in:\n  {errors.report_path}"]
+            sample = list(errors)
+            lines += ["", f"First {len(sample)} problems:" if len(sample) < len(errors) else "Problems:"]
+            lines += [f"  {message}" for message in sample]
+        else:
+            lines.append("No problems found.")
+        report_text.insert(END, "\n".join(lines))
+        report_text.config(state=DISABLED)
+
+        report_buttons_frame = Frame(report_window, bg="#e0f7fa")
+        report_buttons_frame.pack(pady=10)
+        if on_import:
+            def import_now():
+                report_window.destroy()
+                on_import()
+            Button(report_buttons_frame, text="Import Now", command=import_now, bg="#00796b", fg="white").pack(side=LEFT, padx=5)
+        Button(report_buttons_frame, text="Close", command=report_window.destroy).pack(side=LEFT, padx=5)
+
+    def import_headline(stats, dry_run, source=""):
+        if dry_run:
+            return f"{stats.rows:,} rows can be imported{source}. Nothing has been imported yet."
+        return (f"Successfully imported {stats.rows} entries{source} ({stats.rows_per_second:,.0f} rows/s)."
+                f"{duplicates_note(stats)}{resumed_note(stats)}")
+
+    def import_cancelled():
+        # Large files are committed in chunks (service._checkpointed_import)
+        follow_changes()
+        messagebox.showinfo("Import Cancelled", "Import cancelled. Smaller files are imported all or nothing, so "
+                            "none of their entries were kept.\n\nLarge files keep the entries imported so far; "
+                            "importing the same file again carries on where it stopped.")
+
+    def offer_resume_imports(jobs):
+        # Imports interrupted in an earlier run (closed app, crash, cancel)
+        if not jobs:
+            return
+        listing = "\n".join(f"  {os.path.basename(job[2])} (after row {job[5]:,})" for job in jobs)
+        answer = messagebox.askyesnocancel(
+            "Unfinished Imports", f"These imports were interrupted:\n{listing}\n\nFinish them now? "
+            "No forgets them and keeps the entries imported so far; Cancel asks again next time.")
+        if answer is None:
+            return
+        if not answer:
+            runner.submit("Forgetting unfinished imports",
+                          lambda task: [database.finish_import_job(job[0], "abandoned") for job in jobs],
+                          on_error=lambda e: messagebox.showerror("Import Error", f"Could not forget the unfinished imports: {e}"))
+            return
+        resume_next(list(jobs))
 
-            update_dashboard() # Refresh the view after import
+    def resume_next(jobs):
+        job = jobs.pop(0)
+        source = os.path.basename(job[2])
 
-        except FileNotFoundError:
-            pass
-        except Exception as e:
-            messagebox.showerror("Import Error", f"Failed to process Excel file during import: {e}")
+        def run(task):
+            def report(inserted, total):
+                task.check()
+                task.progress(inserted, total, f"Resuming {source}")
+
+            return service.resume_import_job(database, job, progress=report)
+
+        def resumed(result):
+            stats, errors = result
+            show_import_result(import_headline(stats, False, f" from {source}"), stats, errors)
+            follow_changes()
+            if jobs:
+                resume_next(jobs)
+
+        def resume_failed(e):
+            messagebox.showerror("Import Error", f"Could not finish importing {source}: {e}")
+            if jobs:
+                resume_next(jobs)
+
+        runner.submit(f"Resuming {source}", run, on_done=resumed, on_error=resume_failed, on_cancel=import_cancelled)
+
+
+    def perform_import(filepath, mapping, excel_headers, dry_run=False):
+        duplicates = get_import_duplicates()
+
+        def run_import(task):
+            def report(inserted, total_rows):
+                # Leaving through TaskCancelled rolls the import back (for large
+                # files only the chunk being imported, see import_cancelled)
+                task.check()
+                task.progress(inserted, total_rows, "Checking" if dry_run else "Importing")
+
+            return service.import_xlsx(database, filepath, mapping, progress=report, duplicates=duplicates,
+                                       dry_run=dry_run)
+
+        def imported(result):
+            stats, errors = result
+            show_import_result(import_headline(stats, dry_run), stats, errors,
+                               on_import=(lambda: perform_import(filepath, mapping, excel_headers)) if dry_run else None)
+            if not dry_run:
+                follow_changes() # Show the imported entries
+
+        def import_failed(e):
+            if not isinstance(e, FileNotFoundError):
+                messagebox.showerror("Import Error", f"Failed to process Excel file during import: {e}")
+
+        runner.submit("Checking" if dry_run else "Importing", run_import, on_done=imported, on_error=import_failed,
+                      on_cancel=import_cancelled)
 
 
     def import_excel():
@@ -623,32 +780,95 @@ def show_main_ui():
         )
         if not filepath: return
 
-        try:
-            workbook = load_workbook(filepath)
-            sheet = workbook.active
-
-            # Assuming headers are in row 2 based on your image
-            header_row = 2
-            if sheet.max_row < header_row:
-                 messagebox.showerror("Import Error", f"Excel file does not have enough rows to read headers from row {header_row}.")
-                 return
-
-            # Read headers from the specified header row
-            excel_headers = [sheet.cell(row=header_row, column=col+1).value for col in range(sheet.max_column)]
-            excel_headers = [h for h in excel_headers if h is not None] # Filter out None values
+        def read_excel_headers(task):
+            excel_headers = read_headers(filepath)
+            if excel_headers is None:
+                 raise ValueError(f"Excel file does not have enough rows to read headers from row {HEADER_ROW}.")
+            return excel_headers
 
+        def headers_read(excel_headers):
             if not excel_headers:
                  messagebox.showerror("Import Error", "Could not find any headers in the specified header row of the Excel file.")
                  return
 
             # Show mapping window with discovered headers
-            # Pass the header_row so perform_import knows where data starts
             show_import_mapping_window(filepath, excel_headers)
 
-        except FileNotFoundError:
-            pass
-        except Exception as e:
-            messagebox.showerror("Import Error", f"Could not read Excel headers or file: {e}")
+        def headers_failed(e):
+            if not isinstance(e, FileNotFoundError):
+                messagebox.showerror("Import Error", f"Could not read Excel headers or file: {e}")
+
+        runner.submit("Reading Excel headers", read_excel_headers, on_done=headers_read, on_error=headers_failed)
+
+
+    def import_csv():
+        filepath = filedialog.askopenfilename(
+            filetypes=[("CSV files", "*.csv *.csv.gz"), ("All files", "*.*")]
+        )
+        if not filepath: return
+
+        def run_csv_import(duplicates):
+            def run(task):
+                def report(inserted, total):
+                    task.check()
+                    task.progress(inserted, total, "Importing CSV")
+
+                return service.import_csv(database, filepath, progress=report, duplicates=duplicates)
+
+            def imported(result):
+                stats, errors = result
+                show_import_result(import_headline(stats, False), stats, errors)
+                follow_changes()
+
+            runner.submit("Importing CSV", run, on_done=imported,
+                          on_error=lambda e: messagebox.showerror("Import Error", f"Failed to import CSV file: {e}"),
+                          on_cancel=import_cancelled)
+
+        ask_duplicates("Import CSV", f"Import {os.path.basename(filepath)}?", run_csv_import)
+
+    def import_folder():
+        folder = filedialog.askdirectory(title="Select a folder of Excel sheets")
+        if not folder: return
+
+        filepaths = find_workbooks(folder)
+        if not filepaths:
+            messagebox.showerror("Import Error", "No Excel files (*.xlsx) found in the selected folder.")
+            return
+
+        def run_folder_import(mapping, dry_run=False):
+            duplicates = get_import_duplicates()
+
+            def run(task):
+                def report(files_done, files_total):
+                    task.check()
+                    task.progress(files_done, files_total, "Checking files" if dry_run else "Importing files")
+
+                return service.import_xlsx_files(database, filepaths, mapping, progress=report, duplicates=duplicates,
+                                                 dry_run=dry_run)
+
+            def imported(result):
+                stats, errors = result
+                show_import_result(import_headline(stats, dry_run, f" from {len(filepaths)} files"), stats, errors,
+                                   on_import=(lambda: run_folder_import(mapping)) if dry_run else None)
+                if not dry_run:
+                    follow_changes()
+
+            runner.submit("Checking files" if dry_run else "Importing files", run, on_done=imported,
+                          on_error=lambda e: messagebox.showerror("Import Error", f"Failed to import folder: {e}"),
+                          on_cancel=lambda: messagebox.showinfo("Import Cancelled", "Import cancelled. No entries were imported."))
+
+        saved_mapping = get_import_mapping()
+        if saved_mapping and messagebox.askyesno(
+                "Import Folder", f"Import {len(filepaths)} files using the saved column mapping?"):
+            ask_duplicates("Import Folder", f"Import {len(filepaths)} files from {os.path.basename(folder)}?",
+                           lambda policy: run_folder_import(saved_mapping))
+            return
+
+        # No saved mapping (or not wanted): map the columns once, using the first sheet
+        runner.submit("Reading Excel headers", lambda task: read_headers(filepaths[0]),
+                      on_done=lambda excel_headers: show_import_mapping_window(filepaths[0], excel_headers or [],
+                                                                               on_mapped=run_folder_import),
+                      on_error=lambda e: messagebox.showerror("Import Error", f"Could not read Excel headers or file: {e}"))
 
 
     # --- UI Element Creation ---
@@ -708,6 +928,12 @@ def show_main_ui():
     search_button = Button(search_controls_frame, text="Search", command=search_entries, bg="#00796b", fg="white")
     search_button.grid(row=1, column=4, columnspan=2, padx=5, pady=5, sticky="ew")
 
+    # Live filtering: the grid follows the search fields as they are typed in
+    for search_entry in (search_article_entry, search_card_entry, search_start_date_entry, search_end_date_entry):
+        search_entry.bind("<KeyRelease>", schedule_live_search)
+    search_print_var.trace_add("write", schedule_live_search)
+    live_search_job = [None]
+
     search_controls_frame.columnconfigure(1, weight=1)
     search_controls_frame.columnconfigure(3, weight=1)
     search_controls_frame.columnconfigure(5, weight=1)
@@ -721,12 +947,29 @@ def show_main_ui():
     tree_scrollbar_x = Scrollbar(data_display_frame, orient=HORIZONTAL)
     tree_scrollbar_x.pack(side=BOTTOM, fill=X)
 
-    tree = Treeview(data_display_frame, yscrollcommand=tree_scrollbar_y.set, xscrollcommand=tree_scrollbar_x.set)
+    # Photo of the selected entry's article
+    preview_frame = LabelFrame(data_display_frame, text="Image", bg="#e0f7fa", width=180)
+    preview_frame.pack(side=RIGHT, fill=Y, padx=(5, 0))
+    preview_frame.pack_propagate(False)
+    preview_label = Label(preview_frame, text="No entry selected", bg="#e0f7fa", compound=CENTER)
+    preview_label.pack(fill="both", expand=True)
+
+    tree = Treeview(data_display_frame, xscrollcommand=tree_scrollbar_x.set)
     tree.pack(fill="both", expand=True)
 
-    tree_scrollbar_y.config(command=tree.yview)
     tree_scrollbar_x.config(command=tree.xview)
 
+    # The vertical scrollbar is driven by the grid, which pages rows in and out
+    grid = PagedGrid(tree, tree_scrollbar_y)
+    current_filters = {}
+    # The local database, or the shared server when HYPE_SERVER is set
+    database = service.open_database()
+    if hasattr(database, "url"):
+        root.title(f"Dashboard - Hype Production Management ({database.url})")
+    # The grid pages rows in on the Tk thread, so it gets its own reader
+    # rather than waiting for one from the pool behind running exports
+    grid_reader = database.open_reader()
+
     tree["columns"] = ("ID", "Article", "Card", "Color", "Size", "Qty", "Component", "Print", "Date")
     tree.column("#0", width=0, stretch=NO)
     tree.heading("#0", text="")
@@ -756,11 +999,75 @@ def show_main_ui():
     Button(action_buttons_frame, text="Export to PDF", command=export_pdf, bg="#c2185b", fg="white", width=15).pack(side=LEFT, padx=5)
     Button(action_buttons_frame, text="Import from Excel", command=import_excel, bg="#00acc1", fg="white", width=15).pack(side=LEFT, padx=5)
 
+    # --- Bulk Exchange Buttons Frame ---
+    exchange_buttons_frame = Frame(root, bg="#e0f7fa")
+    exchange_buttons_frame.pack(pady=(0, 10))
+
+    Button(exchange_buttons_frame, text="Import Folder", command=import_folder, bg="#0097a7", fg="white", width=15).pack(side=LEFT, padx=5)
+    Button(exchange_buttons_frame, text="Export to CSV", command=export_csv, bg="#558b2f", fg="white", width=15).pack(side=LEFT, padx=5)
+    Button(exchange_buttons_frame, text="Import from CSV", command=import_csv, bg="#00838f", fg="white", width=15).pack(side=LEFT, padx=5)
+    Button(exchange_buttons_frame, text="Summary", command=show_summary, bg="#5e35b1", fg="white", width=15).pack(side=LEFT, padx=5)
+
+
+    # --- Status Bar (background tasks) ---
+    status_frame = Frame(root, bg="#b2ebf2")
+    status_frame.pack(side=BOTTOM, fill="x")
+    status_var = StringVar(value="Ready")
+    Label(status_frame, textvariable=status_var, bg="#b2ebf2", anchor="w").pack(side=LEFT, padx=10)
+    save_status_var = StringVar(value="")
+    save_status_label = Label(status_frame, textvariable=save_status_var, bg="#b2ebf2", anchor="w")
+    save_status_label.pack(side=LEFT, padx=10)
+    cancel_button = Button(status_frame, text="Cancel", command=lambda: runner.cancel_all(), state=DISABLED)
+    cancel_button.pack(side=RIGHT, padx=5, pady=2)
+    progress_bar = Progressbar(status_frame, length=200, mode="determinate")
+    progress_bar.pack(side=RIGHT, padx=5)
+
+    def show_task_status(task, done, total, message):
+        if task is None:
+            status_var.set("Ready")
+            progress_bar.config(value=0)
+            cancel_button.config(state=DISABLED)
+            return
+        text = message or task.name
+        if total:
+            progress_bar.config(maximum=total, value=done)
+            text += f" ({done:,} / {total:,})"
+        else:
+            progress_bar.config(value=0)
+        status_var.set(text + "...")
+        cancel_button.config(state=NORMAL)
+
+    runner = TaskRunner(root, on_status=show_task_status)
+    # Thumbnails load on their own worker, unseen in the status bar and never
+    # behind an import
+    image_runner = TaskRunner(root, max_workers=1)
+    image_store = ImageStore()
+    thumbnails = ThumbnailCache()
+    preview_article = [None]
+    preview_task = [None]
+    tree.bind("<<TreeviewSelect>>", show_preview, add="+")
+    dashboard_tasks = []
+    # Last change log entry the grid reflects
+    change_seq = [0]
+    # Entries left in the journal by a previous run are saved first
+    entry_queue = EntryQueue(root, database, on_saved=entries_saved, on_error=entries_failed)
+    show_save_status()
 
-    init_db()
     update_dashboard()
+    root.after(CHANGE_POLL_MS, poll_changes)
+    runner.submit("Looking for unfinished imports", lambda task: database.unfinished_import_jobs(),
+                  on_done=offer_resume_imports,
+                  on_error=lambda e: messagebox.showerror("Import Error", f"Could not look for unfinished imports: {e}"))
+    # Years that fell out of the live window move to their archive files
+    runner.submit("Archiving old entries", lambda task: database.archive_old_entries(
+        progress=lambda year: task.progress(0, None, f"Archiving {year}")),
+                  on_error=lambda e: messagebox.showerror("Archive Error", f"Failed to archive old entries: {e}"))
 
     root.mainloop()
+    runner.shutdown()
+    image_runner.shutdown()
+    entry_queue.close()
+    database.close()
 
 if __name__ == "__main__":
     show_main_ui()
\ No newline at end of file
@@ -0,0 +1,280 @@
+# paged_grid.py - Virtual scrolling for the entries Treeview
+
+# The Treeview only ever holds the rows that fit on screen. A small buffer of
+# rows around them (the prefetch margin) is kept in memory and refilled through
+# keyset queries, and the scrollbar is sized from COUNT(*) instead of from the
+# number of inserted items.
+
+from bisect import bisect_left
+from tkinter import END
+
+DEFAULT_ROW_HEIGHT = 20
+HEADER_HEIGHT = 24
+
+class PagedGrid:
+    def __init__(self, tree, scrollbar, prefetch=100):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.prefetch = prefetch
+        self.count_rows = None
+        self.fetch_after = None
+        self.fetch_before = None
+        self.fetch_at = None
+        self.total = 0
+        self.top = 0
+        self.visible = 25
+        self.buffer = []
+        self.buffer_start = 0
+
+        scrollbar.config(command=self.yview)
+        tree.bind("<Configure>", self._on_configure)
+        tree.bind("<MouseWheel>", self._on_mousewheel)
+        tree.bind("<Button-4>", lambda event: self.scroll(-3))
+        tree.bind("<Button-5>", lambda event: self.scroll(3))
+        tree.bind("<Up>", self._on_key_up)
+        tree.bind("<Down>", self._on_key_down)
+        tree.bind("<Prior>", lambda event: self._scroll_key(-self.visible))
+        tree.bind("<Next>", lambda event: self._scroll_key(self.visible))
+
+    def set_source(self, count_rows, fetch_after, fetch_before, fetch_at):
+        # count_rows() -> int
+        # fetch_after(after_id, limit) / fetch_before(before_id, limit) -> rows in id order
+        # fetch_at(offset, limit) -> rows in id order
+        self.count_rows = count_rows
+        self.fetch_after = fetch_after
+        self.fetch_before = fetch_before
+        self.fetch_at = fetch_at
+
+    def reload(self, keep_position=False):
+        self.total = self.count_rows()
+        self.buffer = []
+        self.buffer_start = 0
+        self.show(self.top if keep_position else 0)
+
+    def load(self, total, rows, buffer_start, top):
+        # Show a window that was fetched elsewhere, e.g. by a background task
+        self.total = total
+        self.buffer = list(rows)
+        self.buffer_start = buffer_start
+        self.show(top)
+
+    def set_total(self, total):
+        # The real row count once it is known, after load() was given the
+        # first page with a provisional total; keeps the scroll position
+        self.total = total
+        self.show(self.top)
+
+    def append(self, rows, follow=False):
+        # Rows just added to the source, after every row it already has (not
+        # an entry moved back from its archive with its old id, see
+        # insert_rows). A view at the end scrolls on to show them, any view
+        # does with follow.
+        at_end = self.top + self.visible >= self.total
+        if self._buffer_end() == self.total:
+            last_id = self.buffer[-1][0] if self.buffer else None
+            rows = [row for row in rows if last_id is None or row[0] > last_id]
+            self.buffer.extend(rows)
+        self.total += len(rows)
+        self.show(self.total - self.visible if follow or at_end else self.top)
+
+    # --- Incremental changes ---
+    # Applied to the buffered rows only; a row outside the buffer is fetched
+    # when scrolled to. Only Treeview items on screen are touched.
+
+    def replace_rows(self, rows):
+        # Rows edited in place; returns those that are not in the buffer
+        missing = []
+        for row in rows:
+            index = self._buffer_index(row[0])
+            if index is None:
+                missing.append(row)
+                continue
+            self.buffer[index] = row
+            if self.tree.exists(str(row[0])):
+                self.tree.item(str(row[0]), values=self._values(row))
+        return missing
+
+    def insert_rows(self, rows):
+        # Rows new to the source, e.g. edited into matching the search. Those
+        # whose id falls inside the buffered window go in at their place and
+        # push the rows below them down; returns the others.
+        missing = []
+        inserted = False
+        for row in rows:
+            if not self.buffer or not self.buffer[0][0] < row[0] < self.buffer[-1][0]:
+                missing.append(row)
+                continue
+            self.buffer.insert(bisect_left(self.buffer, row[0], key=lambda buffered: buffered[0]), row)
+            self.total += 1
+            inserted = True
+        if inserted:
+            self.show(self.top)
+        return missing
+
+    def remove_rows(self, ids):
+        # Rows gone from the source; returns the ids that are not in the buffer
+        missing = []
+        removed = False
+        for row_id in ids:
+            index = self._buffer_index(row_id)
+            if index is None:
+                missing.append(row_id)
+                continue
+            del self.buffer[index]
+            self.total -= 1
+            removed = True
+        if removed:
+            # Rows below move up into the gap; keeps the scroll position
+            self.show(self.top)
+        return missing
+
+    def recount(self):
+        # The source changed somewhere outside the buffer: resize the scrollbar
+        # and refill the buffer, staying at the same position: rows added or
+        # removed before the buffer shift its offsets
+        self.total = self.count_rows()
+        self.buffer = []
+        self.show(self.top)
+
+    def row(self, iid):
+        # The buffered row behind a Treeview item, with its values as stored:
+        # Tk would turn an article like "007" into the number 7
+        index = self._buffer_index(int(iid))
+        return self.buffer[index] if index is not None else None
+
+    def _buffer_index(self, row_id):
+        index = bisect_left(self.buffer, row_id, key=lambda row: row[0])
+        if index < len(self.buffer) and self.buffer[index][0] == row_id:
+            return index
+        return None
+
+    def show(self, top):
+        top = max(0, min(int(top), self.total - self.visible))
+        self.top = top
+        self._ensure_buffer()
+        self._render()
+
+    def scroll(self, step):
+        self.show(self.top + step)
+
+    def yview(self, *args):
+        if not args or not self.total:
+            return
+        if args[0] == "moveto":
+            self.show(float(args[1]) * self.total)
+        elif args[0] == "scroll":
+            step = int(args[1])
+            if args[2] == "pages":
+                step *= self.visible
+            self.scroll(step)
+
+    def visible_rows(self):
+        start = self.top - self.buffer_start
+        return self.buffer[start:start + self.visible]
+
+    # --- Buffer management ---
+
+    def _buffer_end(self):
+        return self.buffer_start + len(self.buffer)
+
+    def _ensure_buffer(self):
+        want_end = min(self.total, self.top + self.visible)
+        if self.buffer and self.buffer_start <= self.top and want_end <= self._buffer_end():
+            return
+
+        window = self.visible + 2 * self.prefetch
+        if self.buffer and self.buffer_start <= self.top <= self._buffer_end() + self.prefetch:
+            # Scrolled past the end of the buffer: continue after the last known id
+            missing = want_end + self.prefetch - self._buffer_end()
+            self.buffer.extend(self.fetch_after(self.buffer[-1][0], missing))
+        elif self.buffer and self.buffer_start - self.prefetch <= self.top < self.buffer_start:
+            # Scrolled just above the buffer: continue before the first known id
+            missing = self.buffer_start - max(0, self.top - self.prefetch)
+            rows = self.fetch_before(self.buffer[0][0], missing)
+            self.buffer = rows + self.buffer
+            self.buffer_start -= len(rows)
+        else:
+            # Jump (scrollbar drag, first load): seek to the offset once
+            self.buffer_start = max(0, self.top - self.prefetch)
+            self.buffer = self.fetch_at(self.buffer_start, window)
+        self._trim_buffer(window)
+
+    def _trim_buffer(self, window):
+        # Keep memory bounded to the window around the visible rows
+        keep_start = max(self.buffer_start, self.top - self.prefetch)
+        drop = keep_start - self.buffer_start
+        if drop > 0:
+            del self.buffer[:drop]
+            self.buffer_start = keep_start
+        if len(self.buffer) > window:
+            del self.buffer[window:]
+
+    # --- Rendering ---
+
+    def _render(self):
+        selected = set(self.tree.selection())
+        focused = self.tree.focus()
+        self.tree.delete(*self.tree.get_children())
+        for row in self.visible_rows():
+            self.tree.insert('', END, iid=str(row[0]), values=self._values(row))
+        keep = [iid for iid in selected if self.tree.exists(iid)]
+        if keep:
+            self.tree.selection_set(keep)
+        if focused and self.tree.exists(focused):
+            self.tree.focus(focused)
+        self._update_scrollbar()
+
+    @staticmethod
+    def _values(row):
+        return ["" if value is None else value for value in row]
+
+    def _update_scrollbar(self):
+        if self.total <= 0:
+            self.scrollbar.set(0.0, 1.0)
+            return
+        first = self.top / self.total
+        last = min(1.0, (self.top + self.visible) / self.total)
+        self.scrollbar.set(first, last)
+
+    # --- Event handlers ---
+
+    def _on_configure(self, event):
+        row_height = self._row_height()
+        visible = max(1, (event.height - HEADER_HEIGHT) // row_height)
+        if visible != self.visible:
+            self.visible = visible
+            if self.count_rows:
+                self.show(self.top)
+
+    def _row_height(self):
+        from tkinter.ttk import Style
+        try:
+            return int(Style().lookup("Treeview", "rowheight")) or DEFAULT_ROW_HEIGHT
+        except (TypeError, ValueError):
+            return DEFAULT_ROW_HEIGHT
+
+    def _on_mousewheel(self, event):
+        self.scroll(-3 if event.delta > 0 else 3)
+        return "break"
+
+    def _scroll_key(self, step):
+        self.scroll(step)
+        return "break"
+
+    def _on_key_up(self, event):
+        children = self.tree.get_children()
+        if children and self.tree.focus() == children[0] and self.top > 0:
+            self.scroll(-1)
+            self._move_focus(self.tree.get_children()[0])
+            return "break"
+
+    def _on_key_down(self, event):
+        children = self.tree.get_children()
+        if children and self.tree.focus() == children[-1] and self.top + self.visible < self.total:
+            self.scroll(1)
+            self._move_focus(self.tree.get_children()[-1])
+            return "break"
+
+    def _move_focus(self, iid):
+        self.tree.focus(iid)
+        self.tree.selection_set(iid)
@@ -0,0 +1,155 @@
+# query_cache.py - Results of recent searches, shared by the grid and the exports
+
+# Operators flip between the same few searches (today, one card, printed
+# only), and an export usually repeats the search on screen. QueryCache keeps
+# the row counts, totals and, for results of up to FULL_RESULT_ROWS entries,
+# the rows themselves, least recently used first out once QUERY_CACHE_BYTES
+# is reached.
+#
+# The write generation is the change log's latest seq (db.entry_changes):
+# every insert, update and delete bumps it through triggers, whichever window,
+# process or station made it. Each cached read first checks it and drops
+# everything once it moved, so a cached result is never stale.
+
+import sys
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from db import normalize_date
+
+QUERY_CACHE_BYTES = 64 * 1024 * 1024
+
+# Results up to this size are fetched and kept whole; larger ones stream
+FULL_RESULT_ROWS = 20000
+
+def filter_key(filters):
+    # Filters that select the same rows give the same key: missing and empty
+    # terms are alike, dates are normalized and invalid ones ignored as in
+    # db.build_filter_clause
+    filters = filters or {}
+    return (filters.get("article") or "", filters.get("card") or "", filters.get("print_opt") or "",
+            normalize_date(filters.get("start_date")), normalize_date(filters.get("end_date")))
+
+def result_size(value):
+    # Rough bytes held by a cached value (a number or a list of row tuples)
+    if not isinstance(value, list):
+        return sys.getsizeof(value)
+    return sys.getsizeof(value) + sum(sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row) for row in value)
+
+class QueryCache:
+    def __init__(self, max_bytes=QUERY_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def reader(self, reader, fill_rows=True):
+        return CachedReader(reader, self, fill_rows)
+
+    def get(self, generation, key):
+        with self._lock:
+            if generation != self.generation:
+                self._results.clear()
+                self.size = 0
+                self.generation = generation
+            entry = self._results.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._results.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, generation, key, value):
+        size = result_size(value)
+        with self._lock:
+            if generation != self.generation or size > self.max_bytes:
+                return
+            previous = self._results.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self._results[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, dropped) = self._results.popitem(last=False)
+                self.size -= dropped
+
+class CachedReader:
+    # The dal.Reader queries, answered from the cache where it can. Without
+    # fill_rows (a reader on the Tk thread) whole results are only used once
+    # a background reader has cached them: loading one takes up to
+    # FULL_RESULT_ROWS rows, several round trips to a server, where a keyset
+    # query returns one page.
+    def __init__(self, reader, cache, fill_rows=True):
+        self.reader = reader
+        self.cache = cache
+        self.fill_rows = fill_rows
+
+    def _cached(self, generation, key, query):
+        value = self.cache.get(generation, key)
+        if value is None:
+            value = query()
+            self.cache.put(generation, key, value)
+        return value
+
+    def _count(self, generation, filters):
+        return self._cached(generation, ("count", filter_key(filters)), lambda: self.reader.count_entries(filters))
+
+    def _all_rows(self, generation, filters, count_first=True):
+        # Every matching row when the result is small enough to keep, else
+        # None. Without count_first a search whose size is not known yet is
+        # not counted here, so its first page can come back before COUNT(*).
+        if count_first:
+            count = self._count(generation, filters)
+        else:
+            count = self.cache.get(generation, ("count", filter_key(filters)))
+        if count is None or count > FULL_RESULT_ROWS:
+            return None
+        if not self.fill_rows:
+            return self.cache.get(generation, ("rows", filter_key(filters)))
+        return self._cached(generation, ("rows", filter_key(filters)), lambda: list(self.reader.iter_entries(filters)))
+
+    def count_entries(self, filters=None):
+        return self._count(self.reader.latest_change(), filters)
+
+    def fetch_totals(self, group_by, filters=None):
+        return list(self._cached(self.reader.latest_change(), ("totals", group_by, filter_key(filters)),
+                                 lambda: self.reader.fetch_totals(group_by, filters)))
+
+    def fetch_entries_after(self, filters, after_id, limit):
+        rows = self._all_rows(self.reader.latest_change(), filters, count_first=False)
+        if rows is None:
+            return self.reader.fetch_entries_after(filters, after_id, limit)
+        start = bisect_right(rows, after_id, key=lambda row: row[0])
+        return rows[start:start + limit]
+
+    def fetch_entries_before(self, filters, before_id, limit):
+        rows = self._all_rows(self.reader.latest_change(), filters, count_first=False)
+        if rows is None:
+            return self.reader.fetch_entries_before(filters, before_id, limit)
+        end = bisect_left(rows, before_id, key=lambda row: row[0])
+        return rows[max(0, end - limit):end]
+
+    def fetch_entries_at(self, filters, offset, limit):
+        rows = self._all_rows(self.reader.latest_change(), filters, count_first=False)
+        if rows is None:
+            return self.reader.fetch_entries_at(filters, offset, limit)
+        return rows[offset:offset + limit]
+
+    def iter_entries(self, filters=None):
+        rows = self._all_rows(self.reader.latest_change(), filters)
+        return iter(rows) if rows is not None else self.reader.iter_entries(filters)
+
+    # --- Not cached ---
+
+    def fetch_entries_by_id(self, ids):
+        return self.reader.fetch_entries_by_id(ids)
+
+    def latest_change(self):
+        return self.reader.latest_change()
+
+    def fetch_changes(self, after_seq):
+        return self.reader.fetch_changes(after_seq)
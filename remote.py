@@ -0,0 +1,211 @@
+# remote.py - Client for the shared database server (server.py)
+
+# RemoteDatabase stands in for dal.Database wherever service.py or the UI take
+# a database: the same reading()/open_reader() queries, entry writes and
+# bulk_insert, each one a JSON request to the server. Every thread keeps its
+# own keep-alive connection, so the Tk thread paging the grid never waits
+# behind a worker's export, just as with dal.Database.open_reader().
+
+import http.client
+import json
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlencode, urlsplit
+from db import BULK_BATCH_SIZE, ENTRY_FIELDS, EXPORT_CHUNK_SIZE, IDS_PER_QUERY, BulkLoadStats
+from query_cache import QueryCache
+
+DEFAULT_PORT = 8750
+
+# Seconds to wait for an answer; a large folder import is committed in one go
+REQUEST_TIMEOUT = 600
+
+# Keep-alive connections idle this long are reopened before the next request.
+# The server closes them after server.KEEP_ALIVE_TIMEOUT (300 s), and a request
+# sent down a connection it has just closed cannot tell whether it arrived.
+IDLE_RECONNECT = 240
+
+class RemoteError(OSError):
+    # The server failed to carry out a request
+    pass
+
+class RemoteDatabase:
+    def __init__(self, url):
+        parts = urlsplit(url if "://" in url else f"http://{url}")
+        if parts.scheme != "http" or not parts.hostname:
+            raise ValueError(f"Invalid server address '{url}', use http://host:port.")
+        self.host = parts.hostname
+        self.port = parts.port or DEFAULT_PORT
+        self.url = f"http://{self.host}:{self.port}"
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self.cache = QueryCache()
+        self.closed = False
+
+    def _connection(self):
+        if self.closed:
+            raise RemoteError("Connection to the server is closed.")
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=REQUEST_TIMEOUT)
+            with self._lock:
+                self._connections.append(conn)
+            self._local.conn = conn
+        elif time.monotonic() - self._local.used > IDLE_RECONNECT:
+            conn.close()  # reconnects on the next request
+        self._local.used = time.monotonic()
+        return conn
+
+    def request(self, method, path, params=None, body=None, retry=None):
+        # retry sends the request again when the connection drops before the
+        # answer came; by default only requests that are safe to repeat (all
+        # but POST) are. One that dropped while being sent never reached the
+        # server whole and is always sent again.
+        if retry is None:
+            retry = method != "POST"
+        if params:
+            path += "?" + urlencode({name: value for name, value in params.items() if value not in (None, "")})
+        payload = json.dumps(body, separators=(",", ":")).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        conn = self._connection()
+        try:
+            conn.request(method, path, payload, headers)
+        except (BrokenPipeError, ConnectionResetError):
+            conn.close()
+            conn.request(method, path, payload, headers)
+        try:
+            response = conn.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError):
+            conn.close()
+            if not retry:
+                raise RemoteError(f"The connection to {self.url} dropped before it answered; "
+                                  f"the change may or may not have been saved.")
+            conn.request(method, path, payload, headers)
+            response = conn.getresponse()
+        data = response.read()
+
+        try:
+            result = json.loads(data) if data else {}
+        except ValueError:
+            raise RemoteError(f"Unexpected answer from {self.url}: HTTP {response.status}")
+        if response.status >= 400:
+            message = result.get("error") or response.reason
+            if response.status < 500:
+                raise ValueError(message)
+            raise RemoteError(f"Server error: {message}")
+        return result
+
+    # --- Queries, as on dal.Reader ---
+
+    @contextmanager
+    def reading(self, watch=None):
+        # watch installs a SQLite cancellation handler, which cannot reach the
+        # server; cancelled tasks stop at their next request or progress call
+        yield self.cache.reader(self)
+
+    def open_reader(self):
+        return self.cache.reader(self, fill_rows=False)
+
+    def count_entries(self, filters=None):
+        return self.request("GET", "/entries/count", filters)["count"]
+
+    def fetch_entries_after(self, filters, after_id, limit):
+        return self._rows("/entries", filters, after=after_id, limit=limit)
+
+    def fetch_entries_before(self, filters, before_id, limit):
+        return self._rows("/entries", filters, before=before_id, limit=limit)
+
+    def fetch_entries_at(self, filters, offset, limit):
+        return self._rows("/entries", filters, offset=offset, limit=limit)
+
+    def fetch_entries_by_id(self, ids):
+        ids = sorted(ids)
+        rows = []
+        # Keeps the query string short; same chunk size as the server's lookups
+        for start in range(0, len(ids), IDS_PER_QUERY):
+            chunk = ids[start:start + IDS_PER_QUERY]
+            rows.extend(self._rows("/entries", None, ids=",".join(map(str, chunk))))
+        return rows
+
+    def fetch_totals(self, group_by, filters=None):
+        return self._rows("/totals", filters, by=group_by)
+
+    def latest_change(self):
+        return self.request("GET", "/changes/latest")["seq"]
+
+    def fetch_changes(self, after_seq):
+        return [tuple(change) for change in self.request("GET", "/changes", {"after": after_seq})["changes"]]
+
+    def iter_entries(self, filters=None):
+        # Pages through the matches by id, like db.iter_entries
+        after_id = 0
+        while True:
+            rows = self.fetch_entries_after(filters, after_id, EXPORT_CHUNK_SIZE)
+            yield from rows
+            if len(rows) < EXPORT_CHUNK_SIZE:
+                break
+            after_id = rows[-1][0]
+
+    def _rows(self, path, filters, **params):
+        return [tuple(row) for row in self.request("GET", path, dict(filters or {}, **params))["rows"]]
+
+    # --- Writes ---
+
+    def insert_entry(self, data):
+        return self.request("POST", "/entries", body=dict(zip(ENTRY_FIELDS, data)))["id"]
+
+    def insert_entries(self, rows, batch=None):
+        # With a batch key the server saves the rows only once however often
+        # they are sent, see db.insert_entries
+        entries = [dict(zip(ENTRY_FIELDS, data)) for data in rows]
+        return self.request("POST", "/entries/batch", body={"entries": entries, "batch": batch},
+                            retry=batch is not None)["ids"]
+
+    def update_entry(self, entry_id, data):
+        self.request("PUT", f"/entries/{entry_id}", body=dict(zip(ENTRY_FIELDS, data)))
+
+    def delete_entry(self, entry_id):
+        self.request("DELETE", f"/entries/{entry_id}")
+
+    def bulk_insert(self, rows, defer_indexes=False, progress=None, duplicates=None, checkpoint=None):
+        # Everything is sent as one request and committed as one transaction
+        # on the server. progress(rows_so_far) reports reading the rows and
+        # may raise to abort before anything is sent.
+        batch = []
+        for row in rows:
+            batch.append(list(row))
+            if progress and len(batch) % BULK_BATCH_SIZE == 0:
+                progress(len(batch))
+        if progress:
+            progress(len(batch))
+        result = self.request("POST", "/import", body={"rows": batch, "defer_indexes": defer_indexes,
+                                                       "duplicates": duplicates, "checkpoint": checkpoint})
+        return BulkLoadStats(result["rows"], result["seconds"], result["duplicates"], result["updated"],
+                             result["not_summed"])
+
+    def archive_old_entries(self, progress=None):
+        # The server archives its database itself (server.archive_periodically)
+        return {}
+
+    # --- Checkpointed import jobs, kept on the server ---
+
+    def start_import_job(self, file_hash, source, kind, options):
+        # The server hands out the same running job for the same file again
+        result = self.request("POST", "/import-jobs", body={"file_hash": file_hash, "source": source,
+                                                            "kind": kind, "options": options}, retry=True)
+        return result["id"], result["last_row"], result["entries"]
+
+    def finish_import_job(self, job_id, status="done"):
+        self.request("POST", f"/import-jobs/{job_id}/finish", body={"status": status}, retry=True)
+
+    def unfinished_import_jobs(self):
+        return [tuple(job) for job in self.request("GET", "/import-jobs")["jobs"]]
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            connections = self._connections
+            self._connections = []
+        for conn in connections:
+            conn.close()
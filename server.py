@@ -0,0 +1,462 @@
+# server.py - One production database shared by every station over HTTP/JSON
+#
+# Usage: python -m server [--db PATH] [--host 127.0.0.1] [--port 8750]
+#
+# Run it on the machine that holds database.db and start the dashboard or the
+# command line on each station with HYPE_SERVER=http://<that machine>:8750
+# (see remote.py). Listening on anything but localhost (--host 0.0.0.0) is
+# meant for the shop's own network: there is no login on the API.
+#
+# One asyncio loop serves every connection. Reads run on threads, one per
+# pooled reader connection of dal.Database, so they proceed side by side under
+# WAL. Writes queue up for a single writer thread, which commits everything
+# that queued up meanwhile as one transaction (group commit): a dozen stations
+# saving at once cost one fsync instead of twelve and never fight over
+# SQLite's file lock.
+#
+# Endpoints (filters are the query parameters article, card, print_opt,
+# start_date and end_date; entries are objects with db.ENTRY_FIELDS keys):
+#   GET    /entries?after=ID | before=ID | offset=N, &limit=N   {"rows": [...]} in id order
+#   GET    /entries?ids=ID,ID,...                               {"rows": [...]} those still there
+#   GET    /entries/count                                      {"count": N}
+#   GET    /totals?by=Article|Color|Size|Day                   {"rows": [[group, entries, qty], ...]}
+#   POST   /entries        entry                                {"id": N}
+#   POST   /entries/batch  {"entries": [entry, ...], "batch": key} {"ids": [N, ...]} all or none; a batch
+#                          key already committed returns its ids again (see db.insert_entries)
+#   PUT    /entries/ID     entry                                {"updated": 0 or 1}
+#   DELETE /entries/ID                                          {"deleted": 0 or 1}
+#   GET    /changes?after=SEQ                                   {"changes": [[seq, id, op], ...]}
+#   GET    /changes/latest                                     {"seq": N}
+#   POST   /import         {"rows": [[8 values], ...], "defer_indexes": false, "duplicates": null,
+#                           "checkpoint": null or [job ID, last row]}
+#                          one transaction                      {"rows": N, "seconds": S}
+#   GET    /import-jobs                                         {"jobs": [[id, source, kind, options, ...], ...]}
+#   POST   /import-jobs    {"file_hash", "source", "kind", "options"}
+#                                                               {"id": N, "last_row": N, "entries": N}
+#   POST   /import-jobs/ID/finish  {"status": "done"}           {}
+# Failures come back as {"error": message}: 400 for bad input, 404, 500.
+
+import argparse
+import asyncio
+import json
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+from dal import Database, READER_POOL_SIZE
+from db import (DB_NAME, DELETE_ENTRY, DUPLICATE_POLICIES, ENTRY_FIELDS, EXPORT_CHUNK_SIZE, IDS_PER_QUERY, INSERT_ENTRY,
+                TOTALS_GROUPS, UPDATE_ENTRY, archive_old_entries, bulk_insert, delete_archived_entry, finish_import_job,
+                init_db, insert_entries, start_import_job, update_archived_entry)
+from remote import DEFAULT_PORT
+import service
+
+# Most writes committed together in one transaction
+GROUP_COMMIT_MAX_WRITES = 500
+
+# Largest page of rows one GET /entries returns
+MAX_PAGE_ROWS = EXPORT_CHUNK_SIZE
+
+# Largest request body; a million-row import is roughly 100 MB of JSON
+MAX_BODY_BYTES = 512 * 1024 * 1024
+
+# Idle keep-alive connections are closed after this many seconds
+KEEP_ALIVE_TIMEOUT = 300
+
+# Seconds between checks for a year to archive (see db.archive_old_entries)
+ARCHIVE_INTERVAL = 24 * 60 * 60
+
+FILTER_PARAMS = ("article", "card", "print_opt", "start_date", "end_date")
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+# --- Writer ---
+
+class GroupCommitWriter:
+    # Serializes every write through the one writer connection. Writes that
+    # queue up while a transaction is being committed go into the next one
+    # together, each in its own savepoint so a failing write is rolled back
+    # without taking the rest of its group with it.
+    def __init__(self, database):
+        self.database = database
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="hype-writer")
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+        self.executor.shutdown(wait=True)
+
+    async def submit(self, operation, alone=False):
+        # operation(conn) runs on the writer thread and its result is returned.
+        # alone=True commits it in a transaction of its own, for operations
+        # that manage the transaction themselves (db.bulk_insert).
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((operation, alone, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        held = None
+        while True:
+            first = held or await self.queue.get()
+            held = None
+            group = [first]
+            if not first[1]:
+                while len(group) < GROUP_COMMIT_MAX_WRITES and not self.queue.empty():
+                    item = self.queue.get_nowait()
+                    if item[1]:
+                        held = item
+                        break
+                    group.append(item)
+
+            operations = [operation for operation, _, _ in group]
+            try:
+                if first[1]:
+                    outcomes = await loop.run_in_executor(self.executor, self._commit_alone, operations[0])
+                else:
+                    outcomes = await loop.run_in_executor(self.executor, self._commit_group, operations)
+            except Exception as e:
+                # The commit itself failed: nothing in the group was written
+                outcomes = [(False, e)] * len(group)
+
+            for (_, _, future), (succeeded, value) in zip(group, outcomes):
+                if future.done():
+                    continue
+                if succeeded:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def _commit_alone(self, operation):
+        with self.database.write() as conn:
+            return [(True, operation(conn))]
+
+    def _commit_group(self, operations):
+        outcomes = []
+        with self.database.write() as conn:
+            # An explicit BEGIN, or releasing the first savepoint would commit
+            conn.execute("BEGIN")
+            for operation in operations:
+                conn.execute("SAVEPOINT write")
+                try:
+                    outcomes.append((True, operation(conn)))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write")
+                    outcomes.append((False, e))
+                conn.execute("RELEASE write")
+        return outcomes
+
+# --- Request helpers ---
+
+def filters_from(params):
+    return service.make_filters(*(params.get(name, "") for name in FILTER_PARAMS))
+
+def int_param(params, name, default=None, minimum=0):
+    value = params.get(name)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST, f"'{name}' must be a whole number.")
+    if number < minimum:
+        raise HttpError(HTTPStatus.BAD_REQUEST, f"'{name}' must be at least {minimum}.")
+    return number
+
+def entry_from(body):
+    # The validated entry tuple from a JSON entry object
+    if not isinstance(body, dict):
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Expected an entry object.")
+    values = {}
+    for field in ENTRY_FIELDS:
+        value = body.get(field)
+        values[field] = value if value is None or field == "qty" else str(value)
+    return service.validate_entry(values["article"], values["card"] or "", values["color"] or "",
+                                  values["size"] or "", values["qty"], values["component"] or "",
+                                  values["print_opt"] or "Yes", values["date"])
+
+def import_rows_from(body):
+    # The validated entry tuples of an import, checked like single entries:
+    # the first bad row rejects the whole import before anything is written
+    rows = body.get("rows") if isinstance(body, dict) else None
+    if not isinstance(rows, list):
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Expected {\"rows\": [...]}.")
+    entries = []
+    for number, row in enumerate(rows, 1):
+        if not isinstance(row, list) or len(row) != len(ENTRY_FIELDS):
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"Every row needs {len(ENTRY_FIELDS)} values.")
+        try:
+            entries.append(entry_from(dict(zip(ENTRY_FIELDS, row))))
+        except ValueError as e:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"Row {number}: {e}")
+    return entries
+
+def checkpoint_from(body):
+    checkpoint = body.get("checkpoint")
+    if checkpoint is None:
+        return None
+    if (not isinstance(checkpoint, list) or len(checkpoint) != 2
+            or not all(isinstance(value, int) for value in checkpoint)):
+        raise HttpError(HTTPStatus.BAD_REQUEST, "'checkpoint' must be [job id, last row].")
+    return tuple(checkpoint)
+
+def import_job_from(body):
+    if not isinstance(body, dict) or not all(isinstance(body.get(name), str) for name in ("file_hash", "source", "kind")):
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Expected {\"file_hash\", \"source\", \"kind\", \"options\"}.")
+    return body["file_hash"], body["source"], body["kind"], body.get("options") or {}
+
+# --- Server ---
+
+class EntryServer:
+    def __init__(self, database):
+        self.database = database
+        self.writer = GroupCommitWriter(database)
+        self.readers = ThreadPoolExecutor(max_workers=READER_POOL_SIZE, thread_name_prefix="hype-reader")
+
+    async def read(self, query):
+        # query(reader) on a pooled reader connection, off the event loop
+        def run():
+            with self.database.reading() as reader:
+                return query(reader)
+        return await asyncio.get_running_loop().run_in_executor(self.readers, run)
+
+    async def handle(self, method, path, params, body):
+        parts = path.strip("/").split("/")
+        if parts == ["entries"]:
+            if method == "GET":
+                return await self.list_entries(params)
+            if method == "POST":
+                data = entry_from(body)
+                return {"id": await self.writer.submit(lambda conn: conn.execute(INSERT_ENTRY, data).lastrowid)}
+        elif parts == ["entries", "batch"] and method == "POST":
+            entries = body.get("entries") if isinstance(body, dict) else None
+            if not isinstance(entries, list):
+                raise HttpError(HTTPStatus.BAD_REQUEST, "Expected {\"entries\": [...]}.")
+            rows = [entry_from(entry) for entry in entries]
+            batch = body.get("batch")
+            if batch is not None and not isinstance(batch, str):
+                raise HttpError(HTTPStatus.BAD_REQUEST, "'batch' must be a string.")
+            return {"ids": await self.writer.submit(lambda conn: insert_entries(conn, rows, batch))}
+        elif parts == ["entries", "count"] and method == "GET":
+            filters = filters_from(params)
+            return {"count": await self.read(lambda reader: reader.count_entries(filters))}
+        elif len(parts) == 2 and parts[0] == "entries" and parts[1].isdigit():
+            entry_id = int(parts[1])
+            # An entry missing from the main file is looked for in the
+            # archives, in a transaction of its own: attaching one needs that
+            if method == "PUT":
+                data = entry_from(body)
+                updated = await self.writer.submit(lambda conn: conn.execute(UPDATE_ENTRY, data + (entry_id,)).rowcount)
+                if not updated:
+                    updated = await self.writer.submit(lambda conn: update_archived_entry(conn, entry_id, data),
+                                                       alone=True)
+                return {"updated": updated}
+            if method == "DELETE":
+                deleted = await self.writer.submit(lambda conn: conn.execute(DELETE_ENTRY, (entry_id,)).rowcount)
+                if not deleted:
+                    deleted = await self.writer.submit(lambda conn: delete_archived_entry(conn, entry_id), alone=True)
+                return {"deleted": deleted}
+        elif parts == ["changes"] and method == "GET":
+            after_seq = int_param(params, "after", 0)
+            return {"changes": await self.read(lambda reader: reader.fetch_changes(after_seq))}
+        elif parts == ["changes", "latest"] and method == "GET":
+            return {"seq": await self.read(lambda reader: reader.latest_change())}
+        elif parts == ["totals"] and method == "GET":
+            group_by = params.get("by")
+            if group_by not in TOTALS_GROUPS:
+                raise HttpError(HTTPStatus.BAD_REQUEST, f"'by' must be one of {', '.join(TOTALS_GROUPS)}.")
+            filters = filters_from(params)
+            return {"rows": await self.read(lambda reader: reader.fetch_totals(group_by, filters))}
+        elif parts == ["import"] and method == "POST":
+            rows = import_rows_from(body)
+            defer_indexes = bool(body.get("defer_indexes"))
+            duplicates = body.get("duplicates")
+            if duplicates is not None and duplicates not in DUPLICATE_POLICIES:
+                raise HttpError(HTTPStatus.BAD_REQUEST, f"'duplicates' must be one of {', '.join(DUPLICATE_POLICIES)}.")
+            checkpoint = checkpoint_from(body)
+            stats = await self.writer.submit(
+                lambda conn: bulk_insert(conn, rows, defer_indexes=defer_indexes, duplicates=duplicates,
+                                         checkpoint=checkpoint), alone=True)
+            return {"rows": stats.rows, "seconds": stats.seconds, "duplicates": stats.duplicates,
+                    "updated": stats.updated, "not_summed": stats.not_summed}
+        elif parts == ["import-jobs"]:
+            if method == "GET":
+                loop = asyncio.get_running_loop()
+                return {"jobs": await loop.run_in_executor(self.readers, self.database.unfinished_import_jobs)}
+            if method == "POST":
+                job = import_job_from(body)
+                job_id, last_row, entries = await self.writer.submit(
+                    lambda conn: start_import_job(conn, *job), alone=True)
+                return {"id": job_id, "last_row": last_row, "entries": entries}
+        elif len(parts) == 3 and parts[0] == "import-jobs" and parts[1].isdigit() and parts[2] == "finish":
+            if method == "POST":
+                job_id = int(parts[1])
+                status = body.get("status", "done") if isinstance(body, dict) else "done"
+                if status not in ("done", "abandoned"):
+                    raise HttpError(HTTPStatus.BAD_REQUEST, "'status' must be done or abandoned.")
+                await self.writer.submit(lambda conn: finish_import_job(conn, job_id, status), alone=True)
+                return {}
+        raise HttpError(HTTPStatus.NOT_FOUND, f"No {method} {path}.")
+
+    async def list_entries(self, params):
+        if "ids" in params:
+            try:
+                ids = [int(value) for value in params["ids"].split(",") if value]
+            except ValueError:
+                raise HttpError(HTTPStatus.BAD_REQUEST, "'ids' must be whole numbers.")
+            if len(ids) > IDS_PER_QUERY:
+                raise HttpError(HTTPStatus.BAD_REQUEST, f"At most {IDS_PER_QUERY} ids per request.")
+            return {"rows": await self.read(lambda reader: reader.fetch_entries_by_id(ids))}
+        filters = filters_from(params)
+        limit = min(int_param(params, "limit", MAX_PAGE_ROWS, minimum=1), MAX_PAGE_ROWS)
+        if "after" in params:
+            after_id = int_param(params, "after")
+            query = lambda reader: reader.fetch_entries_after(filters, after_id, limit)
+        elif "before" in params:
+            before_id = int_param(params, "before")
+            query = lambda reader: reader.fetch_entries_before(filters, before_id, limit)
+        else:
+            offset = int_param(params, "offset", 0)
+            query = lambda reader: reader.fetch_entries_at(filters, offset, limit)
+        return {"rows": await self.read(query)}
+
+    async def respond(self, method, target, body):
+        # (status, payload) for one request; never raises
+        url = urlsplit(target)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            try:
+                payload = json.loads(body) if body else None
+            except ValueError:
+                raise HttpError(HTTPStatus.BAD_REQUEST, "Request body is not valid JSON.")
+            return HTTPStatus.OK, await self.handle(method, url.path, params, payload)
+        except HttpError as e:
+            return e.status, {"error": str(e)}
+        except (ValueError, sqlite3.IntegrityError) as e:
+            return HTTPStatus.BAD_REQUEST, {"error": str(e)}
+        except Exception as e:
+            print(f"{method} {url.path} failed: {e!r}", file=sys.stderr)
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}
+
+    async def handle_connection(self, stream_reader, stream_writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(read_request(stream_reader), KEEP_ALIVE_TIMEOUT)
+                except HttpError as e:
+                    stream_writer.write(encode_response(e.status, {"error": str(e)}, keep_alive=False))
+                    await stream_writer.drain()
+                    break
+                if request is None:
+                    break
+                method, target, keep_alive, body = request
+                status, payload = await self.respond(method, target, body)
+                stream_writer.write(encode_response(status, payload, keep_alive))
+                await stream_writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            stream_writer.close()
+
+    async def archive_periodically(self):
+        # Moves years that fell out of the live window to their archives, at
+        # start and then daily; other writes wait while a year is moved
+        while True:
+            try:
+                moved = await self.writer.submit(archive_old_entries, alone=True)
+                for year, entries in moved.items():
+                    print(f"Archived {entries:,} entries from {year}", flush=True)
+            except Exception as e:
+                print(f"Archiving failed: {e!r}", file=sys.stderr)
+            await asyncio.sleep(ARCHIVE_INTERVAL)
+
+    def close(self):
+        self.writer.stop()
+        self.readers.shutdown(wait=True)
+
+async def read_request(stream_reader):
+    # (method, target, keep_alive, body) of the next HTTP/1.1 request, or None
+    # once the client has closed the connection
+    try:
+        request_line = await stream_reader.readline()
+        if not request_line:
+            return None
+        method, target, version = request_line.decode("latin-1").split()
+        headers = {}
+        while True:
+            line = await stream_reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+    except (ValueError, asyncio.LimitOverrunError):
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Malformed request.")
+
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        raise HttpError(HTTPStatus.LENGTH_REQUIRED, "Send a Content-Length instead of chunks.")
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length.")
+    if length > MAX_BODY_BYTES:
+        raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body is too large.")
+    body = await stream_reader.readexactly(length) if length else b""
+
+    connection = headers.get("connection", "").lower()
+    keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+    return method.upper(), target, keep_alive, body
+
+def encode_response(status, payload, keep_alive):
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode("latin-1") + body
+
+async def serve(database, host="127.0.0.1", port=DEFAULT_PORT, on_ready=None):
+    # Serves until cancelled; on_ready(port) is called once listening, with
+    # the port actually bound (useful with port=0)
+    server = EntryServer(database)
+    listener = await asyncio.start_server(server.handle_connection, host, port)
+    server.writer.start()
+    archiver = asyncio.create_task(server.archive_periodically())
+    try:
+        if on_ready:
+            on_ready(listener.sockets[0].getsockname()[1])
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        archiver.cancel()
+        server.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m server", description="Share one production database over HTTP")
+    parser.add_argument("--db", default=DB_NAME, help=f"database file (default: {DB_NAME})")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on; 0.0.0.0 for every station")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args(argv)
+
+    init_db(args.db)
+    database = Database(args.db)
+    announce = lambda port: print(f"Serving {args.db} on http://{args.host}:{port}", flush=True)
+    try:
+        asyncio.run(serve(database, args.host, args.port, on_ready=announce))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        database.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+# service.py - Entry operations without any UI
+
+# Everything the main window can do to entries, as plain functions on a
+# dal.Database or a remote.RemoteDatabase: the Tk callbacks, the command line
+# (cli.py) and the shared server (server.py) all call these.
+#
+# progress(done, total) callbacks may raise to abort; total is None when it
+# is not known up front. Importer and export pull in openpyxl and reportlab,
+# so they are only imported by the functions that need them.
+
+import os
+import time
+from datetime import date, datetime
+from itertools import islice
+from db import (APP_FOLDER, BULK_BATCH_SIZE, CHECKPOINT_ROWS, DB_NAME, BulkLoadStats, init_db, normalize_date,
+                normalize_qty)
+
+# Imports at least this large rebuild indexes once at the end instead of per row
+DEFER_INDEXES_ROWS = 50000
+# Rough size of one shift sheet, to guess the size of a folder import up front
+FOLDER_ROWS_PER_FILE = 5000
+# CSV files from about DEFER_INDEXES_ROWS rows up
+DEFER_INDEXES_CSV_BYTES = 4 * 1024 * 1024
+# Imports from about this many rows up are committed in checkpoints and
+# resumable. Their indexes are kept up row by row, which makes a whole
+# import about 1.6x slower than one deferred-index transaction, so smaller
+# files, quick to import again, stay all or nothing.
+RESUMABLE_ROWS = 250000
+RESUMABLE_CSV_BYTES = 16 * 1024 * 1024
+# Below this a PDF report is rendered faster than worker processes start
+PDF_PARALLEL_ROWS = 50000
+
+EXPORT_FORMATS = ("xlsx", "csv", "pdf")
+
+PRINT_OPTIONS = ("Yes", "No")
+
+def make_filters(article="", card="", print_opt="", start_date=None, end_date=None):
+    # The search panel's filters: substring article and card, exact print
+    # option ("" or "All" for any) and an inclusive date range. Dates that are
+    # not YYYY-MM-DD are dropped, as the search panel does for exports.
+    return {
+        "article": article or "",
+        "card": card or "",
+        "print_opt": print_opt if print_opt in PRINT_OPTIONS else "",
+        "start_date": normalize_date(start_date),
+        "end_date": normalize_date(end_date),
+    }
+
+def open_database(server=None, path=DB_NAME):
+    # The shared server at server (or the HYPE_SERVER environment variable,
+    # e.g. "http://10.0.0.5:8750") when one is set, otherwise the local file
+    server = server or os.getenv("HYPE_SERVER")
+    if server:
+        from remote import RemoteDatabase
+        return RemoteDatabase(server)
+    from dal import Database
+    init_db(path)
+    return Database(path)
+
+def validate_entry(article, card="", color="", size="", qty=None, component="",
+                   print_opt="Yes", entry_date=None):
+    # The entry tuple for INSERT_ENTRY / UPDATE_ENTRY, validated like the
+    # entry form; raises ValueError with the form's message
+    if not article:
+        raise ValueError("Article fields cannot be empty.")
+    normalized_qty = normalize_qty(qty)
+    if normalized_qty is None and str(qty or "").strip():
+        raise ValueError("Qty must be a whole number.")
+    if print_opt not in PRINT_OPTIONS:
+        raise ValueError("Print must be Yes or No.")
+    normalized_date = normalize_date(entry_date) if entry_date else str(date.today())
+    if normalized_date is None:
+        raise ValueError("Invalid date format for entry. Please use YYYY-MM-DD.")
+    return (article, card, color, size, normalized_qty, component, print_opt, normalized_date)
+
+def add_entry(database, article, card="", color="", size="", qty=None, component="",
+              print_opt="Yes", entry_date=None):
+    # Validates like the entry form and returns the new entry's id
+    return database.insert_entry(validate_entry(article, card, color, size, qty, component,
+                                                print_opt, entry_date))
+
+def search_entries(database, filters=None, limit=None):
+    # Yields matching entries in id order, streamed from a pooled reader
+    with database.reading() as reader:
+        rows = reader.iter_entries(filters)
+        yield from (islice(rows, limit) if limit is not None else rows)
+
+def entry_stats(database, group_by=None, filters=None):
+    # (number of matching entries, [(group, entries, qty)] or None)
+    with database.reading() as reader:
+        total = reader.count_entries(filters)
+        totals = reader.fetch_totals(group_by, filters) if group_by else None
+    return total, totals
+
+# --- Imports ---
+# Each returns (db.BulkLoadStats, importer.ImportErrors) and imports everything
+# in one transaction, so an aborted import leaves nothing behind. Single files
+# of RESUMABLE_ROWS and up are the exception (resumable, see
+# _checkpointed_import): they keep every committed chunk, and importing the
+# same file again, or resume_import_job, carries on after it. duplicates
+# is one of db.DUPLICATE_POLICIES for rows that repeat a stored entry's
+# natural key (a shift sheet imported twice), or None to import them anyway.
+# dry_run reads and checks every row the same way but writes nothing; the
+# stats then count the rows that would be imported.
+#
+# Every problem row is listed in a CSV under IMPORT_REPORTS_FOLDER (see
+# ImportErrors.report_path); the ImportErrors itself only keeps counts and
+# a sample.
+
+IMPORT_REPORTS_FOLDER = os.path.join(APP_FOLDER, "import_reports")
+
+def import_report_path(source):
+    name = os.path.basename(os.path.normpath(source)).split(".")[0] or "import"
+    return os.path.join(IMPORT_REPORTS_FOLDER, f"{name}-{datetime.now():%Y%m%d-%H%M%S}.csv")
+
+def check_rows(rows, progress=None):
+    # The dry run's stand-in for bulk_insert: converts every row, stores nothing
+    started = time.perf_counter()
+    checked = 0
+    for checked, _ in enumerate(rows, 1):
+        if progress and checked % BULK_BATCH_SIZE == 0:
+            progress(checked)
+    if progress:
+        progress(checked)
+    return BulkLoadStats(checked, time.perf_counter() - started)
+
+def import_xlsx(database, filepath, mapping=None, progress=None, duplicates=None, dry_run=False, resumable=None):
+    # mapping is the mapping window's field -> sheet header; by default every
+    # field takes the sheet column with the same header. resumable is decided
+    # by the sheet's size unless given.
+    from importer import ImportErrors, SheetReader, default_mapping
+
+    with ImportErrors(import_report_path(filepath)) as errors, SheetReader(filepath) as reader:
+        errors.source = os.path.basename(filepath)
+        if mapping is None:
+            mapping = default_mapping(reader.headers())
+        total_rows = reader.total_rows
+        if resumable is None:
+            resumable = total_rows >= RESUMABLE_ROWS
+        if resumable and not dry_run:
+            stats = _checkpointed_import(database, "xlsx", filepath, {"mapping": mapping, "duplicates": duplicates},
+                                         lambda start_row: reader.rows(mapping, errors, start_row=start_row),
+                                         progress, total_rows)
+            return stats, errors
+        report = (lambda inserted: progress(inserted, total_rows)) if progress else None
+        rows = (data for _, data in reader.rows(mapping, errors))
+        if dry_run:
+            stats = check_rows(rows, report)
+        else:
+            stats = database.bulk_insert(rows, defer_indexes=total_rows >= DEFER_INDEXES_ROWS, progress=report,
+                                         duplicates=duplicates)
+    return stats, errors
+
+def import_xlsx_files(database, filepaths, mapping, progress=None, duplicates=None, dry_run=False):
+    # Many workbooks parsed in parallel; progress counts files, not rows
+    from importer import ImportErrors, iter_workbook_rows
+
+    with ImportErrors(import_report_path(os.path.dirname(filepaths[0]))) as errors:
+        rows = iter_workbook_rows(filepaths, mapping, errors, progress=progress)
+        if dry_run:
+            stats = check_rows(rows)
+        else:
+            stats = database.bulk_insert(rows, defer_indexes=len(filepaths) * FOLDER_ROWS_PER_FILE >= DEFER_INDEXES_ROWS,
+                                         duplicates=duplicates)
+    return stats, errors
+
+def import_csv(database, filepath, progress=None, duplicates=None, dry_run=False, resumable=None):
+    from importer import CsvReader, ImportErrors
+
+    if resumable is None:
+        resumable = os.path.getsize(filepath) >= RESUMABLE_CSV_BYTES
+    report = (lambda inserted: progress(inserted, None)) if progress else None
+    with ImportErrors(import_report_path(filepath)) as errors, CsvReader(filepath) as reader:
+        errors.source = os.path.basename(filepath)
+        if resumable and not dry_run:
+            stats = _checkpointed_import(database, "csv", filepath, {"duplicates": duplicates},
+                                         lambda start_row: reader.rows(errors, start_row=start_row), progress, None)
+            return stats, errors
+        rows = (data for _, data in reader.rows(errors))
+        if dry_run:
+            stats = check_rows(rows, report)
+        else:
+            stats = database.bulk_insert(rows, defer_indexes=os.path.getsize(filepath) >= DEFER_INDEXES_CSV_BYTES,
+                                         progress=report, duplicates=duplicates)
+    return stats, errors
+
+def _checkpointed_import(database, kind, filepath, options, read_rows, progress, total_rows):
+    # Commits the rows of read_rows(start_row) CHECKPOINT_ROWS at a time, each
+    # chunk with the import job's last row, so an abort or a crash keeps what
+    # was committed. Resumes the file's unfinished job if there is one; the
+    # stats then count only this run's entries, resumed_after the rows skipped.
+    from importer import file_hash
+
+    started = time.perf_counter()
+    job_id, last_row, _ = database.start_import_job(file_hash(filepath), os.path.abspath(filepath), kind, options)
+    stats = BulkLoadStats(0, 0.0)
+    stats.resumed_after = last_row or None
+    rows = read_rows(last_row + 1 if last_row else None)
+    while True:
+        chunk = list(islice(rows, CHECKPOINT_ROWS))
+        if not chunk:
+            break
+        done = stats.rows
+        report = (lambda inserted: progress(done + inserted, total_rows and total_rows - last_row)) if progress else None
+        stats.add(database.bulk_insert((data for _, data in chunk), progress=report, duplicates=options["duplicates"],
+                                       checkpoint=(job_id, chunk[-1][0])))
+    database.finish_import_job(job_id)
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+def resume_import_job(database, job, progress=None):
+    # Finishes an import listed by database.unfinished_import_jobs(). A file
+    # that changed since cannot be resumed: its job is abandoned and
+    # ValueError raised. A missing one may only be on another station (the
+    # jobs are shared through the server), so that job is kept.
+    from importer import file_hash
+
+    job_id, job_hash, source, kind, options = job[:5]
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"{source} is not on this computer.")
+    if file_hash(source) != job_hash:
+        database.finish_import_job(job_id, "abandoned")
+        raise ValueError(f"{source} has changed since its import was interrupted.")
+    if kind == "xlsx":
+        return import_xlsx(database, source, options.get("mapping"), progress, options.get("duplicates"),
+                           resumable=True)
+    return import_csv(database, source, progress, options.get("duplicates"), resumable=True)
+
+# --- Exports ---
+
+def export_entries(database, filepath, export_format, filters=None, progress=None, watch=None):
+    # Writes the matching entries as "xlsx", "csv" (gzip for .gz paths) or
+    # "pdf" and returns how many were written. watch is passed on to
+    # database.reading(), e.g. to install a cancellation handler.
+    import export
+
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{export_format}'.")
+    with database.reading(watch) as reader:
+        total = reader.count_entries(filters)
+        report = (lambda written: progress(written, total)) if progress else None
+        rows = reader.iter_entries(filters)
+        if export_format == "xlsx":
+            return export.export_excel(filepath, rows, progress=report)
+        if export_format == "csv":
+            return export.export_csv(filepath, rows, progress=report)
+        # Large reports lay out page ranges in one process per core
+        workers = None if total >= PDF_PARALLEL_ROWS else 1
+        return export.export_pdf(filepath, rows, progress=report, workers=workers)
@@ -0,0 +1,150 @@
+# tasks.py - Background workers for database and file work
+
+# Slow work (searches, imports, exports) runs on a small thread pool so the Tk
+# mainloop keeps handling input. Tkinter must only be touched from the main
+# thread, so workers never call back into Tk directly: they post messages to a
+# queue that the main thread drains through root.after.
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+POLL_INTERVAL_MS = 50
+PROGRESS_HANDLER_STEPS = 10000
+
+class TaskCancelled(Exception):
+    pass
+
+class Task:
+    def __init__(self, runner, name):
+        self.runner = runner
+        self.name = name
+        self._cancel_event = threading.Event()
+        self.done = False
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def check(self):
+        # Call regularly from long loops; unwinds the worker once cancelled
+        if self.cancelled:
+            raise TaskCancelled()
+
+    def progress(self, done, total=None, message=""):
+        self.runner._post(self, "progress", (done, total, message))
+
+    def partial(self, result):
+        # Hands an early part of the result to on_partial, e.g. the first page
+        # of a search whose row count is still being worked out
+        self.runner._post(self, "partial", result)
+
+    def watch(self, conn):
+        # Abort a running SQLite statement as soon as the task is cancelled
+        conn.set_progress_handler(lambda: 1 if self.cancelled else 0, PROGRESS_HANDLER_STEPS)
+
+class TaskRunner:
+    def __init__(self, root, max_workers=4, on_status=None):
+        self.root = root
+        self.on_status = on_status
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hype-worker")
+        self.messages = queue.Queue()
+        self.callbacks = {}
+        self.active = []
+        self.root.after(POLL_INTERVAL_MS, self._poll)
+
+    def submit(self, name, fn, *args, on_done=None, on_error=None, on_progress=None, on_cancel=None,
+               on_partial=None):
+        # fn(task, *args) runs on a worker thread; the on_* callbacks run on the Tk thread
+        task = Task(self, name)
+        self.callbacks[task] = (on_done, on_error, on_progress, on_cancel, on_partial)
+        self.active.append(task)
+        self._notify_status(task, 0, None, "")
+        self.executor.submit(self._run, task, fn, args)
+        return task
+
+    def cancel_all(self):
+        for task in self.active:
+            task.cancel()
+
+    def shutdown(self):
+        self.cancel_all()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, task, fn, args):
+        try:
+            result = fn(task, *args)
+        except TaskCancelled:
+            self._post(task, "cancelled", None)
+        except Exception as e:
+            if task.cancelled:
+                self._post(task, "cancelled", None)
+            else:
+                self._post(task, "error", e)
+        else:
+            if task.cancelled:
+                self._post(task, "cancelled", None)
+            else:
+                self._post(task, "done", result)
+
+    def _post(self, task, kind, payload):
+        self.messages.put((task, kind, payload))
+
+    def _poll(self):
+        # Rescheduled whatever a callback raises: a dead poll loop would drop
+        # every later task's result
+        try:
+            while True:
+                try:
+                    task, kind, payload = self.messages.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    self._dispatch(task, kind, payload)
+                except Exception as e:
+                    self._report(e)
+        finally:
+            self.root.after(POLL_INTERVAL_MS, self._poll)
+
+    def _report(self, error):
+        # Tk's handler for exceptions in callbacks; prints the traceback
+        # unless the application replaces it
+        self.root.report_callback_exception(type(error), error, error.__traceback__)
+
+    def _dispatch(self, task, kind, payload):
+        on_done, on_error, on_progress, on_cancel, on_partial = self.callbacks.get(task, (None,) * 5)
+        if kind == "partial":
+            # Nothing of a superseded task reaches the screen
+            if not task.done and not task.cancelled and on_partial:
+                on_partial(payload)
+            return
+        if kind == "progress":
+            if task.done:
+                return
+            done, total, message = payload
+            self._notify_status(task, done, total, message)
+            if on_progress:
+                on_progress(done, total, message)
+            return
+
+        task.done = True
+        self.callbacks.pop(task, None)
+        if task in self.active:
+            self.active.remove(task)
+        self._notify_status(self.active[-1] if self.active else None, 0, None, "")
+        if kind == "done" and on_done:
+            on_done(payload)
+        elif kind == "error":
+            if on_error:
+                on_error(payload)
+            else:
+                self._report(payload)
+        elif kind == "cancelled" and on_cancel:
+            on_cancel()
+
+    def _notify_status(self, task, done, total, message):
+        if self.on_status:
+            self.on_status(task, done, total, message)
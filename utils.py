@@ -2,8 +2,8 @@ import os
 import json
 import hashlib
 
-# ✅ Persistent location on Windows:
-APP_FOLDER = os.path.join(os.getenv("LOCALAPPDATA"), "HypeProduction")
+# ✅ Persistent location on Windows (home folder elsewhere):
+APP_FOLDER = os.path.join(os.getenv("LOCALAPPDATA") or os.path.expanduser("~"), "HypeProduction")
 os.makedirs(APP_FOLDER, exist_ok=True)
 
 CONFIG_FILE = os.path.join(APP_FOLDER, "config.json")
@@ -42,4 +42,24 @@ def set_password(new_password):
     save_config(config)
 
 def verify_password(entered_password):
-    return hash_password(entered_password) == get_password()
\ No newline at end of file
+    return hash_password(entered_password) == get_password()
+
+def get_import_mapping():
+    config = load_config()
+    return config.get("import_mapping")
+
+def set_import_mapping(mapping):
+    config = load_config()
+    config["import_mapping"] = mapping
+    save_config(config)
+
+def get_import_duplicates():
+    # db.DUPLICATE_POLICIES entry chosen in the import window, None to import
+    # repeated rows anyway, as the command line does until told otherwise
+    config = load_config()
+    return config.get("import_duplicates")
+
+def set_import_duplicates(policy):
+    config = load_config()
+    config["import_duplicates"] = policy
+    save_config(config)
@@ -2,14 +2,40 @@
 
 from tkinter import *
 from tkinter import messagebox
-from PIL import Image, ImageTk
 import os
-from utils import get_password, set_password, verify_password
-from db import init_db
-from main_ui import show_main_ui
+from utils import APP_FOLDER, get_password, set_password, verify_password
 
 APP_NAME = "Hype Production Management"
 
+# The login screen only needs Tk. PIL, the database layer and the dashboard
+# (with openpyxl/reportlab behind it) are imported once they are needed.
+
+LOGO_PATH = "logo.png"
+LOGO_SIZE = (220, 90)
+LOGO_CACHE = os.path.join(APP_FOLDER, f"logo_{LOGO_SIZE[0]}x{LOGO_SIZE[1]}.png")
+
+def load_logo():
+    # Decoding and resizing logo.png needs PIL, so the resized copy is cached
+    # and later starts read it with Tk's own PNG support instead.
+    if not os.path.exists(LOGO_PATH):
+        return None
+    try:
+        if not os.path.exists(LOGO_CACHE) or os.path.getmtime(LOGO_CACHE) < os.path.getmtime(LOGO_PATH):
+            from PIL import Image
+            with Image.open(LOGO_PATH) as img:
+                img.resize(LOGO_SIZE).save(LOGO_CACHE + ".tmp", format="PNG")
+            os.replace(LOGO_CACHE + ".tmp", LOGO_CACHE)
+        return PhotoImage(file=LOGO_CACHE)
+    except (OSError, TclError):
+        # No writable cache folder or a Tk without PNG support
+        from PIL import Image, ImageTk
+        return ImageTk.PhotoImage(Image.open(LOGO_PATH).resize(LOGO_SIZE))
+
+def open_dashboard():
+    # main_ui migrates the local database itself, or connects to HYPE_SERVER
+    from main_ui import show_main_ui
+    show_main_ui()
+
 def show_welcome():
     root = Tk()
     root.title(APP_NAME)
@@ -23,11 +49,8 @@ def show_welcome():
     button_font = ("Helvetica", 11, "bold")
 
     # --- Logo (top) ---
-    logo_path = "logo.png"
-    if os.path.exists(logo_path):
-        img = Image.open(logo_path)
-        img = img.resize((220, 90))
-        logo = ImageTk.PhotoImage(img)
+    logo = load_logo()
+    if logo is not None:
         logo_label = Label(root, image=logo, bg="#f0faff")
         logo_label.image = logo
         logo_label.pack(pady=15)
@@ -53,8 +76,7 @@ def show_welcome():
             set_password(new_pw)
             messagebox.showinfo("Success", "Password set successfully!")
             root.destroy()
-            init_db()
-            show_main_ui()
+            open_dashboard()
 
         Button(container, text="Set Password & Continue", command=save_password,
                bg="#00bfa5", fg="white", font=button_font, bd=0, padx=10, pady=5).pack(pady=15)
@@ -69,8 +91,7 @@ def show_welcome():
         def verify():
             if verify_password(password_entry.get()):
                 root.destroy()
-                init_db()
-                show_main_ui()
+                open_dashboard()
             else:
                 messagebox.showerror("Error", "Incorrect password")
 